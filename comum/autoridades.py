@@ -0,0 +1,94 @@
+import json
+import math
+import re
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator
+
+from comum.palavras_chave import canonizar
+from comum.whitelist import WhitelistDominios
+
+# -------------------------------
+# Índice offline de links de autoridade por nicho
+# -------------------------------
+# Fontes curadas em comum/dados_autoridades/<nicho>.json:
+#   [{"titulo": "...", "url": "...", "anchor_sugerida": "...", "palavras": ["...", ...]}]
+# O índice invertido (termo -> fontes) responde em microssegundos; a SERP só é
+# consultada quando o índice não tem candidatos suficientes para a palavra-chave.
+# Cada crew confere, ao compilar a whitelist, que todas as fontes do seu nicho
+# passam nela (`verificar_whitelist`): uma fonte recusada seria descartada em
+# silêncio e o "hit offline" viraria consulta à SERP.
+DIR_AUTORIDADES = Path(__file__).resolve().parent / "dados_autoridades"
+
+NICHOS = ("medico", "veterinario", "agro", "marketing")
+
+# Termos que aparecem em quase toda palavra-chave e não ajudam a escolher fonte
+_PALAVRAS_VAZIAS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela para pra com sem
+e ou que qual quais quando onde como porque sobre entre ate apos sua seu suas seus
+ser ter ha mais menos muito muita
+tratamento tratamentos tratar cuidado cuidados dica dicas guia completo melhor melhores
+causa causas sintoma sintomas saiba tudo importancia beneficio beneficios
+""".split())
+
+
+def _termos(texto: str) -> list[str]:
+    texto = canonizar(texto, dobrar_acentos=True, ordenar=False)
+    termos = []
+    for t in re.findall(r"[a-z0-9]+", texto):
+        if len(t) < 2 or t in _PALAVRAS_VAZIAS:
+            continue
+        # Radical leve: plural simples ("unhas" ~ "unha", "ossos" ~ "osso")
+        if len(t) > 4 and t.endswith("s"):
+            t = t[:-1]
+        termos.append(t)
+    return termos
+
+
+class IndiceAutoridades:
+    def __init__(self, fontes: list[dict]):
+        self.fontes = fontes
+        self._invertido: dict[str, set[int]] = defaultdict(set)
+        for i, fonte in enumerate(fontes):
+            for termo in _termos(" ".join([fonte.get("titulo", "")] + fonte.get("palavras", []))):
+                self._invertido[termo].add(i)
+        n = max(1, len(fontes))
+        self._idf = {t: math.log(1 + n / len(ids)) for t, ids in self._invertido.items()}
+
+    def buscar(self, palavra_chave: str, limite: int = 5) -> list[dict]:
+        """Fontes do nicho mais relevantes para a palavra-chave (soma de IDF dos termos em comum)."""
+        pontos: dict[int, float] = defaultdict(float)
+        for termo in set(_termos(palavra_chave)):
+            for i in self._invertido.get(termo, ()):
+                pontos[i] += self._idf[termo]
+        melhores = sorted(pontos, key=lambda i: (-pontos[i], i))[:limite]
+        return [self.fontes[i] for i in melhores]
+
+
+@lru_cache(maxsize=None)
+def carregar_indice(nicho: str) -> IndiceAutoridades:
+    try:
+        with open(DIR_AUTORIDADES / f"{nicho}.json", encoding="utf-8") as f:
+            fontes = json.load(f)
+    except FileNotFoundError:
+        fontes = []
+    return IndiceAutoridades(fontes)
+
+
+def iterar_autoridades(nicho: str, palavra_chave: str, limite: int = 5) -> Iterator[dict]:
+    """Candidatos do índice no mesmo formato dos resultados orgânicos da SERP."""
+    for fonte in carregar_indice(nicho).buscar(palavra_chave, limite=limite):
+        yield {
+            "title": fonte["titulo"],
+            "link": fonte["url"],
+            "anchor_sugerida": fonte.get("anchor_sugerida", ""),
+            "origem": "indice_autoridades",
+        }
+
+
+def verificar_whitelist(nicho: str, whitelist: WhitelistDominios) -> None:
+    """ValueError se alguma fonte do índice do nicho estiver fora da whitelist da crew."""
+    fora = [f["url"] for f in carregar_indice(nicho).fontes if not whitelist.permite(f["url"])]
+    if fora:
+        raise ValueError(f"fontes do índice '{nicho}' fora da whitelist da crew: {', '.join(fora)}")
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from comum.config import DIR_DADOS, env_int
+from comum.palavras_chave import canonizar
+
+# -------------------------------
+# Backlog de palavras-chave por cliente (pautas já conhecidas)
+# -------------------------------
+# Formato em disco: {"dra_karen": [{"palavra_chave": "...", "tema": "...",
+#   "data_prevista": "AAAA-MM-DD", "adicionado_em": "...", "aquecido_em": "...",
+#   "gerado_em": "..."}]}
+# Uma pauta sai da fila de aquecimento quando o artigo é gerado (gerado_em), quando a
+# data prevista já passou ou, sem data prevista, depois de BACKLOG_MAX_IDADE_DIAS.
+ARQ_BACKLOG = DIR_DADOS / "backlog.json"
+BACKLOG_MAX_IDADE_DIAS = env_int("BACKLOG_MAX_IDADE_DIAS", 30)
+
+_lock = threading.Lock()
+
+
+def _carregar() -> dict[str, list[dict]]:
+    try:
+        with open(ARQ_BACKLOG, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _salvar(dados: dict[str, list[dict]]) -> None:
+    ARQ_BACKLOG.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ARQ_BACKLOG.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, ARQ_BACKLOG)
+
+
+def adicionar(cliente: str, itens: list[dict]) -> list[dict]:
+    """Acrescenta pautas ao backlog do cliente (palavra-chave repetida é ignorada)."""
+    agora = datetime.now().isoformat(timespec="seconds")
+    with _lock:
+        dados = _carregar()
+        fila = dados.setdefault(cliente, [])
+        existentes = {canonizar(it["palavra_chave"]) for it in fila}
+        for item in itens:
+            palavra_chave = (item.get("palavra_chave") or "").strip()
+            if not palavra_chave or canonizar(palavra_chave) in existentes:
+                continue
+            fila.append({
+                "palavra_chave": palavra_chave,
+                "tema": item.get("tema", ""),
+                "data_prevista": item.get("data_prevista", ""),
+                "adicionado_em": agora,
+                "aquecido_em": None,
+                "gerado_em": None,
+            })
+            existentes.add(canonizar(palavra_chave))
+        _salvar(dados)
+        return list(fila)
+
+
+def remover(cliente: str, palavra_chave: str) -> bool:
+    with _lock:
+        dados = _carregar()
+        fila = dados.get(cliente, [])
+        alvo = canonizar(palavra_chave)
+        restante = [it for it in fila if canonizar(it["palavra_chave"]) != alvo]
+        if len(restante) == len(fila):
+            return False
+        dados[cliente] = restante
+        _salvar(dados)
+        return True
+
+
+def listar(cliente: str | None = None) -> dict[str, list[dict]]:
+    dados = _carregar()
+    return {cliente: dados.get(cliente, [])} if cliente else dados
+
+
+def _vigente(item: dict, hoje: date) -> bool:
+    if item.get("gerado_em"):
+        return False
+    if item.get("data_prevista"):
+        return str(item["data_prevista"])[:10] >= hoje.isoformat()
+    limite = datetime.combine(hoje, datetime.min.time()) - timedelta(days=BACKLOG_MAX_IDADE_DIAS)
+    return str(item.get("adicionado_em", "")) >= limite.isoformat(timespec="seconds")
+
+
+def pendentes() -> list[tuple[str, dict]]:
+    """(cliente, pauta) ainda não geradas e dentro do prazo – as que vale a pena aquecer."""
+    hoje = date.today()
+    return [(cliente, item) for cliente, fila in _carregar().items() for item in fila if _vigente(item, hoje)]
+
+
+def marcar_gerado(cliente: str, palavra_chave: str) -> None:
+    """Artigo da pauta gerado: ela deixa de ser aquecida (continua listada no backlog)."""
+    with _lock:
+        dados = _carregar()
+        alvo = canonizar(palavra_chave)
+        itens = [it for it in dados.get(cliente, []) if canonizar(it["palavra_chave"]) == alvo and not it.get("gerado_em")]
+        if not itens:
+            return
+        for item in itens:
+            item["gerado_em"] = datetime.now().isoformat(timespec="seconds")
+        _salvar(dados)
+
+
+def marcar_aquecido(cliente: str, palavra_chave: str) -> None:
+    with _lock:
+        dados = _carregar()
+        alvo = canonizar(palavra_chave)
+        for item in dados.get(cliente, []):
+            if canonizar(item["palavra_chave"]) == alvo:
+                item["aquecido_em"] = datetime.now().isoformat(timespec="seconds")
+        _salvar(dados)
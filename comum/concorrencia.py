@@ -0,0 +1,215 @@
+import os
+import re
+import time
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable
+
+import openai
+
+from comum.config import env_float, env_int
+from comum.contexto import execucao_atual
+
+# -------------------------------
+# Controle adaptativo de concorrência das chamadas ao LLM (AIMD)
+# -------------------------------
+# Todas as chamadas à API passam por uma porta com N vagas. N cresce aditivamente a
+# cada sucesso (+LLM_AIMD_INCREMENTO por "rodada" de N chamadas) e cai
+# multiplicativamente (×LLM_AIMD_FATOR) num 429 – uma vez por rajada
+# (LLM_AIMD_JANELA_S). O 429 também pausa a porta inteira pelo retry-after/reset
+# informado, e a chamada volta para a fila: as crews não re-tentam cada uma por
+# conta própria (o cliente OpenAI roda com max_retries=0), então não há tempestade
+# de retentativas sincronizadas. Os headers x-ratelimit-remaining-* seguram o
+# crescimento perto do limite da conta.
+# Fila justa: rodízio entre clientes (uma vaga por cliente da vez), FIFO dentro de cada um.
+LLM_CONCORRENCIA_ATIVA = os.getenv("LLM_CONCORRENCIA_ATIVA", "1") not in ("0", "false", "False", "")
+LLM_CONCORRENCIA_INICIAL = env_int("LLM_CONCORRENCIA_INICIAL", 8)
+LLM_CONCORRENCIA_MIN = env_int("LLM_CONCORRENCIA_MIN", 1)
+LLM_CONCORRENCIA_MAX = env_int("LLM_CONCORRENCIA_MAX", 64)
+LLM_AIMD_INCREMENTO = env_float("LLM_AIMD_INCREMENTO", 1.0)
+LLM_AIMD_FATOR = env_float("LLM_AIMD_FATOR", 0.5)
+LLM_AIMD_JANELA_S = env_float("LLM_AIMD_JANELA_S", 2.0)
+# Fração restante (requisições ou tokens) abaixo da qual a concorrência para de crescer
+LLM_AIMD_FOLGA = env_float("LLM_AIMD_FOLGA", 0.05)
+LLM_429_PAUSA_S = env_float("LLM_429_PAUSA_S", 1.0)  # quando a resposta não diz quanto esperar
+LLM_429_MAX_TENTATIVAS = env_int("LLM_429_MAX_TENTATIVAS", 6)
+# Retentativas de falhas transitórias (conexão, timeout, 408/409, 5xx), antes feitas pelo cliente OpenAI
+LLM_MAX_RETRIES = env_int("LLM_MAX_RETRIES", 2)
+
+# Além de 429/5xx/conexão, o SDK repete 408 (timeout) e 409 (conflito); com a porta
+# ativa o cliente vem com max_retries=0, então a porta repete esses também
+_STATUS_REPETIVEIS = (408, 409)
+
+_DURACAO = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIDADES = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _segundos(valor: str | None) -> float | None:
+    """'20ms', '1s', '6m0s', '1h2m3.5s' -> segundos."""
+    if not valor:
+        return None
+    partes = _DURACAO.findall(valor)
+    if not partes:
+        try:
+            return float(valor)
+        except ValueError:
+            return None
+    return sum(float(n) * _UNIDADES[u] for n, u in partes)
+
+
+def _espera_429(headers) -> float:
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    for nome in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        segundos = _segundos(headers.get(nome))
+        if segundos:
+            return segundos
+    return LLM_429_PAUSA_S
+
+
+def _folga(headers) -> tuple[float | None, float]:
+    """(menor fração restante entre requisições e tokens, segundos até o reset correspondente)."""
+    menor, reset = None, 0.0
+    for tipo in ("requests", "tokens"):
+        try:
+            limite = float(headers[f"x-ratelimit-limit-{tipo}"])
+            restante = float(headers[f"x-ratelimit-remaining-{tipo}"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if limite > 0 and (menor is None or restante / limite < menor):
+            menor = restante / limite
+            reset = _segundos(headers.get(f"x-ratelimit-reset-{tipo}")) or 0.0
+    return menor, reset
+
+
+class ControleConcorrencia:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.limite = float(LLM_CONCORRENCIA_INICIAL)
+        self._em_voo = 0
+        self._filas: dict[str, deque] = {}
+        self._rodizio: deque[str] = deque()  # clientes com chamada esperando, na ordem de atendimento
+        self._pausa_ate = 0.0
+        self._ultima_reducao = 0.0
+        self.stats = {"chamadas": 0, "erros_429": 0, "reducoes": 0, "retentativas": 0,
+                      "espera_total_s": 0.0, "folga": None}
+
+    def _vez_de(self, ticket) -> bool:
+        return (
+            self._filas[self._rodizio[0]][0] is ticket
+            and self._em_voo < max(int(self.limite), LLM_CONCORRENCIA_MIN)
+            and time.time() >= self._pausa_ate
+        )
+
+    @contextmanager
+    def vaga(self):
+        cliente = execucao_atual().cliente
+        ticket = object()
+        inicio = time.time()
+        with self._cond:
+            if cliente not in self._filas:
+                self._filas[cliente] = deque()
+                self._rodizio.append(cliente)
+            self._filas[cliente].append(ticket)
+            while not self._vez_de(ticket):
+                pausa = self._pausa_ate - time.time()
+                self._cond.wait(timeout=pausa if pausa > 0 else None)
+            fila = self._filas[cliente]
+            fila.popleft()
+            self._rodizio.popleft()
+            if fila:
+                self._rodizio.append(cliente)  # cliente volta para o fim do rodízio
+            else:
+                del self._filas[cliente]
+            self._em_voo += 1
+            self.stats["espera_total_s"] += time.time() - inicio
+            self._cond.notify_all()  # a próxima da fila pode caber também
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._em_voo -= 1
+                self._cond.notify_all()
+
+    def _sucesso(self, headers) -> None:
+        folga, reset = _folga(headers)
+        with self._cond:
+            self.stats["chamadas"] += 1
+            self.stats["folga"] = None if folga is None else round(folga, 3)
+            if folga is not None and folga <= LLM_AIMD_FOLGA:
+                if folga <= 0 and reset:
+                    self._pausa_ate = max(self._pausa_ate, time.time() + reset)
+            else:
+                self.limite = min(float(LLM_CONCORRENCIA_MAX), self.limite + LLM_AIMD_INCREMENTO / self.limite)
+            self._cond.notify_all()
+
+    def _sobrecarga(self, headers) -> None:
+        """429: pausa a porta e reduz o limite. Chamado ainda com a vaga ocupada, para que
+        nenhuma chamada da fila entre na brecha entre a liberação da vaga e a pausa."""
+        agora = time.time()
+        with self._cond:
+            self.stats["erros_429"] += 1
+            self._pausa_ate = max(self._pausa_ate, agora + _espera_429(headers))
+            if agora - self._ultima_reducao >= LLM_AIMD_JANELA_S:  # vários 429 da mesma rajada contam uma vez
+                self.limite = max(float(LLM_CONCORRENCIA_MIN), self.limite * LLM_AIMD_FATOR)
+                self._ultima_reducao = agora
+                self.stats["reducoes"] += 1
+            self._cond.notify_all()  # quem espera recalcula o prazo com a pausa nova
+
+    def executar(self, criar: Callable[[], Any], consumir: Callable[[Any], Any] | None = None):
+        """
+        Roda `criar()` (uma chamada `with_raw_response` do cliente OpenAI) dentro de uma
+        vaga e devolve a resposta já interpretada – ou `consumir(resposta)`, ainda com a
+        vaga ocupada (streams: a geração continua depois dos headers).
+        """
+        if not LLM_CONCORRENCIA_ATIVA:
+            resposta = criar().parse()
+            return consumir(resposta) if consumir else resposta
+        tentativas_429 = tentativas_falha = 0
+        while True:
+            with self.vaga():
+                try:
+                    bruta = criar()
+                except openai.RateLimitError as exc:
+                    if exc.code == "insufficient_quota":
+                        raise  # sem crédito na conta: esperar não resolve
+                    self._sobrecarga(exc.response.headers)
+                    falha = exc
+                except (openai.APIConnectionError, openai.InternalServerError) as exc:
+                    falha = exc
+                except openai.APIStatusError as exc:
+                    if exc.status_code not in _STATUS_REPETIVEIS:
+                        raise
+                    falha = exc
+                else:
+                    self._sucesso(bruta.headers)
+                    resposta = bruta.parse()
+                    return consumir(resposta) if consumir else resposta
+            # fora da vaga; só a abertura da chamada é repetida (um stream já iniciado não)
+            if isinstance(falha, openai.RateLimitError):
+                tentativas_429 += 1
+                if tentativas_429 > LLM_429_MAX_TENTATIVAS:
+                    raise falha
+            else:
+                tentativas_falha += 1
+                if tentativas_falha > LLM_MAX_RETRIES:
+                    raise falha
+                time.sleep(min(8.0, 0.5 * 2 ** tentativas_falha) * random.uniform(0.75, 1.25))
+            with self._cond:
+                self.stats["retentativas"] += 1
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            return {
+                "ativo": LLM_CONCORRENCIA_ATIVA,
+                "limite": round(self.limite, 2),
+                "em_voo": self._em_voo,
+                "fila_por_cliente": {c: len(f) for c, f in self._filas.items()},
+                "pausado_por_s": round(max(self._pausa_ate - time.time(), 0.0), 2),
+                **{k: round(v, 2) if isinstance(v, float) else v for k, v in self.stats.items()},
+            }
+
+
+controle = ControleConcorrencia()
@@ -0,0 +1,40 @@
+import os
+import json
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# -------------------------------
+# Diretórios compartilhados pelas crews (cache, registros de uso etc.)
+# -------------------------------
+RAIZ_PROJETO = Path(__file__).resolve().parent.parent
+DIR_DADOS = Path(os.getenv("INVICTUS_DADOS_DIR") or RAIZ_PROJETO / ".dados")
+
+# Modelo usado quando nada mais específico é configurado (mesmo padrão do ChatOpenAI)
+MODELO_PADRAO = os.getenv("OPENAI_MODEL_NAME") or "gpt-3.5-turbo"
+
+
+def env_int(nome: str, padrao: int) -> int:
+    try:
+        return int(os.getenv(nome, "") or padrao)
+    except ValueError:
+        return padrao
+
+
+def env_float(nome: str, padrao: float) -> float:
+    try:
+        return float(os.getenv(nome, "") or padrao)
+    except ValueError:
+        return padrao
+
+
+def env_json(nome: str, padrao):
+    """Lê uma variável de ambiente com JSON; valor ausente ou inválido devolve o padrão."""
+    bruto = os.getenv(nome, "").strip()
+    if not bruto:
+        return padrao
+    try:
+        return json.loads(bruto)
+    except ValueError:
+        return padrao
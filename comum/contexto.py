@@ -0,0 +1,41 @@
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+# -------------------------------
+# Contexto da execução corrente (cliente/rota que disparou a crew)
+# -------------------------------
+SUFIXO_BACKLINK = "_backlink"
+
+
+@dataclass(frozen=True)
+class Execucao:
+    cliente: str
+    rota: str
+    # Identifica a execução (requisição) nos registros; `tokens` acumula o consumo
+    # de LLM dela (usado pelo orçamento por execução em comum.orcamento_tokens);
+    # `consumo` junta LLM por tarefa e SerpAPI para o livro de custos (comum.custos)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12], compare=False)
+    tokens: dict = field(default_factory=lambda: {"prompt": 0, "saida": 0}, compare=False)
+    consumo: dict = field(default_factory=dict, compare=False)
+
+
+_execucao: ContextVar[Execucao | None] = ContextVar("execucao", default=None)
+
+
+def definir_execucao(rota: str, cliente: str | None = None) -> Execucao:
+    """Registra a rota atual; sem cliente explícito, é a rota sem o sufixo '_backlink'."""
+    rota = rota.strip("/")
+    if cliente is None:
+        cliente = rota[: -len(SUFIXO_BACKLINK)] if rota.endswith(SUFIXO_BACKLINK) else rota
+    execucao = Execucao(cliente=cliente, rota=rota)
+    _execucao.set(execucao)
+    return execucao
+
+
+def execucao_atual(cliente_padrao: str = "") -> Execucao:
+    """Execução corrente; fora de uma requisição HTTP usa o cliente informado pela crew."""
+    execucao = _execucao.get()
+    if execucao is not None:
+        return execucao
+    return Execucao(cliente=cliente_padrao, rota=cliente_padrao)
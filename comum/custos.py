@@ -0,0 +1,214 @@
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from comum import backlog
+from comum.config import DIR_DADOS, env_float
+from comum.contexto import execucao_atual
+
+# -------------------------------
+# Livro de custos por execução (cliente, rota, tarefa, dia)
+# -------------------------------
+# Uma linha por execução de crew (endpoint, stream ou lote), só acrescentada:
+# tempo total e de pesquisa, chamadas SerpAPI, e por tarefa o tempo de parede
+# (Task.execution_duration) com tokens/custo das chamadas ao LLM – acumulados na
+# execução corrente por comum.llm_uso e comum.serp_uso. Guarda também o
+# token_usage da CrewOutput, que antes só ia para a resposta.
+ARQ_CUSTOS = DIR_DADOS / "custos_execucoes.jsonl"
+# Preço de uma busca paga na SerpAPI (depende do plano; 0 = não entra no custo)
+SERPAPI_CUSTO_BUSCA_USD = env_float("SERPAPI_CUSTO_BUSCA_USD", 0.0)
+
+CAMPOS_LLM = ("chamadas", "prompt_tokens", "completion_tokens", "cached_tokens", "custo_usd")
+
+_lock = threading.Lock()
+
+
+def acumular_llm(tarefa: str, **valores) -> None:
+    """Soma uma chamada ao LLM no consumo da execução corrente (chamado por comum.llm_uso)."""
+    consumo = execucao_atual().consumo
+    with _lock:
+        alvo = consumo.setdefault("llm", {}).setdefault(tarefa or "(sem)", dict.fromkeys(CAMPOS_LLM, 0))
+        alvo["chamadas"] += 1
+        for campo, valor in valores.items():
+            alvo[campo] += valor or 0
+
+
+def acumular_serp(cache: str) -> None:
+    """Soma uma consulta SerpAPI ('hit', 'miss', 'bloqueado' ou 'erro') na execução corrente."""
+    consumo = execucao_atual().consumo
+    with _lock:
+        serp = consumo.setdefault("serpapi", {"hit": 0, "miss": 0, "bloqueado": 0, "erro": 0})
+        serp[cache] = serp.get(cache, 0) + 1
+
+
+class Medicao:
+    def __init__(self, tema: str, palavra_chave: str):
+        self.tema = tema
+        self.palavra_chave = palavra_chave
+        self.inicio = time.time()
+        self.fim_pesquisa: float | None = None
+        self.crew = None
+        self.resultado = None
+
+    def montada(self, crew) -> None:
+        """Crew pronta: o que passou até aqui foi pesquisa (SERP, páginas, links)."""
+        self.crew = crew
+        self.fim_pesquisa = time.time()
+
+
+def _tarefas(crew, consumo_llm: dict) -> dict[str, dict]:
+    tarefas: dict[str, dict] = {}
+    for indice, task in enumerate(getattr(crew, "tasks", None) or []):
+        nome = getattr(getattr(getattr(task, "agent", None), "llm", None), "tarefa", "") or f"tarefa_{indice + 1}"
+        duracao = getattr(task, "execution_duration", None)
+        tarefas[nome] = {"duracao_s": round(duracao, 2) if duracao else None,
+                         **dict.fromkeys(CAMPOS_LLM, 0)}
+    for nome, valores in consumo_llm.items():
+        # chamadas fora das tarefas da crew (ex.: conversão de saída estruturada) entram pelo rótulo do LLM
+        alvo = tarefas.setdefault(nome, {"duracao_s": None, **dict.fromkeys(CAMPOS_LLM, 0)})
+        for campo in CAMPOS_LLM:
+            alvo[campo] += valores.get(campo, 0)
+    for valores in tarefas.values():
+        valores["custo_usd"] = round(valores["custo_usd"], 6)
+    return tarefas
+
+
+def _registrar(medicao: Medicao, erro: BaseException | None) -> None:
+    execucao = execucao_atual()
+    fim = time.time()
+    tarefas = _tarefas(medicao.crew, execucao.consumo.get("llm", {}))
+    serp = execucao.consumo.get("serpapi", {})
+    custo_llm = sum(t["custo_usd"] for t in tarefas.values())
+    custo_serp = serp.get("miss", 0) * SERPAPI_CUSTO_BUSCA_USD
+    uso_crew = getattr(medicao.resultado, "token_usage", None)
+    reg = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "execucao": execucao.id,
+        "cliente": execucao.cliente,
+        "rota": execucao.rota,
+        "tema": medicao.tema,
+        "palavra_chave": medicao.palavra_chave,
+        "status": "erro" if erro else "ok",
+        "erro": f"{type(erro).__name__}: {erro}" if erro else None,
+        "duracao_s": round(fim - medicao.inicio, 2),
+        "duracao_pesquisa_s": round(medicao.fim_pesquisa - medicao.inicio, 2) if medicao.fim_pesquisa else None,
+        "serpapi": {"pagas": serp.get("miss", 0), "cache": serp.get("hit", 0), "bloqueadas": serp.get("bloqueado", 0),
+                    "erros": serp.get("erro", 0)},
+        "tarefas": tarefas,
+        "prompt_tokens": sum(t["prompt_tokens"] for t in tarefas.values()),
+        "completion_tokens": sum(t["completion_tokens"] for t in tarefas.values()),
+        "cached_tokens": sum(t["cached_tokens"] for t in tarefas.values()),
+        "custo_llm_usd": round(custo_llm, 6),
+        "custo_serpapi_usd": round(custo_serp, 6),
+        "custo_usd": round(custo_llm + custo_serp, 6),
+        "token_usage_crew": uso_crew.model_dump() if hasattr(uso_crew, "model_dump") else None,
+    }
+    with _lock:
+        ARQ_CUSTOS.parent.mkdir(parents=True, exist_ok=True)
+        with open(ARQ_CUSTOS, "a", encoding="utf-8") as f:
+            f.write(json.dumps(reg, ensure_ascii=False) + "\n")
+
+
+@contextmanager
+def medir(tema: str, palavra_chave: str):
+    """
+    Envolve montagem + kickoff de uma crew e grava a linha no livro ao sair (também em erro):
+        with medir(tema, palavra_chave) as medicao:
+            medicao.montada(crew := build_crew(tema, palavra_chave))
+            medicao.resultado = crew.kickoff()
+    """
+    medicao = Medicao(tema, palavra_chave)
+    with _lock:  # uma crew por execução: descarta consumo de uma medição anterior no mesmo contexto
+        execucao_atual().consumo.clear()
+    try:
+        yield medicao
+    except BaseException as exc:
+        _registrar(medicao, exc)
+        raise
+    _registrar(medicao, None)
+    # pauta do backlog atendida: o prefetch para de aquecer a pesquisa dela
+    backlog.marcar_gerado(execucao_atual().cliente, palavra_chave)
+
+
+def _ler_registros():
+    try:
+        with open(ARQ_CUSTOS, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    yield json.loads(linha)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def _novo_resumo() -> dict:
+    return {"execucoes": 0, "erros": 0, "duracao_total_s": 0.0, "serpapi_pagas": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+            "custo_llm_usd": 0.0, "custo_serpapi_usd": 0.0, "custo_usd": 0.0}
+
+
+def _fechar_resumo(r: dict, custo_total: float) -> dict:
+    execucoes = r["execucoes"] or 1
+    return {
+        **{k: round(v, 4) if isinstance(v, float) else v for k, v in r.items() if k != "duracao_total_s"},
+        "duracao_media_s": round(r["duracao_total_s"] / execucoes, 1),
+        "custo_medio_usd": round(r["custo_usd"] / execucoes, 5),
+        "participacao_custo": round(r["custo_usd"] / custo_total, 3) if custo_total else None,
+    }
+
+
+def relatorio(dias: int = 30, cliente: str | None = None, rota: str | None = None) -> dict:
+    """Custo e consumo das execuções dos últimos `dias`, por cliente, rota, tarefa e dia."""
+    desde = (datetime.now() - timedelta(days=dias)).isoformat(timespec="seconds")
+    grupos = {nome: defaultdict(_novo_resumo) for nome in ("cliente", "rota", "dia")}
+    por_tarefa: dict[str, dict] = defaultdict(lambda: {"execucoes": 0, "duracao_total_s": 0.0,
+                                                        **dict.fromkeys(CAMPOS_LLM, 0)})
+    total = _novo_resumo()
+
+    for reg in _ler_registros():
+        if str(reg.get("ts", "")) < desde:
+            continue
+        if (cliente and reg.get("cliente") != cliente) or (rota and reg.get("rota") != rota):
+            continue
+        chaves = {"cliente": reg.get("cliente") or "(sem)", "rota": reg.get("rota") or "(sem)",
+                  "dia": str(reg.get("ts", ""))[:10]}
+        for r in [grupos[nome][chave] for nome, chave in chaves.items()] + [total]:
+            r["execucoes"] += 1
+            r["erros"] += reg.get("status") == "erro"
+            r["duracao_total_s"] += reg.get("duracao_s", 0.0) or 0.0
+            r["serpapi_pagas"] += (reg.get("serpapi") or {}).get("pagas", 0)
+            for campo in ("prompt_tokens", "completion_tokens", "cached_tokens",
+                          "custo_llm_usd", "custo_serpapi_usd", "custo_usd"):
+                r[campo] += reg.get(campo, 0) or 0
+        for nome, valores in (reg.get("tarefas") or {}).items():
+            t = por_tarefa[nome]
+            t["execucoes"] += 1
+            t["duracao_total_s"] += valores.get("duracao_s") or 0.0
+            for campo in CAMPOS_LLM:
+                t[campo] += valores.get(campo, 0) or 0
+
+    custo_total = total["custo_usd"]
+    custo_llm_total = total["custo_llm_usd"]
+    return {
+        "periodo_dias": dias,
+        "total": _fechar_resumo(total, custo_total),
+        **{f"por_{nome}": {k: _fechar_resumo(v, custo_total) for k, v in sorted(g.items())}
+           for nome, g in grupos.items()},
+        "por_tarefa": {
+            nome: {
+                "execucoes": t["execucoes"],
+                "chamadas": t["chamadas"],
+                "duracao_media_s": round(t["duracao_total_s"] / (t["execucoes"] or 1), 1),
+                "prompt_tokens": t["prompt_tokens"],
+                "completion_tokens": t["completion_tokens"],
+                "cached_tokens": t["cached_tokens"],
+                "custo_usd": round(t["custo_usd"], 4),
+                "participacao_custo_llm": round(t["custo_usd"] / custo_llm_total, 3) if custo_llm_total else None,
+            }
+            for nome, t in sorted(por_tarefa.items(), key=lambda kv: kv[1]["custo_usd"], reverse=True)
+        },
+    }
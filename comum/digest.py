@@ -0,0 +1,132 @@
+import re
+from dataclasses import dataclass, field
+
+from comum.config import env_int
+from comum.lacunas import analisar_lacunas
+from comum.tokens import contar_tokens
+from comum.whitelist import extrair_host
+
+# -------------------------------
+# Digest da concorrência: montado 1x por requisição e fatiado por tarefa
+# -------------------------------
+# Antes, o texto bruto da SERP era colado inteiro em intro, outline e
+# desenvolvimento (3x os mesmos tokens). O digest deduplica domínios, limpa os
+# trechos e entrega a cada tarefa só a parte de que ela precisa, dentro de um
+# orçamento total de tokens. A fatia do outline é a matriz de cobertura/lacunas
+# (comum.lacunas) em vez dos headings crus de cada página. As perguntas reais da
+# SERP ("As pessoas também perguntam") viram a fatia `perguntas` (seções de dúvidas).
+ORCAMENTO_DIGEST = env_int("DIGEST_ORCAMENTO_TOKENS", 1200)
+# Fração do orçamento de cada fatia
+PARTES_DIGEST = {"intro": 0.15, "outline": 0.40, "desenvolvimento": 0.35, "perguntas": 0.10}
+
+_RE_DATA_INICIAL = re.compile(
+    r"^\s*(há \d+ \w+|\d{1,2} de \w+\.? de \d{4}|\d{1,2}/\d{1,2}/\d{2,4}|\w{3}\.? \d{1,2}, \d{4})\s*[—–-]\s*",
+    re.IGNORECASE,
+)
+_RE_RUIDO = re.compile(r"\b(leia mais|saiba mais|clique aqui|ver mais|continue lendo)\b\.?", re.IGNORECASE)
+_HEADINGS_GENERICOS = {
+    "comentários", "deixe um comentário", "posts relacionados", "artigos relacionados", "leia também",
+    "compartilhe", "newsletter", "assine nossa newsletter", "categorias", "posts recentes", "menu",
+    "navegação", "sumário", "índice", "referências", "contato", "fale conosco", "tags",
+}
+
+
+@dataclass(frozen=True)
+class DigestConcorrencia:
+    intro: str
+    outline: str
+    desenvolvimento: str
+    perguntas: str = ""
+    tokens: dict = field(default_factory=dict)
+
+
+def _limpar(texto: str) -> str:
+    texto = _RE_DATA_INICIAL.sub("", texto or "")
+    texto = _RE_RUIDO.sub("", texto)
+    texto = re.sub(r"\s+", " ", texto).strip(" .…")
+    return texto
+
+
+def _dominio(url: str) -> str:
+    host = extrair_host(url)
+    return host[4:] if host.startswith("www.") else host
+
+
+def _dentro_do_orcamento(linhas: list[str], limite: int) -> str:
+    saida, usados = [], 0
+    for linha in linhas:
+        custo = contar_tokens(linha) + 1
+        if usados + custo > limite:
+            break
+        saida.append(linha)
+        usados += custo
+    return "\n".join(saida)
+
+
+def montar_digest(resultados_serp: list[dict], documentos: list[dict] | None = None,
+                  orcamento_tokens: int = ORCAMENTO_DIGEST,
+                  demandas: list[str] | None = None, palavra_chave: str = "",
+                  perguntas: list[dict] | None = None, knowledge_graph: dict | None = None) -> DigestConcorrencia:
+    """
+    Digest (inspiração – NÃO copiar) com 1 entrada por domínio, limitado a `orcamento_tokens`.
+    `perguntas`/`knowledge_graph` vêm de `comum.serp.PesquisaSerp` (mesma chamada da SERP).
+    """
+    docs_por_url = {d["url"]: d for d in (documentos or [])}
+    itens, vistos = [], set()
+    for r in resultados_serp:
+        url = r.get("link") or r.get("url") or ""
+        dominio = _dominio(url)
+        if not dominio or dominio in vistos:
+            continue
+        vistos.add(dominio)
+        itens.append({
+            "dominio": dominio,
+            "titulo": _limpar(r.get("title", "")),
+            "trecho": _limpar(r.get("snippet", "")),
+            "doc": docs_por_url.get(url),
+        })
+
+    # Intro: só os ângulos (títulos) de cada concorrente
+    linhas_intro = [f"- {it['titulo']} ({it['dominio']})" for it in itens if it["titulo"]]
+    if knowledge_graph and knowledge_graph.get("descricao"):
+        linhas_intro.insert(0, f"- Definição em destaque no Google: {_limpar(knowledge_graph['descricao'])[:280]}")
+
+    # Outline: matriz de cobertura (quem cobre cada subtópico) + lacunas
+    concorrentes = []
+    for it in itens:
+        headings = [
+            _limpar(h["texto"])[:110]
+            for h in (it["doc"] or {}).get("headings", [])
+            if h["nivel"] in (2, 3) and _limpar(h["texto"]).casefold() not in _HEADINGS_GENERICOS
+        ]
+        concorrentes.append({
+            "dominio": it["dominio"],
+            "headings": headings or [it["titulo"]],
+            "trecho": it["trecho"],
+        })
+    linhas_outline = analisar_lacunas(concorrentes, demandas, palavra_chave).linhas()
+
+    # Desenvolvimento: o que cada concorrente efetivamente afirma (trecho + 1º parágrafo)
+    linhas_desenv = []
+    for it in itens:
+        pontos = [it["trecho"]] if it["trecho"] else []
+        texto_doc = (it["doc"] or {}).get("texto", "")
+        if texto_doc:
+            pontos.append(_limpar(texto_doc.split("\n", 1)[0])[:280])
+        if pontos:
+            linhas_desenv.append(f"- {it['dominio']}: " + " | ".join(pontos))
+
+    # Perguntas reais dos usuários + o que o Google mostra como resposta
+    linhas_perguntas = [
+        f"- {p['pergunta']}" + (f" (resposta exibida: {_limpar(p['resposta'])[:160]})" if p.get("resposta") else "")
+        for p in perguntas or []
+    ]
+
+    partes = {
+        "intro": _dentro_do_orcamento(linhas_intro, int(orcamento_tokens * PARTES_DIGEST["intro"])),
+        "outline": _dentro_do_orcamento(linhas_outline, int(orcamento_tokens * PARTES_DIGEST["outline"])),
+        "desenvolvimento": _dentro_do_orcamento(linhas_desenv, int(orcamento_tokens * PARTES_DIGEST["desenvolvimento"])),
+        "perguntas": _dentro_do_orcamento(linhas_perguntas, int(orcamento_tokens * PARTES_DIGEST["perguntas"])),
+    }
+    partes = {k: v or "(sem dados de concorrência)" for k, v in partes.items()}
+    return DigestConcorrencia(**partes, tokens={k: contar_tokens(v) for k, v in partes.items()})
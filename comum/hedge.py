@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+import contextvars
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, TypeVar
+
+import numpy as np
+
+from comum.config import env_float, env_int
+
+# -------------------------------
+# Requisições "hedged" ao LLM (corta a cauda de latência)
+# -------------------------------
+# Se a chamada de uma tarefa não voltou depois do percentil LLM_HEDGE_PERCENTIL das
+# latências recentes dessa tarefa, dispara uma duplicata; a primeira a terminar
+# vence e a outra é cancelada (o stream interno é fechado – a OpenAI para de gerar).
+# Teto de gasto extra: no máximo LLM_HEDGE_MAX_FRACAO das chamadas de cada tarefa
+# (janela recente) viram duplicata. A duplicata é uma requisição como outra qualquer:
+# a tentativa sabe que é duplicata (reserva RPM/TPM própria) e contabiliza o gasto
+# quando perde (ver comum.llm).
+# LLM_HEDGE_TAREFAS: "*" ou lista (ex.: "desenvolvimento,revisor,executor"); vazio = desligado.
+LLM_HEDGE_TAREFAS = {t.strip() for t in os.getenv("LLM_HEDGE_TAREFAS", "").split(",") if t.strip()}
+LLM_HEDGE_PERCENTIL = env_float("LLM_HEDGE_PERCENTIL", 95)
+LLM_HEDGE_MAX_FRACAO = env_float("LLM_HEDGE_MAX_FRACAO", 0.1)
+# Até juntar amostras suficientes, usa um atraso fixo
+LLM_HEDGE_AMOSTRAS_MIN = env_int("LLM_HEDGE_AMOSTRAS_MIN", 20)
+LLM_HEDGE_ATRASO_PADRAO_S = env_float("LLM_HEDGE_ATRASO_PADRAO_S", 45)
+LLM_HEDGE_ATRASO_MIN_S = env_float("LLM_HEDGE_ATRASO_MIN_S", 2)
+LLM_HEDGE_JANELA = env_int("LLM_HEDGE_JANELA", 200)
+
+T = TypeVar("T")
+
+
+class Cancelado(Exception):
+    """Tentativa interrompida por ter perdido a corrida; `parcial` = texto já recebido."""
+
+    def __init__(self, parcial: str = ""):
+        super().__init__("tentativa cancelada (hedge)")
+        self.parcial = parcial
+
+
+class Hedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencias: dict[str, deque] = defaultdict(lambda: deque(maxlen=LLM_HEDGE_JANELA))
+        self._disparos: dict[str, deque] = defaultdict(lambda: deque(maxlen=LLM_HEDGE_JANELA))
+        self._stats: dict[str, dict] = defaultdict(lambda: {
+            "chamadas": 0, "hedges": 0, "vitorias_duplicata": 0, "barrados_pelo_teto": 0, "cancelados": 0,
+        })
+        self._executor = ThreadPoolExecutor(max_workers=env_int("LLM_HEDGE_THREADS", 32),
+                                            thread_name_prefix="llm-hedge")
+
+    @staticmethod
+    def ativo(tarefa: str) -> bool:
+        return "*" in LLM_HEDGE_TAREFAS or tarefa in LLM_HEDGE_TAREFAS
+
+    def atraso_s(self, tarefa: str) -> float:
+        with self._lock:
+            amostras = list(self._latencias[tarefa])
+        if len(amostras) < LLM_HEDGE_AMOSTRAS_MIN:
+            return LLM_HEDGE_ATRASO_PADRAO_S
+        return max(float(np.percentile(amostras, LLM_HEDGE_PERCENTIL)), LLM_HEDGE_ATRASO_MIN_S)
+
+    def _pode_duplicar(self, tarefa: str) -> bool:
+        disparos = self._disparos[tarefa]
+        return not disparos or (sum(disparos) + 1) / (len(disparos) + 1) <= LLM_HEDGE_MAX_FRACAO
+
+    def _registrar_latencia(self, tarefa: str, segundos: float) -> None:
+        with self._lock:
+            self._latencias[tarefa].append(segundos)
+
+    def executar(self, tarefa: str, tentativa: Callable[[threading.Event, bool], T]) -> tuple[T, bool]:
+        """
+        Roda `tentativa(cancelado, duplicata)`; devolve (resultado, houve_duplicata).
+        `tentativa` deve checar `cancelado` e levantar Cancelado quando ele for setado
+        (depois de registrar o que a tentativa perdedora já gastou).
+        """
+        def _rodar(evento: threading.Event, duplicata: bool):
+            inicio = time.perf_counter()
+            try:
+                resultado = tentativa(evento, duplicata)
+            except Cancelado:
+                with self._lock:
+                    self._stats[tarefa]["cancelados"] += 1
+                raise
+            self._registrar_latencia(tarefa, time.perf_counter() - inicio)
+            return resultado
+
+        cancel_primaria, cancel_duplicata = threading.Event(), threading.Event()
+        primaria = self._executor.submit(contextvars.copy_context().run, _rodar, cancel_primaria, False)
+        with self._lock:
+            self._stats[tarefa]["chamadas"] += 1
+        feitos, _ = wait([primaria], timeout=self.atraso_s(tarefa))
+
+        with self._lock:
+            duplicar = not feitos and self._pode_duplicar(tarefa)
+            self._disparos[tarefa].append(1 if duplicar else 0)
+            if not feitos and not duplicar:
+                self._stats[tarefa]["barrados_pelo_teto"] += 1
+            if duplicar:
+                self._stats[tarefa]["hedges"] += 1
+        if not duplicar:
+            return primaria.result(), False
+
+        duplicata = self._executor.submit(contextvars.copy_context().run, _rodar, cancel_duplicata, True)
+        pendentes = {primaria: cancel_primaria, duplicata: cancel_duplicata}
+        erro = None
+        while pendentes:
+            feitos, _ = wait(list(pendentes), return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                pendentes.pop(futuro)
+                if futuro.exception() is None:
+                    for evento in pendentes.values():
+                        evento.set()  # cancela a perdedora
+                    if futuro is duplicata:
+                        with self._lock:
+                            self._stats[tarefa]["vitorias_duplicata"] += 1
+                    return futuro.result(), True
+                erro = erro or futuro.exception()
+        raise erro
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            tarefas = sorted(set(self._stats) | set(self._latencias))
+            saida = {}
+            for tarefa in tarefas:
+                stats = dict(self._stats[tarefa])
+                lat = np.array(self._latencias[tarefa], dtype=np.float64)
+                stats["taxa_hedge"] = round(stats["hedges"] / stats["chamadas"], 3) if stats["chamadas"] else None
+                stats["latencia_p50_s"] = round(float(np.percentile(lat, 50)), 2) if lat.size else None
+                stats["latencia_p99_s"] = round(float(np.percentile(lat, 99)), 2) if lat.size else None
+                saida[tarefa] = stats
+        for tarefa in saida:
+            saida[tarefa]["atraso_atual_s"] = round(self.atraso_s(tarefa), 2)
+        return {
+            "tarefas_configuradas": sorted(LLM_HEDGE_TAREFAS),
+            "percentil": LLM_HEDGE_PERCENTIL,
+            "max_fracao": LLM_HEDGE_MAX_FRACAO,
+            "por_tarefa": saida,
+        }
+
+
+hedger = Hedger()
@@ -0,0 +1,178 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from comum.palavras_chave import STOPWORDS_PT, canonizar, remover_acentos
+
+# -------------------------------
+# Análise local de lacunas da SERP -> matriz de cobertura para o outline
+# -------------------------------
+# Cada heading (H2/H3) dos concorrentes vira um vetor TF-IDF de 1–2-gramas; headings
+# parecidos (cosseno >= LIMIAR_TOPICO) formam um subtópico. A matriz diz quais
+# concorrentes cobrem cada subtópico. Lacunas são temas que aparecem como demanda
+# (perguntas/buscas relacionadas ou trechos da SERP) e que nenhum heading cobre.
+# Resultado determinístico: mesma entrada, mesma matriz (pode ir para cache).
+LIMIAR_TOPICO = 0.45
+LIMIAR_LACUNA = 0.35
+
+_VAZIAS = STOPWORDS_PT | frozenset(
+    "como qual quais quando onde porque por que voce voces seu sua seus suas isso esse essa este esta "
+    "sao ser ter tem mais muito pode podem deve fazer faz sobre tudo".split()
+)
+
+
+@dataclass
+class Topico:
+    rotulo: str
+    cobertura: list[bool]
+    headings: list[str] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(self.cobertura)
+
+
+@dataclass
+class MatrizCobertura:
+    concorrentes: list[str]
+    topicos: list[Topico]
+    lacunas: list[str]
+
+    def comuns(self) -> list[Topico]:
+        minimo = max(2, math.ceil(0.6 * len(self.concorrentes)))
+        return [t for t in self.topicos if t.total >= minimo]
+
+    def parciais(self) -> list[Topico]:
+        minimo = max(2, math.ceil(0.6 * len(self.concorrentes)))
+        return [t for t in self.topicos if 2 <= t.total < minimo]
+
+    def linhas(self) -> list[str]:
+        """Linhas do texto compacto, em ordem de prioridade (para corte por orçamento)."""
+        letras = [chr(ord("A") + i) for i in range(len(self.concorrentes))]
+
+        def marca(t: Topico) -> str:
+            return "".join(l if c else "-" for l, c in zip(letras, t.cobertura))
+
+        linhas = ["Concorrentes: " + ", ".join(f"{l}={d}" for l, d in zip(letras, self.concorrentes))]
+        linhas.append("Tópicos que a maioria cobre (obrigatórios):")
+        linhas += [f"[{marca(t)}] {t.rotulo}" for t in self.comuns()] or ["(nenhum)"]
+        linhas.append("Lacunas (demanda sem seção em nenhum concorrente – oportunidade):")
+        linhas += [f"- {lac}" for lac in self.lacunas] or ["(nenhuma detectada)"]
+        linhas.append("Cobertos só por alguns (diferenciais possíveis):")
+        linhas += [f"[{marca(t)}] {t.rotulo}" for t in self.parciais()] or ["(nenhum)"]
+        return linhas
+
+    def texto(self) -> str:
+        return "\n".join(self.linhas())
+
+
+def _tokens(texto: str, ignorar: frozenset = frozenset()) -> list[tuple[str, str]]:
+    """Pares (radical, forma original); radical = prefixo de 5 letras sem acento."""
+    pares = []
+    for t in re.findall(r"\w+", canonizar(texto, dobrar_acentos=False, ordenar=False)):
+        base = remover_acentos(t)
+        if len(base) <= 2 or base in _VAZIAS or not base.isalnum():
+            continue
+        radical = base[:5]
+        if radical not in ignorar:
+            pares.append((radical, t))
+    return pares
+
+
+def _radicais(texto: str) -> frozenset:
+    return frozenset(r for r, _ in _tokens(texto))
+
+
+def _ngramas(texto: str, ignorar: frozenset = frozenset()) -> list[str]:
+    toks = [r for r, _ in _tokens(texto, ignorar)]
+    return toks + [f"{a} {b}" for a, b in zip(toks, toks[1:])]
+
+
+def _vetorizar(textos: list[str], vocab: dict[str, int], idf: np.ndarray,
+               ignorar: frozenset = frozenset()) -> np.ndarray:
+    m = np.zeros((len(textos), len(vocab)), dtype=np.float32)
+    for i, texto in enumerate(textos):
+        for g, n in Counter(_ngramas(texto, ignorar)).items():
+            j = vocab.get(g)
+            if j is not None:
+                m[i, j] = n
+    m *= idf
+    normas = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(normas == 0, 1, normas)
+
+
+def _agrupar(sim: np.ndarray, limiar: float) -> list[list[int]]:
+    """Agrupamento guloso e determinístico: sementes por centralidade decrescente."""
+    ordem = np.lexsort((np.arange(len(sim)), -sim.sum(axis=1)))
+    livre = np.ones(len(sim), dtype=bool)
+    grupos = []
+    for semente in ordem:
+        if not livre[semente]:
+            continue
+        membros = np.flatnonzero(livre & (sim[semente] >= limiar))
+        livre[membros] = False
+        grupos.append(membros.tolist())
+    return grupos
+
+
+def _frases_de_demanda(trechos: list[str], ignorar: frozenset, min_df: int = 2) -> list[str]:
+    """Bigramas que se repetem em trechos de concorrentes diferentes (o que a SERP destaca)."""
+    df, superficie = Counter(), {}
+    for trecho in trechos:
+        toks = _tokens(trecho, ignorar)
+        vistos = set()
+        for (ra, a), (rb, b) in zip(toks, toks[1:]):
+            chave = f"{ra} {rb}"
+            superficie.setdefault(chave, f"{a} {b}")
+            vistos.add(chave)
+        df.update(vistos)
+    return [superficie[g] for g, n in sorted(df.items(), key=lambda kv: (-kv[1], kv[0])) if n >= min_df]
+
+
+def analisar_lacunas(concorrentes: list[dict], demandas: list[str] | None = None, palavra_chave: str = "",
+                     max_topicos: int = 20, max_lacunas: int = 8) -> MatrizCobertura:
+    """
+    concorrentes: [{"dominio": ..., "headings": [str, ...], "trecho": str}]
+    demandas: temas que os usuários procuram (ex.: perguntas relacionadas da SERP).
+    Os termos da própria palavra-chave são ignorados (todo heading os contém).
+    """
+    ignorar = _radicais(palavra_chave)
+    nomes = [c["dominio"] for c in concorrentes]
+    unidades, dono = [], []
+    for i, c in enumerate(concorrentes):
+        for h in c.get("headings", []):
+            if _tokens(h, ignorar):
+                unidades.append(h)
+                dono.append(i)
+    trechos = [c.get("trecho", "") for c in concorrentes]
+    candidatos = list(dict.fromkeys((demandas or []) + _frases_de_demanda(trechos, ignorar)))
+    if not unidades:
+        return MatrizCobertura(nomes, [], candidatos[:max_lacunas])
+
+    docs_ng = [set(_ngramas(u, ignorar)) for u in unidades]
+    df = Counter(g for d in docs_ng for g in d)
+    vocab = {g: j for j, g in enumerate(sorted(df))}
+    n = len(unidades)
+    idf = np.array([math.log((1 + n) / (1 + df[g])) + 1 for g in sorted(df)], dtype=np.float32)
+
+    x = _vetorizar(unidades, vocab, idf, ignorar)
+    sim = x @ x.T
+    dono_arr = np.array(dono)
+
+    topicos = []
+    for membros in _agrupar(sim, LIMIAR_TOPICO):
+        cobertura = np.zeros(len(nomes), dtype=bool)
+        cobertura[dono_arr[membros]] = True
+        central = membros[int(np.argmax(sim[np.ix_(membros, membros)].mean(axis=1)))]
+        topicos.append(Topico(unidades[central][:100], cobertura.tolist(), [unidades[m] for m in membros]))
+    topicos.sort(key=lambda t: (-t.total, -len(t.headings), t.rotulo))
+
+    lacunas = []
+    if candidatos:
+        y = _vetorizar(candidatos, vocab, idf, ignorar)
+        cobertos = (y @ x.T).max(axis=1)
+        lacunas = [c for c, s in zip(candidatos, cobertos) if s < LIMIAR_LACUNA][:max_lacunas]
+    return MatrizCobertura(nomes, topicos[:max_topicos], lacunas)
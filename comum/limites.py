@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from comum.config import DIR_DADOS, env_float, env_int, env_json
+from comum.contexto import execucao_atual
+
+# -------------------------------
+# Limite global de requisições/min e tokens/min da conta (token bucket)
+# -------------------------------
+# Toda chamada real ao LLM (qualquer crew) retira 1 requisição e os tokens estimados
+# (prompt contado + LLM_LIMITE_SAIDA_ESTIMADA) dos baldes; sem saldo, espera. Depois
+# da resposta os baldes de onde os tokens saíram são acertados com o uso real.
+# Reservas por cliente (LLM_LIMITE_RESERVAS, ex.: {"dra_karen": 0.15, "invictus": 0.1}):
+# cada cliente listado tem um balde próprio com essa fração da capacidade, usado antes
+# do balde comum (o restante). Um cliente em massa esgota no máximo o comum – a fatia
+# reservada dos outros continua disponível para eles.
+# LLM_LIMITE_ENTRE_PROCESSOS=1: estado dos baldes num arquivo com trava (filelock),
+# compartilhado pelos workers do mesmo host.
+LLM_LIMITE_RPM = env_int("LLM_LIMITE_RPM", 0)  # 0 = sem limite
+LLM_LIMITE_TPM = env_int("LLM_LIMITE_TPM", 0)
+LLM_LIMITE_RESERVAS: dict[str, float] = env_json("LLM_LIMITE_RESERVAS", {})
+# Capacidade de rajada de cada balde, em minutos de taxa (0.25 = 15 s acumulados)
+LLM_LIMITE_RAJADA_MIN = env_float("LLM_LIMITE_RAJADA_MIN", 0.25)
+LLM_LIMITE_SAIDA_ESTIMADA = env_int("LLM_LIMITE_SAIDA_ESTIMADA", 1500)
+LLM_LIMITE_ENTRE_PROCESSOS = os.getenv("LLM_LIMITE_ENTRE_PROCESSOS", "0") not in ("0", "false", "False", "")
+ARQ_LIMITES = DIR_DADOS / "limites_llm.json"
+
+COMUM = "*"
+
+
+def _fracoes() -> dict[str, float]:
+    reservas = {c: max(float(f), 0.0) for c, f in LLM_LIMITE_RESERVAS.items() if c != COMUM}
+    total = sum(reservas.values())
+    if total > 0.9:  # sempre sobra ao menos 10% para o balde comum
+        reservas = {c: f * 0.9 / total for c, f in reservas.items()}
+    return {COMUM: 1.0 - sum(reservas.values()), **reservas}
+
+
+class LimitadorTaxa:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estado: dict = {}
+        self._fracoes = _fracoes()
+        self._limites = {"req": LLM_LIMITE_RPM, "tok": LLM_LIMITE_TPM}
+        self.stats = defaultdict(lambda: {"chamadas": 0, "esperas": 0, "espera_total_s": 0.0})
+
+    @property
+    def ativo(self) -> bool:
+        return bool(LLM_LIMITE_RPM or LLM_LIMITE_TPM)
+
+    def _taxa(self, tipo: str, balde: str) -> float:
+        """Reabastecimento por segundo do balde."""
+        return self._limites[tipo] * self._fracoes[balde] / 60
+
+    def _capacidade(self, tipo: str, balde: str) -> float:
+        return self._limites[tipo] * self._fracoes[balde] * LLM_LIMITE_RAJADA_MIN
+
+    @contextmanager
+    def _estado_travado(self):
+        with self._lock:
+            if not LLM_LIMITE_ENTRE_PROCESSOS:
+                yield self._estado
+                return
+            from filelock import FileLock  # só no modo entre processos
+
+            with FileLock(str(ARQ_LIMITES) + ".lock"):
+                try:
+                    with open(ARQ_LIMITES, encoding="utf-8") as f:
+                        estado = json.load(f)
+                except (OSError, ValueError):
+                    estado = {}
+                yield estado
+                ARQ_LIMITES.parent.mkdir(parents=True, exist_ok=True)
+                tmp = ARQ_LIMITES.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(estado, f)
+                os.replace(tmp, ARQ_LIMITES)
+
+    def _reabastecer(self, estado: dict, agora: float) -> None:
+        decorrido = max(agora - estado.get("ts", agora), 0.0)
+        estado["ts"] = agora
+        niveis = estado.setdefault("niveis", {})
+        for tipo, limite in self._limites.items():
+            if not limite:
+                continue
+            baldes = niveis.setdefault(tipo, {})
+            for balde in self._fracoes:
+                cheio = self._capacidade(tipo, balde)
+                baldes[balde] = min(cheio, baldes.get(balde, cheio) + decorrido * self._taxa(tipo, balde))
+
+    def _baldes_de(self, cliente: str) -> list[str]:
+        return [cliente, COMUM] if cliente in self._fracoes and cliente != COMUM else [COMUM]
+
+    def _tentar(self, estado: dict, cliente: str, custos: dict[str, float]) -> float | dict[str, float]:
+        """
+        Retira os custos se houver saldo e devolve os tokens retirados de cada balde;
+        sem saldo, devolve quantos segundos esperar.
+        """
+        baldes = self._baldes_de(cliente)
+        espera = 0.0
+        for tipo, custo in custos.items():
+            if not self._limites[tipo]:
+                continue
+            niveis = estado["niveis"][tipo]
+            # pedido maior que a rajada inteira: espera só até os baldes encherem
+            necessario = min(custo, sum(self._capacidade(tipo, b) for b in baldes))
+            saldo = sum(niveis[b] for b in baldes)
+            if saldo < necessario:
+                espera = max(espera, (necessario - saldo) / sum(self._taxa(tipo, b) for b in baldes))
+        if espera > 0:
+            return espera
+        retirados: dict[str, float] = {}
+        for tipo, custo in custos.items():
+            if not self._limites[tipo]:
+                continue
+            niveis = estado["niveis"][tipo]
+            for balde in baldes:  # reserva própria primeiro, depois o comum (pode ficar devendo)
+                retirado = custo if balde == COMUM else min(custo, max(niveis[balde], 0.0))
+                niveis[balde] -= retirado
+                custo -= retirado
+                if tipo == "tok" and retirado > 0:
+                    retirados[balde] = retirado
+        return retirados
+
+    def adquirir(self, tokens: int) -> dict[str, float]:
+        """
+        Bloqueia até haver saldo para 1 requisição + `tokens`; devolve os tokens
+        retirados de cada balde (entregar a `acertar` depois da resposta).
+        """
+        if not self.ativo:
+            return {}
+        cliente = execucao_atual().cliente
+        tokens += LLM_LIMITE_SAIDA_ESTIMADA
+        inicio = time.time()
+        esperou = False
+        while True:
+            with self._estado_travado() as estado:
+                self._reabastecer(estado, time.time())
+                resultado = self._tentar(estado, cliente, {"req": 1, "tok": tokens})
+            if isinstance(resultado, dict):
+                break
+            esperou = True
+            time.sleep(min(resultado, 1.0))
+        with self._lock:
+            stats = self.stats[cliente]
+            stats["chamadas"] += 1
+            if esperou:
+                stats["esperas"] += 1
+                stats["espera_total_s"] += time.time() - inicio
+        return resultado
+
+    def acertar(self, retirados: dict[str, float], usados: int) -> None:
+        """
+        Corrige o balde de tokens com o uso real (estimativa alta devolve saldo; baixa vira
+        dívida), nos mesmos baldes e na mesma proporção da retirada de `adquirir`.
+        """
+        if not self.ativo or not LLM_LIMITE_TPM or not retirados:
+            return
+        total = sum(retirados.values())
+        diferenca = total - usados
+        with self._estado_travado() as estado:
+            self._reabastecer(estado, time.time())
+            niveis = estado["niveis"]["tok"]
+            for balde, retirado in retirados.items():
+                if balde in niveis:
+                    niveis[balde] = min(self._capacidade("tok", balde), niveis[balde] + diferenca * retirado / total)
+
+    def estatisticas(self) -> dict:
+        with self._estado_travado() as estado:
+            self._reabastecer(estado, time.time())
+            niveis = {tipo: {b: round(v, 1) for b, v in baldes.items()}
+                      for tipo, baldes in estado.get("niveis", {}).items()}
+        with self._lock:
+            por_cliente = {c: {**s, "espera_total_s": round(s["espera_total_s"], 2)} for c, s in self.stats.items()}
+        return {
+            "rpm": LLM_LIMITE_RPM,
+            "tpm": LLM_LIMITE_TPM,
+            "fracoes": {b: round(f, 3) for b, f in self._fracoes.items()},
+            "entre_processos": LLM_LIMITE_ENTRE_PROCESSOS,
+            "saldo": niveis,
+            "por_cliente": por_cliente,
+        }
+
+
+limitador = LimitadorTaxa()
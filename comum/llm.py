@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import threading
+import importlib.util
+from functools import lru_cache
+from typing import Any
+
+import httpx
+from openai import OpenAI
+from crewai.llms.base_llm import BaseLLM
+
+from comum import llm_cache, llm_simulado, llm_uso, lote, orcamento_tokens, streaming
+from comum.concorrencia import LLM_CONCORRENCIA_ATIVA, LLM_MAX_RETRIES, controle
+from comum.hedge import Cancelado, hedger
+from comum.limites import limitador
+from comum.config import MODELO_PADRAO, env_float, env_int
+from comum.tokens import contar_tokens, contar_tokens_mensagens
+
+# -------------------------------
+# Cliente LLM compartilhado pelo processo
+# -------------------------------
+# Antes cada módulo de crew criava seu próprio ChatOpenAI (que a crewai ainda
+# convertia em outro cliente via litellm): 14 pools de conexão, nenhum reaproveitado.
+# Aqui há UM httpx.Client (keep-alive, HTTP/2 se o pacote `h2` estiver instalado)
+# e UM cliente OpenAI por processo; `obter_llm` devolve a mesma instância por
+# (modelo, temperatura). httpx.Client e o cliente OpenAI são thread-safe.
+LLM_MAX_CONEXOES = env_int("LLM_MAX_CONEXOES", 20)
+LLM_MAX_KEEPALIVE = env_int("LLM_MAX_KEEPALIVE", 10)
+LLM_KEEPALIVE_S = env_float("LLM_KEEPALIVE_S", 60)
+LLM_TIMEOUT_S = env_float("LLM_TIMEOUT_S", 120)
+LLM_HTTP2 = (
+    os.getenv("LLM_HTTP2", "1") not in ("0", "false", "False", "")
+    and importlib.util.find_spec("h2") is not None
+)
+
+# Janela de contexto por prefixo de modelo (usada pela crewai para resumir histórico)
+_JANELAS = {
+    "gpt-4o": 128000, "gpt-4.1": 1047576, "gpt-4-turbo": 128000, "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385, "o1": 200000, "o3": 200000, "o4": 200000,
+}
+
+_lock_cliente = threading.Lock()
+_cliente: OpenAI | None = None
+
+
+def cliente_openai() -> OpenAI:
+    """Cliente OpenAI único do processo, sobre o pool httpx compartilhado (criado sob demanda)."""
+    global _cliente
+    if _cliente is None:
+        with _lock_cliente:
+            if _cliente is None:
+                http = httpx.Client(
+                    http2=LLM_HTTP2,
+                    timeout=httpx.Timeout(LLM_TIMEOUT_S, connect=10.0),
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONEXOES,
+                        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                        keepalive_expiry=LLM_KEEPALIVE_S,
+                    ),
+                )
+                # Com o controle de concorrência, retentativas (inclusive de 429) ficam com ele
+                _cliente = OpenAI(http_client=http, max_retries=0 if LLM_CONCORRENCIA_ATIVA else LLM_MAX_RETRIES)
+    return _cliente
+
+
+def fechar_cliente() -> None:
+    """Fecha o pool (encerramento da aplicação)."""
+    global _cliente
+    with _lock_cliente:
+        if _cliente is not None:
+            _cliente.close()
+            _cliente = None
+
+
+class LLMCompartilhado(BaseLLM):
+    """LLM para Agents da crewai que usa o cliente OpenAI compartilhado."""
+
+    def __init__(self, model: str, temperature: float | None = None, tarefa: str = ""):
+        super().__init__(model=model, temperature=temperature)
+        self.tarefa = tarefa  # rótulo para o registro de latência/custo (comum.llm_uso)
+
+    def _parametros(self, messages: list[dict], tools: list[dict] | None) -> dict:
+        params: dict[str, Any] = {"model": self.model, "messages": messages}
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        if self.stop:
+            params["stop"] = list(dict.fromkeys(self.stop))[:4]  # a API aceita até 4
+        if tools:
+            params["tools"] = tools
+        return params
+
+    def _completar(self, params: dict) -> tuple[str, list | None, Any]:
+        """Uma chamada não transmitida: (conteúdo, tool_calls, usage)."""
+        if llm_simulado.simulado():
+            return llm_simulado.completar(params)
+        resposta = controle.executar(lambda: cliente_openai().chat.completions.with_raw_response.create(**params))
+        mensagem = resposta.choices[0].message
+        return mensagem.content or "", mensagem.tool_calls, resposta.usage
+
+    def _completar_em_stream(self, params: dict, canal) -> tuple[str, None, Any]:
+        """Chamada com stream=True: cada delta vai ao canal (após 'Final Answer:'); devolve o texto completo."""
+        filtro = streaming.FiltroRespostaFinal(canal)
+        if llm_simulado.simulado():
+            return llm_simulado.completar(params, ao_receber=filtro.receber)
+
+        def _consumir(fluxo) -> tuple[str, None, Any]:
+            partes, uso = [], None
+            for pedaco in fluxo:
+                if pedaco.usage is not None:
+                    uso = pedaco.usage
+                if pedaco.choices and pedaco.choices[0].delta.content:
+                    delta = pedaco.choices[0].delta.content
+                    partes.append(delta)
+                    filtro.receber(delta)
+            return "".join(partes), None, uso
+
+        return controle.executar(
+            lambda: cliente_openai().chat.completions.with_raw_response.create(
+                **params, stream=True, stream_options={"include_usage": True}
+            ),
+            _consumir,
+        )
+
+    def _completar_cancelavel(self, params: dict, cancelado: threading.Event) -> tuple[str, None, Any]:
+        """Tentativa de uma chamada hedged: stream interno, fechado assim que `cancelado` é setado."""
+        partes = []
+
+        def _receber(delta: str) -> None:
+            if cancelado.is_set():
+                raise Cancelado("".join(partes))
+            partes.append(delta)
+
+        if llm_simulado.simulado():
+            return llm_simulado.completar(params, ao_receber=_receber)
+
+        def _consumir(fluxo) -> tuple[str, None, Any]:
+            uso = None
+            try:
+                for pedaco in fluxo:
+                    if pedaco.usage is not None:
+                        uso = pedaco.usage
+                    if pedaco.choices and pedaco.choices[0].delta.content:
+                        _receber(pedaco.choices[0].delta.content)
+                    elif cancelado.is_set():
+                        raise Cancelado("".join(partes))
+            finally:
+                fluxo.close()  # na perdedora, derruba a conexão e a geração
+            return "".join(partes), None, uso
+
+        return controle.executar(
+            lambda: cliente_openai().chat.completions.with_raw_response.create(
+                **params, stream=True, stream_options={"include_usage": True}
+            ),
+            _consumir,
+        )
+
+    def _tentativa_hedge(self, params: dict, estimados: int, reserva_primaria: dict):
+        """
+        Tentativa para o hedger; devolve ((conteúdo, tool_calls, usage), reserva RPM/TPM).
+        A duplicata reserva a própria vaga em comum.limites. A perdedora registra o que
+        gastou (prompt inteiro + o que já tinha sido gerado) no uso, no orçamento da
+        execução e no balde de tokens.
+        """
+        def _tentativa(cancelado: threading.Event, duplicata: bool):
+            reserva = reserva_primaria
+            if duplicata:
+                reserva = {} if llm_simulado.simulado() else limitador.adquirir(estimados)
+            try:
+                return self._completar_cancelavel(params, cancelado), reserva
+            except Cancelado as exc:
+                gerados = contar_tokens(exc.parcial, self.model)
+                orcamento_tokens.contabilizar(estimados, gerados)
+                limitador.acertar(reserva, estimados + gerados)
+                llm_uso.registrar(self.tarefa, self.model, 0.0, cache="hedge",
+                                  prompt_tokens=estimados, completion_tokens=gerados)
+                raise
+        return _tentativa
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        canal = streaming.canal_atual()
+        em_stream = streaming.transmite(self.tarefa) and not tools
+        # Cache antes dos orçamentos: hit não gasta tokens, então não é cortado nem barrado.
+        # A chave é a do prompt original (um prompt cortado continua achando sua resposta).
+        chave_cache = llm_cache.chave(self._parametros(messages, tools)) if llm_cache.LLM_CACHE_ATIVO else None
+        if chave_cache:
+            guardada = llm_cache.ler(chave_cache)
+            if guardada is not None:
+                estimados = contar_tokens_mensagens(messages, self.model)
+                if canal is not None:
+                    canal.progresso(self.tarefa, "inicio", modelo=self.model, prompt_tokens=estimados)
+                llm_uso.registrar(self.tarefa, self.model, 0.0, cache="hit", prompt_tokens_estimados=estimados)
+                if em_stream:
+                    streaming.FiltroRespostaFinal(canal).receber(guardada)
+                if canal is not None:
+                    canal.progresso(self.tarefa, "fim", cache="hit")
+                return guardada
+        # Contagem prévia + orçamentos (pode cortar o prompt ou abortar antes do envio)
+        messages, estimados, cortado = orcamento_tokens.preparar(
+            messages, self.tarefa, self.model, self.get_context_window_size()
+        )
+        params = self._parametros(messages, tools)
+        if canal is not None:
+            canal.progresso(self.tarefa, "inicio", modelo=self.model, prompt_tokens=estimados)
+        em_lote = lote.em_lote() and not tools
+        # RPM/TPM globais da conta (comum.limites); dublê e Batch API não contam
+        retirados = {} if llm_simulado.simulado() or em_lote else limitador.adquirir(estimados)
+        inicio = time.time()
+        origem = "simulado" if llm_simulado.simulado() else "miss"
+        if em_stream:
+            conteudo, tool_calls, uso = self._completar_em_stream(params, canal)
+        elif em_lote:
+            # trabalho do modo lote: espera o resultado da Batch API (ver comum.lote)
+            conteudo, tool_calls, uso = lote.coletor.completar(params)
+            origem = "simulado" if lote.LLM_LOTE_PROVEDOR == "local" else "lote"
+        elif hedger.ativo(self.tarefa) and not tools:
+            # `retirados` passa a ser a reserva da tentativa vencedora (a perdedora acerta a sua)
+            ((conteudo, tool_calls, uso), retirados), _ = hedger.executar(
+                self.tarefa, self._tentativa_hedge(params, estimados, retirados),
+            )
+        else:
+            conteudo, tool_calls, uso = self._completar(params)
+        fim = time.time()
+        if llm_simulado.LLM_MODO == "gravar" and conteudo and not tool_calls:
+            llm_simulado.gravar(params, conteudo, uso, (fim - inicio) * 1000)
+
+        detalhes = getattr(uso, "prompt_tokens_details", None)
+        prompt_tokens = getattr(uso, "prompt_tokens", 0) or estimados
+        completion_tokens = getattr(uso, "completion_tokens", 0) or 0
+        orcamento_tokens.contabilizar(prompt_tokens, completion_tokens)
+        limitador.acertar(retirados, prompt_tokens + completion_tokens)
+        llm_uso.registrar(
+            self.tarefa, self.model, (fim - inicio) * 1000,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=getattr(detalhes, "cached_tokens", 0) or 0,
+            prompt_tokens_estimados=estimados,
+            cortado=cortado,
+            cache=origem,
+        )
+        if canal is not None:
+            canal.progresso(self.tarefa, "fim", latencia_ms=round((fim - inicio) * 1000),
+                            completion_tokens=completion_tokens)
+
+        # Callbacks da crewai (ex.: TokenCalcHandler) seguem a interface de logger do litellm
+        for cb in callbacks or []:
+            if hasattr(cb, "log_success_event"):
+                cb.log_success_event(params, {"usage": uso}, inicio, fim)
+
+        if tool_calls and available_functions:
+            chamada = tool_calls[0].function
+            funcao = available_functions.get(chamada.name)
+            if funcao is not None:
+                return funcao(**json.loads(chamada.arguments or "{}"))
+        if chave_cache and conteudo and not tool_calls:
+            llm_cache.gravar(chave_cache, params, conteudo)
+        return conteudo
+
+    def supports_function_calling(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        for prefixo in sorted(_JANELAS, key=len, reverse=True):
+            if self.model.startswith(prefixo):
+                return int(_JANELAS[prefixo] * 0.75)  # margem, como a crewai faz
+        return int(128000 * 0.75)  # modelo fora da tabela: janela dos modelos atuais
+
+
+class LLMRespostaFixa(LLMCompartilhado):
+    """
+    Devolve sempre a mesma resposta final, sem chamar a API – ex.: outline reaproveitado
+    pelo cache semântico (comum.outline_cache). Registrado como hit (sem custo).
+    """
+
+    def __init__(self, resposta: str, model: str, tarefa: str = ""):
+        super().__init__(model=model, temperature=None, tarefa=tarefa)
+        self.resposta = resposta
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        canal = streaming.canal_atual()
+        texto = f"Thought: reaproveitando resposta pronta\nFinal Answer: {self.resposta}"
+        if canal is not None:
+            canal.progresso(self.tarefa, "inicio", modelo=self.model, prompt_tokens=0)
+        llm_uso.registrar(self.tarefa, self.model, 0.0, cache="hit")
+        if canal is not None and streaming.transmite(self.tarefa):
+            streaming.FiltroRespostaFinal(canal).receber(texto)
+        if canal is not None:
+            canal.progresso(self.tarefa, "fim", cache="hit")
+        return texto
+
+
+@lru_cache(maxsize=None)
+def _llm_por_config(modelo: str, temperatura: float | None, tarefa: str) -> LLMCompartilhado:
+    return LLMCompartilhado(model=modelo, temperature=temperatura, tarefa=tarefa)
+
+
+def obter_llm(modelo: str | None = None, temperatura: float | None = 0.4, tarefa: str = "") -> LLMCompartilhado:
+    """Instância compartilhada para (modelo, temperatura, tarefa); todas usam o mesmo pool de conexões."""
+    return _llm_por_config(modelo or MODELO_PADRAO, temperatura, tarefa)
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from comum.config import DIR_DADOS, env_int
+
+# -------------------------------
+# Cache exato (em disco) de respostas do LLM – opcional
+# -------------------------------
+# Retentativas, reexecuções após falha tardia e regerações com só o catálogo
+# alterado reenviam prompts idênticos nas primeiras tarefas (intro, outline...).
+# A chave é o hash de modelo + parâmetros + lista completa de mensagens; qualquer
+# byte diferente é outra entrada. O diretório é limitado por tamanho: ao passar do
+# teto, removem-se as entradas usadas há mais tempo (mtime é renovado a cada hit).
+LLM_CACHE_ATIVO = os.getenv("LLM_CACHE_ATIVO", "0") not in ("0", "false", "False", "")
+DIR_CACHE_LLM = DIR_DADOS / "llm_cache"
+LLM_CACHE_MAX_BYTES = env_int("LLM_CACHE_MAX_MB", 200) * 1024 * 1024
+
+_lock = threading.Lock()
+_bytes_total: int | None = None  # calculado na 1ª gravação
+_stats = {"hits": 0, "misses": 0, "gravacoes": 0, "removidas": 0}
+
+
+def chave(params: dict) -> str:
+    bruto = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def _caminho(k: str):
+    return DIR_CACHE_LLM / k[:2] / f"{k}.json"
+
+
+def ler(k: str) -> str | None:
+    caminho = _caminho(k)
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            resposta = json.load(f)["resposta"]
+        os.utime(caminho)  # LRU: entrada usada agora
+    except (OSError, ValueError, KeyError):
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    with _lock:
+        _stats["hits"] += 1
+    return resposta
+
+
+def _entradas() -> list[tuple[float, int, object]]:
+    """(mtime, tamanho, caminho) de cada entrada; ignora as removidas no meio da varredura."""
+    entradas = []
+    for caminho in DIR_CACHE_LLM.glob("*/*.json"):
+        try:
+            st = caminho.stat()
+        except OSError:
+            continue
+        entradas.append((st.st_mtime, st.st_size, caminho))
+    return entradas
+
+
+def _tamanho_diretorio() -> int:
+    return sum(tam for _, tam, _ in _entradas())
+
+
+def _despejar() -> None:
+    """Remove as entradas menos recentes até caber no teto (chamado com _lock)."""
+    global _bytes_total
+    entradas = sorted(_entradas(), key=lambda e: e[0])
+    _bytes_total = sum(tam for _, tam, _ in entradas)
+    alvo = int(LLM_CACHE_MAX_BYTES * 0.9)  # folga para não despejar a cada gravação
+    for _, tam, caminho in entradas:
+        if _bytes_total <= alvo:
+            break
+        try:
+            caminho.unlink()
+        except OSError:
+            continue
+        _bytes_total -= tam
+        _stats["removidas"] += 1
+
+
+def gravar(k: str, params: dict, resposta: str) -> None:
+    global _bytes_total
+    destino = _caminho(k)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"ts": time.time(), "modelo": params.get("model"), "resposta": resposta}, f, ensure_ascii=False)
+    tamanho = tmp.stat().st_size
+    os.replace(tmp, destino)
+    with _lock:
+        if _bytes_total is None:
+            _bytes_total = _tamanho_diretorio()
+        else:
+            _bytes_total += tamanho
+        _stats["gravacoes"] += 1
+        if _bytes_total > LLM_CACHE_MAX_BYTES:
+            _despejar()
+
+
+def estatisticas() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        bytes_total = _bytes_total
+    consultas = stats["hits"] + stats["misses"]
+    if bytes_total is None and DIR_CACHE_LLM.exists():
+        bytes_total = _tamanho_diretorio()
+    return {
+        "ativo": LLM_CACHE_ATIVO,
+        **stats,
+        "taxa_hit": round(stats["hits"] / consultas, 3) if consultas else None,
+        "bytes": bytes_total or 0,
+        "max_bytes": LLM_CACHE_MAX_BYTES,
+    }
@@ -0,0 +1,263 @@
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable
+
+from comum.config import DIR_DADOS, env_float, env_int
+from comum.tokens import contar_tokens_mensagens
+
+# -------------------------------
+# Dublê do LLM: gravação/reprodução de sessões e respostas sintéticas
+# -------------------------------
+# LLM_MODO (vale para todas as crews, via comum.llm):
+#   real        – chamadas à OpenAI (padrão)
+#   gravar      – chamadas reais + grava cada resposta em LLM_FIXTURES_DIR (hash do prompt)
+#   reproduzir  – responde só com as fixtures gravadas; prompt sem fixture -> FixtureAusente
+#                 (ou resposta sintética se LLM_REPRODUZIR_FALLBACK=sintetico)
+#   sintetico   – resposta gerada localmente, determinística por prompt, com latência
+#                 sorteada de LLM_SINTETICO_LATENCIA (ver `_amostrar_latencia_ms`)
+# Sem chave da OpenAI e sem rede: serve para benchmark da orquestração e teste de carga.
+# Nos modos reproduzir/sintetico a pesquisa também fica congelada: SERP e páginas dos
+# concorrentes saem só do cache em disco (mesmo expirado), sem SerpAPI nem download –
+# o texto da pesquisa não muda entre execuções e os prompts continuam batendo com as
+# fixtures. Consulta sem cache vira pesquisa vazia; para reproduzir uma sessão gravada,
+# copie junto DIR_DADOS/serp_cache e DIR_DADOS/paginas_cache da gravação.
+LLM_MODO = os.getenv("LLM_MODO", "real").strip().lower()
+DIR_FIXTURES = Path(os.getenv("LLM_FIXTURES_DIR") or DIR_DADOS / "llm_fixtures")
+LLM_REPRODUZIR_FALLBACK = os.getenv("LLM_REPRODUZIR_FALLBACK", "").strip().lower()
+# Reproduz também a latência gravada (benchmark realista) em vez de responder na hora
+LLM_REPRODUZIR_LATENCIA = os.getenv("LLM_REPRODUZIR_LATENCIA", "0") not in ("0", "false", "False", "")
+# "fixa:800" | "uniforme:300,1500" | "lognormal:900,0.5" (mediana em ms, sigma) | "0"
+LLM_SINTETICO_LATENCIA = os.getenv("LLM_SINTETICO_LATENCIA", "0")
+LLM_SINTETICO_MS_POR_TOKEN = env_float("LLM_SINTETICO_MS_POR_TOKEN", 0.0)
+LLM_SINTETICO_TOKENS = env_int("LLM_SINTETICO_TOKENS", 300)
+LLM_SINTETICO_SEMENTE = os.getenv("LLM_SINTETICO_SEMENTE", "")
+
+_PALAVRAS = (
+    "cuidado paciente tratamento rotina sinais avaliação orientação prevenção exemplo prática "
+    "resultado acompanhamento estratégia cliente manejo indicador processo etapa"
+).split()
+
+
+class FixtureAusente(RuntimeError):
+    pass
+
+
+def simulado() -> bool:
+    return LLM_MODO in ("reproduzir", "sintetico")
+
+
+def chave_fixture(params: dict) -> str:
+    bruto = json.dumps(
+        {k: params[k] for k in ("model", "messages", "temperature", "stop", "tools") if k in params},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def _caminho(chave: str):
+    return DIR_FIXTURES / chave[:2] / f"{chave}.json"
+
+
+def _uso(prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens, prompt_tokens_details=None)
+
+
+def gravar(params: dict, conteudo: str, uso, latencia_ms: float = 0.0) -> None:
+    destino = _caminho(chave_fixture(params))
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    registro = {
+        "modelo": params.get("model"),
+        "mensagens": params.get("messages"),
+        "conteudo": conteudo,
+        "prompt_tokens": getattr(uso, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(uso, "completion_tokens", 0) or 0,
+        "latencia_ms": round(latencia_ms, 1),
+    }
+    tmp = destino.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(registro, f, ensure_ascii=False)
+    os.replace(tmp, destino)
+
+
+def _amostrar_latencia_ms(rng: random.Random, tokens_saida: int) -> float:
+    tipo, _, args = LLM_SINTETICO_LATENCIA.partition(":")
+    valores = [float(v) for v in args.split(",") if v.strip()]
+    if tipo == "fixa" and valores:
+        base = valores[0]
+    elif tipo == "uniforme" and len(valores) == 2:
+        base = rng.uniform(valores[0], valores[1])
+    elif tipo == "lognormal" and len(valores) == 2:
+        base = rng.lognormvariate(math.log(valores[0]), valores[1])
+    else:
+        base = 0.0
+    return base + tokens_saida * LLM_SINTETICO_MS_POR_TOKEN
+
+
+def _texto_sintetico(rng: random.Random, n_tokens: int) -> str:
+    """HTML plausível (h2 numerados + parágrafos) com ~n_tokens, no formato ReAct esperado pela crewai."""
+    blocos, usados, secao = [], 0, 1
+    while usados < n_tokens:
+        blocos.append(f"<h2>{secao}. {' '.join(rng.choices(_PALAVRAS, k=4)).capitalize()}</h2>")
+        paragrafo = " ".join(rng.choices(_PALAVRAS, k=40))
+        blocos.append(f"<p>{paragrafo.capitalize()}.</p>")
+        usados += 60
+        secao += 1
+    return "Thought: I now can give a great answer\nFinal Answer: " + "\n".join(blocos)
+
+
+# Saída estruturada (output_pydantic): o modelo pedido vem da própria tarefa – no
+# início de cada Task da crewai (TaskStartedEvent, emitido na thread dela) – ou do
+# conversor (comum.saidas.ConversorSaida, via `saida_pedida`), e a instância mínima
+# válida é montada do model_json_schema(); nunca do texto do prompt. Sem modelo
+# conhecido a resposta é texto livre. No modo lote a requisição é respondida em outra
+# thread: `anotar` guarda o modelo pela chave da requisição antes de ela ir para o lote.
+_saida_atual: contextvars.ContextVar[tuple[type, bool] | None] = contextvars.ContextVar("saida_atual", default=None)
+_saidas_por_chave: dict[str, tuple[type, bool]] = {}
+_tarefas_acompanhadas = False
+
+
+@contextmanager
+def saida_pedida(modelo: type, so_json: bool = True):
+    """Chamadas dentro do bloco pedem `modelo` (so_json: só o JSON, sem o formato ReAct)."""
+    token = _saida_atual.set((modelo, so_json))
+    try:
+        yield
+    finally:
+        _saida_atual.reset(token)
+
+
+def acompanhar_tarefas() -> None:
+    """Passa a ler o output_pydantic/output_json de cada Task da crewai (idempotente)."""
+    global _tarefas_acompanhadas
+    if _tarefas_acompanhadas:
+        return
+    from crewai.utilities.events import TaskCompletedEvent, TaskFailedEvent, TaskStartedEvent, crewai_event_bus
+
+    def _inicio(_, evento) -> None:
+        modelo = getattr(evento.task, "output_pydantic", None) or getattr(evento.task, "output_json", None)
+        _saida_atual.set((modelo, False) if modelo else None)
+
+    def _fim(_, evento) -> None:
+        _saida_atual.set(None)
+
+    crewai_event_bus.register_handler(TaskStartedEvent, _inicio)
+    crewai_event_bus.register_handler(TaskCompletedEvent, _fim)
+    crewai_event_bus.register_handler(TaskFailedEvent, _fim)
+    _tarefas_acompanhadas = True
+
+
+def anotar(params: dict) -> None:
+    """Guarda o modelo pedido na thread atual para quando `params` for respondida em outra (lote)."""
+    pedida = _saida_atual.get()
+    if pedida is not None:
+        _saidas_por_chave[chave_fixture(params)] = pedida
+
+
+def _tipo_json_schema(schema: dict, definicoes: dict) -> tuple:
+    """JSON Schema (response_format ou model_json_schema()) como árvore de tipos."""
+    if "$ref" in schema:
+        return _tipo_json_schema(definicoes.get(schema["$ref"].rsplit("/", 1)[-1], {}), definicoes)
+    if "anyOf" in schema:
+        opcoes = [s for s in schema["anyOf"] if s.get("type") != "null"] or [{}]
+        return _tipo_json_schema(opcoes[0], definicoes)
+    tipo = schema.get("type")
+    if tipo == "object":
+        propriedades = schema.get("properties") or {}
+        if not propriedades:
+            return ("dict",)
+        return ("objeto", {nome: _tipo_json_schema(sub, definicoes) for nome, sub in propriedades.items()})
+    if tipo == "array":
+        return ("lista", _tipo_json_schema(schema.get("items") or {}, definicoes))
+    return ("escalar", {"integer": "int", "number": "float", "boolean": "bool"}.get(tipo, "str"))
+
+
+def _estrutura_params(params: dict, chave: str) -> tuple[tuple, bool] | None:
+    formato = params.get("response_format") or {}
+    schema = (formato.get("json_schema") or {}).get("schema") if formato.get("type") == "json_schema" else None
+    pedida = _saida_atual.get() or _saidas_por_chave.pop(chave, None)
+    if schema is None and pedida is not None:
+        modelo, so_json = pedida
+        schema = modelo.model_json_schema()
+    else:
+        so_json = True
+    if schema:
+        return _tipo_json_schema(schema, schema.get("$defs") or schema.get("definitions") or {}), so_json
+    if formato.get("type") == "json_object":
+        return ("dict",), True
+    return None
+
+
+def _instancia(tipo: tuple, rng: random.Random):
+    if tipo[0] == "objeto":
+        return {nome: _instancia(sub, rng) for nome, sub in tipo[1].items()}
+    if tipo[0] == "lista":
+        return [_instancia(tipo[1], rng) for _ in range(rng.randint(2, 5))]
+    if tipo[0] == "dict":
+        return {}
+    nome = tipo[1]
+    if nome == "int":
+        return rng.randint(1, 10)
+    if nome == "float":
+        return round(rng.uniform(0, 10), 2)
+    if nome == "bool":
+        return True
+    return " ".join(rng.choices(_PALAVRAS, k=4)).capitalize()
+
+
+def _sintetico(params: dict, chave: str) -> tuple[str, SimpleNamespace, float]:
+    rng = random.Random(f"{LLM_SINTETICO_SEMENTE}:{chave}")
+    estrutura = _estrutura_params(params, chave)
+    if estrutura is None:
+        conteudo = _texto_sintetico(rng, LLM_SINTETICO_TOKENS)
+    else:
+        tipo, so_json = estrutura
+        corpo = json.dumps(_instancia(tipo, rng), ensure_ascii=False)
+        conteudo = corpo if so_json else "Thought: I now can give a great answer\nFinal Answer: " + corpo
+    prompt_tokens = contar_tokens_mensagens(params.get("messages") or [])
+    completion_tokens = max(1, len(conteudo) // 4)
+    return conteudo, _uso(prompt_tokens, completion_tokens), _amostrar_latencia_ms(rng, completion_tokens)
+
+
+def completar(params: dict, ao_receber: Callable[[str], None] | None = None) -> tuple[str, None, SimpleNamespace]:
+    """
+    Resposta do dublê (modos reproduzir/sintetico) no mesmo formato de LLMCompartilhado._completar.
+    Com `ao_receber`, entrega o texto em pedaços espalhados pela latência (simula streaming).
+    """
+    chave = chave_fixture(params)
+    registro = None
+    if LLM_MODO == "reproduzir":
+        try:
+            with open(_caminho(chave), encoding="utf-8") as f:
+                registro = json.load(f)
+        except (OSError, ValueError):
+            if LLM_REPRODUZIR_FALLBACK != "sintetico":
+                raise FixtureAusente(f"Sem fixture para o prompt {chave[:12]} (modelo {params.get('model')}).")
+    if registro is not None:
+        conteudo = registro.get("conteudo", "")
+        uso = _uso(registro.get("prompt_tokens", 0), registro.get("completion_tokens", 0))
+        latencia_ms = registro.get("latencia_ms", 0.0) if LLM_REPRODUZIR_LATENCIA else 0.0
+    else:
+        conteudo, uso, latencia_ms = _sintetico(params, chave)
+
+    if ao_receber is None:
+        time.sleep(latencia_ms / 1000)
+        return conteudo, None, uso
+    pedacos = [conteudo[i:i + 16] for i in range(0, len(conteudo), 16)] or [""]
+    pausa = latencia_ms / 1000 / len(pedacos)
+    for pedaco in pedacos:
+        time.sleep(pausa)
+        ao_receber(pedaco)
+    return conteudo, None, uso
+
+
+if simulado():
+    acompanhar_tarefas()
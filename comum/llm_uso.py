@@ -0,0 +1,191 @@
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from comum.config import DIR_DADOS, env_float, env_json
+from comum.contexto import execucao_atual
+from comum.custos import acumular_llm
+
+# -------------------------------
+# Registro de chamadas ao LLM: latência, tokens e custo por tarefa/modelo/cliente
+# -------------------------------
+ARQ_USO_LLM = DIR_DADOS / "llm_uso.jsonl"
+
+# US$ por 1M de tokens: (entrada, entrada em cache, saída). Prefixo mais longo vence.
+# Ajustável via LLM_PRECOS, ex.: {"gpt-4o-mini": [0.15, 0.075, 0.6]}
+PRECOS_PADRAO = {
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+}
+PRECOS = {**PRECOS_PADRAO, **{k: tuple(v) for k, v in env_json("LLM_PRECOS", {}).items()}}
+# Chamadas via Batch API (comum.lote) custam uma fração do preço normal
+LLM_LOTE_FATOR_PRECO = env_float("LLM_LOTE_FATOR_PRECO", 0.5)
+
+_lock = threading.Lock()
+
+
+def preco(modelo: str) -> tuple[float, float, float]:
+    for prefixo in sorted(PRECOS, key=len, reverse=True):
+        if modelo.startswith(prefixo):
+            return PRECOS[prefixo]
+    return 0.0, 0.0, 0.0
+
+
+def custo_usd(modelo: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    entrada, entrada_cache, saida = preco(modelo)
+    novos = max(prompt_tokens - cached_tokens, 0)
+    return (novos * entrada + cached_tokens * entrada_cache + completion_tokens * saida) / 1_000_000
+
+
+def registrar(tarefa: str, modelo: str, latencia_ms: float, prompt_tokens: int = 0,
+              completion_tokens: int = 0, cached_tokens: int = 0, cache: str = "miss",
+              prompt_tokens_estimados: int = 0, cortado: bool = False) -> None:
+    """
+    Anexa uma chamada ao registro (cache: 'miss' = chamada paga, 'hit' = cache local,
+    'simulado' = dublê de comum.llm_simulado, sem custo; 'hedge' = tentativa duplicada
+    cancelada, cobrada à parte; 'lote' = Batch API, com LLM_LOTE_FATOR_PRECO).
+    `prompt_tokens_estimados`/`cortado` vêm da contagem prévia (comum.orcamento_tokens).
+    """
+    execucao = execucao_atual()
+    custo = 0.0
+    if cache in ("miss", "hedge", "lote"):
+        custo = custo_usd(modelo, prompt_tokens, completion_tokens, cached_tokens)
+        if cache == "lote":
+            custo *= LLM_LOTE_FATOR_PRECO
+    reg = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "execucao": execucao.id,
+        "cliente": execucao.cliente,
+        "rota": execucao.rota,
+        "tarefa": tarefa,
+        "modelo": modelo,
+        "cache": cache,
+        "latencia_ms": round(latencia_ms, 1),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "prompt_tokens_estimados": prompt_tokens_estimados,
+        "cortado": cortado,
+        "custo_usd": round(custo, 6),
+    }
+    with _lock:
+        ARQ_USO_LLM.parent.mkdir(parents=True, exist_ok=True)
+        with open(ARQ_USO_LLM, "a", encoding="utf-8") as f:
+            f.write(json.dumps(reg, ensure_ascii=False) + "\n")
+    acumular_llm(tarefa, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                 cached_tokens=cached_tokens, custo_usd=custo)
+
+
+def _ler_registros():
+    try:
+        with open(ARQ_USO_LLM, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    yield json.loads(linha)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def _novo_resumo() -> dict:
+    return {"chamadas": 0, "hits": 0, "lote": 0, "hedges": 0, "custo_hedge_usd": 0.0, "latencia_total_ms": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "prompt_tokens_pagos": 0, "custo_usd": 0.0}
+
+
+def _fechar_resumo(r: dict, custo_total: float) -> dict:
+    pagas = (r["chamadas"] - r["hits"]) or 1  # custo médio inclui o extra dos hedges
+    return {
+        "chamadas": r["chamadas"],
+        "hits_cache": r["hits"],
+        "chamadas_lote": r["lote"],
+        "hedges_cancelados": r["hedges"],
+        "custo_hedge_usd": round(r["custo_hedge_usd"], 4),
+        "latencia_media_ms": round(r["latencia_total_ms"] / (r["chamadas"] or 1), 1),
+        "prompt_tokens": r["prompt_tokens"],
+        "completion_tokens": r["completion_tokens"],
+        "cached_tokens": r["cached_tokens"],
+        # fração do prompt (chamadas pagas) servida pelo cache de prefixo do provedor; só vale a
+        # partir de 1024 tokens idênticos, então na prática só a linkagem (catálogo fixo antes
+        # dos links externos da requisição) chega lá
+        "taxa_tokens_em_cache": round(r["cached_tokens"] / r["prompt_tokens_pagos"], 3)
+        if r["prompt_tokens_pagos"] else None,
+        "custo_usd": round(r["custo_usd"], 4),
+        "custo_medio_usd": round(r["custo_usd"] / pagas, 5),
+        "participacao_custo": round(r["custo_usd"] / custo_total, 3) if custo_total else None,
+    }
+
+
+def relatorio(dias: int = 30, cliente: str | None = None) -> dict:
+    """Latência, tokens e custo dos últimos `dias`, por tarefa, modelo, cliente e rota."""
+    desde = (datetime.now() - timedelta(days=dias)).isoformat(timespec="seconds")
+    grupos = {nome: defaultdict(_novo_resumo) for nome in ("tarefa", "modelo", "cliente", "rota")}
+    total = _novo_resumo()
+
+    for reg in _ler_registros():
+        if str(reg.get("ts", "")) < desde or (cliente and reg.get("cliente") != cliente):
+            continue
+        alvos = [grupos[nome][reg.get(nome) or "(sem)"] for nome in grupos] + [total]
+        for r in alvos:
+            if reg.get("cache") == "hedge":
+                # tentativa perdedora: só soma gasto, não é chamada da tarefa
+                r["hedges"] += 1
+                r["custo_hedge_usd"] += reg.get("custo_usd", 0.0) or 0.0
+                r["custo_usd"] += reg.get("custo_usd", 0.0) or 0.0
+                continue
+            r["chamadas"] += 1
+            r["hits"] += reg.get("cache") == "hit"
+            r["lote"] += reg.get("cache") == "lote"
+            r["latencia_total_ms"] += reg.get("latencia_ms", 0.0)
+            for campo in ("prompt_tokens", "completion_tokens", "cached_tokens", "custo_usd"):
+                r[campo] += reg.get(campo, 0) or 0
+            if reg.get("cache", "miss") in ("miss", "lote"):
+                r["prompt_tokens_pagos"] += reg.get("prompt_tokens", 0) or 0
+
+    custo_total = total["custo_usd"]
+    return {
+        "periodo_dias": dias,
+        "total": _fechar_resumo(total, custo_total),
+        **{
+            f"por_{nome}": {k: _fechar_resumo(v, custo_total) for k, v in sorted(g.items())}
+            for nome, g in grupos.items()
+        },
+    }
+
+
+def execucoes(dias: int = 1, cliente: str | None = None, limite: int = 50) -> list[dict]:
+    """Consumo das execuções (requisições) mais recentes: tokens previstos x reais, cortes e custo por tarefa."""
+    desde = (datetime.now() - timedelta(days=dias)).isoformat(timespec="seconds")
+    por_execucao: dict[str, dict] = {}
+    for reg in _ler_registros():
+        if str(reg.get("ts", "")) < desde or not reg.get("execucao") or (cliente and reg.get("cliente") != cliente):
+            continue
+        e = por_execucao.setdefault(reg["execucao"], {
+            "execucao": reg["execucao"], "cliente": reg.get("cliente"), "rota": reg.get("rota"),
+            "inicio": reg["ts"], "fim": reg["ts"], "chamadas": 0, "cortes": 0,
+            "prompt_tokens_estimados": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+            "custo_usd": 0.0,
+            "por_tarefa": defaultdict(lambda: {"chamadas": 0, "prompt_tokens_estimados": 0, "prompt_tokens": 0,
+                                               "completion_tokens": 0, "cached_tokens": 0, "cortes": 0}),
+        })
+        e["fim"] = reg["ts"]
+        t = e["por_tarefa"][reg.get("tarefa") or "(sem)"]
+        for alvo in (e, t):
+            alvo["chamadas"] += 1
+            alvo["cortes"] += bool(reg.get("cortado"))
+            for campo in ("prompt_tokens_estimados", "prompt_tokens", "completion_tokens", "cached_tokens"):
+                alvo[campo] += reg.get(campo, 0) or 0
+        e["custo_usd"] += reg.get("custo_usd", 0.0) or 0.0
+    recentes = sorted(por_execucao.values(), key=lambda e: e["inicio"], reverse=True)[:limite]
+    for e in recentes:
+        e["custo_usd"] = round(e["custo_usd"], 4)
+        e["taxa_tokens_em_cache"] = round(e["cached_tokens"] / e["prompt_tokens"], 3) if e["prompt_tokens"] else None
+        e["por_tarefa"] = dict(e["por_tarefa"])
+    return recentes
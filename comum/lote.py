@@ -0,0 +1,428 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable
+
+from filelock import FileLock, Timeout
+
+from comum import llm_simulado
+from comum.concorrencia import LLM_MAX_RETRIES
+from comum.config import DIR_DADOS, env_float, env_int
+from comum.contexto import SUFIXO_BACKLINK, definir_execucao
+from comum.custos import medir
+
+# -------------------------------
+# Modo lote: geração em massa pela Batch API do provedor (campanhas _backlink)
+# -------------------------------
+# Cada pauta enfileirada vira um "trabalho" que roda a crew normalmente numa thread;
+# em vez de ir direto à API, cada chamada ao LLM fica pendente no coletor. Quando
+# todos os trabalhos ativos estão esperando o LLM (ou LOTE_ESPERA_MAX_S passou), as
+# requisições pendentes – na prática a mesma etapa de vários trabalhos – viram um
+# arquivo JSONL submetido à Batch API (50% do preço, limite de taxa separado do
+# tráfego interativo). O coletor consulta o lote a cada LOTE_POLL_S e, com os
+# resultados, cada trabalho segue para a etapa seguinte.
+# LLM_LOTE_PROVEDOR: openai | local (dublê: responde com comum.llm_simulado – sintético,
+# com JSON válido quando a requisição pede saída estruturada,
+# ou fixtures do modo reproduzir – sem rede, para teste).
+# Vários workers (uvicorn --workers N) dividem o mesmo trabalhos.json: toda escrita
+# é feita sob uma trava de arquivo, e cada trabalho tem um "dono" – o processo que o
+# roda, que segura a trava DIR_LOTE/donos/<dono>.lock enquanto vive. No reinício só
+# é retomado (e reivindicado) o trabalho cujo dono morreu, por um único worker.
+LLM_LOTE_PROVEDOR = os.getenv("LLM_LOTE_PROVEDOR", "openai").strip().lower()
+LOTE_MAX_TRABALHOS = env_int("LOTE_MAX_TRABALHOS", 100)  # trabalhos rodando ao mesmo tempo
+LOTE_ESPERA_MAX_S = env_float("LOTE_ESPERA_MAX_S", 120)
+LOTE_MAX_REQUISICOES = env_int("LOTE_MAX_REQUISICOES", 5000)  # por arquivo (a API aceita até 50 mil)
+LOTE_POLL_S = env_float("LOTE_POLL_S", 60)
+LOTE_JANELA_CONCLUSAO = os.getenv("LOTE_JANELA_CONCLUSAO", "24h")
+LOTE_LOCAL_ATRASO_S = env_float("LOTE_LOCAL_ATRASO_S", 0)
+
+DIR_LOTE = DIR_DADOS / "lote"
+ARQ_TRABALHOS = DIR_LOTE / "trabalhos.json"
+DIR_DONOS = DIR_LOTE / "donos"
+# Lotes já entregues que continuam visíveis em /lote/estatisticas
+LOTE_HISTORICO = 20
+ENDPOINT = "/v1/chat/completions"
+
+_em_lote: contextvars.ContextVar[bool] = contextvars.ContextVar("em_lote", default=False)
+
+
+def em_lote() -> bool:
+    """True dentro de um trabalho do modo lote (as chamadas ao LLM vão para o coletor)."""
+    return _em_lote.get()
+
+
+# ---- Provedores ----
+
+class ProvedorOpenAI:
+    def _cliente(self):
+        from comum.llm import cliente_openai  # import tardio: comum.llm importa este módulo
+        # fora do controle de concorrência: as retentativas ficam com o próprio cliente
+        return cliente_openai().with_options(max_retries=LLM_MAX_RETRIES)
+
+    def submeter(self, arquivo: Path) -> str:
+        cliente = self._cliente()
+        with open(arquivo, "rb") as f:
+            entrada = cliente.files.create(file=f, purpose="batch")
+        lote = cliente.batches.create(
+            input_file_id=entrada.id, endpoint=ENDPOINT, completion_window=LOTE_JANELA_CONCLUSAO,
+        )
+        return lote.id
+
+    def consultar(self, id_lote: str) -> tuple[str, str | None]:
+        """('pendente', None) | ('concluido', jsonl de saída) | ('falhou', jsonl parcial ou '')."""
+        cliente = self._cliente()
+        lote = cliente.batches.retrieve(id_lote)
+        if lote.status not in ("completed", "failed", "expired", "cancelled"):
+            return "pendente", None
+        # expirado/cancelado pode ter saída parcial; o que faltar vira erro no trabalho
+        partes = [cliente.files.content(arquivo).text
+                  for arquivo in (lote.output_file_id, lote.error_file_id) if arquivo]
+        return ("concluido" if lote.status == "completed" else "falhou"), "\n".join(partes)
+
+
+class ProvedorLocal:
+    """Dublê da Batch API: processa o arquivo localmente com comum.llm_simulado."""
+
+    def __init__(self):
+        self._lotes: dict[str, tuple[float, Path]] = {}
+        llm_simulado.acompanhar_tarefas()  # saída estruturada: o modelo vem da Task, não do prompt
+
+    def submeter(self, arquivo: Path) -> str:
+        id_lote = f"local_{uuid.uuid4().hex[:12]}"
+        self._lotes[id_lote] = (time.time(), arquivo)
+        return id_lote
+
+    def consultar(self, id_lote: str) -> tuple[str, str | None]:
+        inicio, arquivo = self._lotes[id_lote]
+        if time.time() - inicio < LOTE_LOCAL_ATRASO_S:
+            return "pendente", None
+        linhas = []
+        with open(arquivo, encoding="utf-8") as f:
+            for bruto in f:
+                requisicao = json.loads(bruto)
+                saida = {"id": f"req_{uuid.uuid4().hex[:12]}", "custom_id": requisicao["custom_id"],
+                         "response": None, "error": None}
+                try:
+                    conteudo, _, uso = llm_simulado.completar(requisicao["body"])
+                except llm_simulado.FixtureAusente as exc:
+                    saida["error"] = {"code": "fixture_ausente", "message": str(exc)}
+                else:
+                    saida["response"] = {"status_code": 200, "body": {
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": conteudo}}],
+                        "usage": {"prompt_tokens": uso.prompt_tokens, "completion_tokens": uso.completion_tokens},
+                    }}
+                linhas.append(json.dumps(saida, ensure_ascii=False))
+        del self._lotes[id_lote]
+        return "concluido", "\n".join(linhas)
+
+
+def _uso(dados: dict) -> SimpleNamespace:
+    detalhes = dados.get("prompt_tokens_details") or {}
+    return SimpleNamespace(
+        prompt_tokens=dados.get("prompt_tokens", 0),
+        completion_tokens=dados.get("completion_tokens", 0),
+        prompt_tokens_details=SimpleNamespace(cached_tokens=detalhes.get("cached_tokens", 0)),
+    )
+
+
+# ---- Coletor: agrupa as chamadas pendentes dos trabalhos em lotes ----
+
+class _Pendente:
+    def __init__(self, params: dict):
+        self.params = params
+        self.desde = time.time()
+        self.pronto = threading.Event()
+        self.conteudo = ""
+        self.uso = None
+        self.erro: str | None = None
+
+
+class ColetorLote:
+    def __init__(self, provedor):
+        self.provedor = provedor
+        self._cond = threading.Condition()
+        self._pendentes: dict[str, _Pendente] = {}
+        self._em_voo = 0  # requisições em lotes já submetidos
+        self._ativos = 0  # trabalhos enfileirados e ainda não encerrados
+        self._thread: threading.Thread | None = None
+        self._lotes: dict[str, dict] = {}  # só os em andamento
+        self._entregues: deque[dict] = deque(maxlen=LOTE_HISTORICO)
+        self.stats = {"lotes": 0, "requisicoes": 0, "erros": 0}
+
+    def trabalhos_recebidos(self, quantidade: int) -> None:
+        """Conta os trabalhos já na enfileiração, para o primeiro não disparar um lote sozinho."""
+        with self._cond:
+            self._ativos += quantidade
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="lote-coletor", daemon=True)
+                self._thread.start()
+
+    def trabalho_encerrado(self) -> None:
+        with self._cond:
+            self._ativos -= 1
+            self._cond.notify_all()
+
+    def completar(self, params: dict) -> tuple[str, None, SimpleNamespace]:
+        """Enfileira a chamada e bloqueia até o lote dela voltar (mesmo formato de LLMCompartilhado._completar)."""
+        pendente = _Pendente(params)
+        if isinstance(self.provedor, ProvedorLocal):  # respondida na thread do lote, não nesta
+            llm_simulado.anotar(params)
+        with self._cond:
+            self._pendentes[uuid.uuid4().hex] = pendente
+            self._cond.notify_all()
+        pendente.pronto.wait()
+        if pendente.erro:
+            raise RuntimeError(f"Lote: {pendente.erro}")
+        return pendente.conteudo, None, pendente.uso
+
+    def _deve_submeter(self) -> bool:
+        if not self._pendentes:
+            return False
+        mais_antiga = min(p.desde for p in self._pendentes.values())
+        return (
+            # todo trabalho que pode estar rodando espera o LLM
+            len(self._pendentes) + self._em_voo >= min(self._ativos, LOTE_MAX_TRABALHOS)
+            or len(self._pendentes) >= LOTE_MAX_REQUISICOES
+            or time.time() - mais_antiga >= LOTE_ESPERA_MAX_S
+        )
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._deve_submeter():
+                    self._cond.wait(timeout=1)
+                grupo = dict(list(self._pendentes.items())[:LOTE_MAX_REQUISICOES])
+                for chave in grupo:
+                    del self._pendentes[chave]
+                self._em_voo += len(grupo)
+            threading.Thread(target=self._processar, args=(grupo,), name="lote-poll", daemon=True).start()
+
+    def _processar(self, grupo: dict[str, _Pendente]) -> None:
+        """Escreve o JSONL, submete, consulta até concluir e entrega cada resultado ao seu trabalho."""
+        id_local = datetime.now().strftime("%Y%m%d%H%M%S") + "_" + uuid.uuid4().hex[:6]
+        arquivo = DIR_LOTE / "arquivos" / f"{id_local}.jsonl"
+        resultados: dict[str, dict] = {}
+        falha = None
+        info = None  # só existe depois da submissão
+        try:
+            arquivo.parent.mkdir(parents=True, exist_ok=True)
+            with open(arquivo, "w", encoding="utf-8") as f:
+                for custom_id, pendente in grupo.items():
+                    f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": ENDPOINT,
+                                        "body": pendente.params}, ensure_ascii=False) + "\n")
+            id_lote = self.provedor.submeter(arquivo)
+            info = {"id": id_lote, "arquivo": arquivo.name, "requisicoes": len(grupo),
+                    "submetido_em": datetime.now().isoformat(timespec="seconds"), "status": "pendente"}
+            with self._cond:
+                self._lotes[id_lote] = info
+                self.stats["lotes"] += 1
+                self.stats["requisicoes"] += len(grupo)
+            status, saida = self.provedor.consultar(id_lote)
+            while status == "pendente":
+                time.sleep(LOTE_POLL_S)
+                status, saida = self.provedor.consultar(id_lote)
+            info.update(status=status, concluido_em=datetime.now().isoformat(timespec="seconds"))
+            arquivo.with_name(f"{id_local}_saida.jsonl").write_text(saida or "", encoding="utf-8")
+            for linha in (saida or "").splitlines():
+                if linha.strip():
+                    registro = json.loads(linha)
+                    resultados[registro.get("custom_id")] = registro
+        except Exception as exc:  # falha de submissão/consulta derruba só os trabalhos deste lote
+            falha = f"{type(exc).__name__}: {exc}"
+
+        erros = 0
+        for custom_id, pendente in grupo.items():
+            registro = resultados.get(custom_id) or {}
+            resposta = registro.get("response") or {}
+            corpo = resposta.get("body") or {}
+            if falha or registro.get("error") or resposta.get("status_code") != 200:
+                pendente.erro = falha or json.dumps(registro.get("error") or corpo or "sem resultado no lote",
+                                                    ensure_ascii=False)
+                erros += 1
+            else:
+                pendente.conteudo = corpo["choices"][0]["message"].get("content") or ""
+                pendente.uso = _uso(corpo.get("usage") or {})
+            pendente.pronto.set()
+        with self._cond:
+            self.stats["erros"] += erros
+            self._em_voo -= len(grupo)
+            if info is not None:  # entregue: sai dos em andamento, fica só no histórico curto
+                if falha:
+                    info["status"] = "erro"
+                self._lotes.pop(info["id"], None)
+                self._entregues.append(info)
+            self._cond.notify_all()
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            return {
+                "provedor": LLM_LOTE_PROVEDOR,
+                **self.stats,
+                "trabalhos_ativos": self._ativos,
+                "pendentes": len(self._pendentes),
+                "em_voo": self._em_voo,
+                "ultimos_lotes": sorted([*self._entregues, *self._lotes.values()],
+                                        key=lambda l: l["submetido_em"])[-LOTE_HISTORICO:],
+            }
+
+
+coletor = ColetorLote(ProvedorLocal() if LLM_LOTE_PROVEDOR == "local" else ProvedorOpenAI())
+
+
+# ---- Fila de trabalhos (persistida em disco) ----
+
+def _trava_dono(dono: str) -> FileLock:
+    DIR_DONOS.mkdir(parents=True, exist_ok=True)
+    return FileLock(str(DIR_DONOS / f"{dono}.lock"))
+
+
+def _dono_vivo(dono: str | None) -> bool:
+    """O processo dono ainda segura a trava dele (a trava some com o processo)."""
+    if not dono:
+        return False
+    trava = _trava_dono(dono)
+    try:
+        trava.acquire(timeout=0)
+    except Timeout:
+        return True
+    trava.release()
+    (DIR_DONOS / f"{dono}.lock").unlink(missing_ok=True)
+    return False
+
+
+class FilaLote:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dono = uuid.uuid4().hex[:12]
+        self._trava_dono: FileLock | None = None
+        self._construtores: dict[str, Callable] = {}
+        self._executor = ThreadPoolExecutor(max_workers=LOTE_MAX_TRABALHOS, thread_name_prefix="lote-trabalho")
+
+    def registrar_construtores(self, construtores: dict[str, Callable]) -> None:
+        """cliente -> build_crew_*(tema, palavra_chave); registrado pela aplicação."""
+        self._construtores.update(construtores)
+
+    def _carregar(self) -> dict[str, dict]:
+        try:
+            with open(ARQ_TRABALHOS, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _salvar(self, dados: dict[str, dict]) -> None:
+        ARQ_TRABALHOS.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ARQ_TRABALHOS.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, ARQ_TRABALHOS)
+
+    @contextmanager
+    def _trancado(self):
+        """Leitura-alteração-escrita de trabalhos.json exclusiva entre threads e entre workers."""
+        ARQ_TRABALHOS.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, FileLock(str(ARQ_TRABALHOS) + ".lock"):
+            if self._trava_dono is None:  # este processo passa a ser dono de trabalhos
+                self._trava_dono = _trava_dono(self._dono)
+                self._trava_dono.acquire()
+            yield
+
+    def _atualizar(self, id_trabalho: str, **campos) -> None:
+        with self._trancado():
+            dados = self._carregar()
+            dados[id_trabalho].update(campos)
+            self._salvar(dados)
+
+    def enfileirar(self, cliente: str, itens: list[dict], backlink: bool = True) -> list[dict]:
+        """itens: [{"tema": "...", "palavra_chave": "..."}]; devolve os trabalhos criados."""
+        agora = datetime.now().isoformat(timespec="seconds")
+        novos = []
+        for item in itens:
+            palavra_chave = (item.get("palavra_chave") or "").strip()
+            if not palavra_chave:
+                continue
+            novos.append({
+                "id": uuid.uuid4().hex[:12],
+                "cliente": cliente,
+                "rota": cliente + SUFIXO_BACKLINK if backlink else cliente,
+                "tema": item.get("tema") or palavra_chave,
+                "palavra_chave": palavra_chave,
+                "estado": "fila",
+                "dono": self._dono,
+                "criado_em": agora,
+                "inicio": None, "fim": None, "html": None, "erro": None,
+            })
+        with self._trancado():
+            dados = self._carregar()
+            dados.update({t["id"]: t for t in novos})
+            self._salvar(dados)
+        coletor.trabalhos_recebidos(len(novos))
+        for trabalho in novos:
+            self._executor.submit(contextvars.copy_context().run, self._rodar, trabalho)
+        return novos
+
+    def retomar(self) -> int:
+        """
+        Reenfileira trabalhos interrompidos (reinício da aplicação no meio de uma campanha).
+        Cada um é reivindicado sob a trava: com vários workers, só o primeiro a chegar o
+        retoma; os de dono vivo (outro worker rodando) ficam onde estão.
+        """
+        with self._trancado():
+            dados = self._carregar()
+            interrompidos = [t for t in dados.values()
+                             if t["estado"] in ("fila", "rodando") and not _dono_vivo(t.get("dono"))]
+            for trabalho in interrompidos:
+                trabalho.update(estado="fila", dono=self._dono)
+            self._salvar(dados)
+        coletor.trabalhos_recebidos(len(interrompidos))
+        for trabalho in interrompidos:
+            self._executor.submit(contextvars.copy_context().run, self._rodar, trabalho)
+        return len(interrompidos)
+
+    def _rodar(self, trabalho: dict) -> None:
+        definir_execucao(trabalho["rota"], cliente=trabalho["cliente"])
+        _em_lote.set(True)
+        try:
+            self._atualizar(trabalho["id"], estado="rodando", inicio=datetime.now().isoformat(timespec="seconds"))
+            construtor = self._construtores[trabalho["cliente"]]
+            with medir(trabalho["tema"], trabalho["palavra_chave"]) as medicao:
+                medicao.montada(crew := construtor(trabalho["tema"], trabalho["palavra_chave"]))
+                resultado = medicao.resultado = crew.kickoff()
+        except Exception as exc:
+            self._atualizar(trabalho["id"], estado="erro", erro=f"{type(exc).__name__}: {exc}",
+                            fim=datetime.now().isoformat(timespec="seconds"))
+        else:
+            self._atualizar(trabalho["id"], estado="concluido", html=getattr(resultado, "raw", str(resultado)),
+                            fim=datetime.now().isoformat(timespec="seconds"))
+        finally:
+            coletor.trabalho_encerrado()
+
+    def listar(self, cliente: str | None = None, estado: str | None = None) -> list[dict]:
+        """Trabalhos sem o HTML (ver `obter`), mais recentes primeiro."""
+        trabalhos = [
+            {k: v for k, v in t.items() if k != "html"}
+            for t in self._carregar().values()
+            if (not cliente or t["cliente"] == cliente) and (not estado or t["estado"] == estado)
+        ]
+        return sorted(trabalhos, key=lambda t: t["criado_em"], reverse=True)
+
+    def obter(self, id_trabalho: str) -> dict | None:
+        return self._carregar().get(id_trabalho)
+
+    def parar(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._trava_dono is not None:  # encerramento limpo: a trava deste processo não fica para trás
+            self._trava_dono.release()
+            (DIR_DONOS / f"{self._dono}.lock").unlink(missing_ok=True)
+            self._trava_dono = None
+
+
+fila_lote = FilaLote()
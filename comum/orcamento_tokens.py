@@ -0,0 +1,86 @@
+import os
+
+from comum.config import env_int, env_json
+from comum.contexto import execucao_atual
+from comum.tokens import contar_tokens, contar_tokens_mensagens, cortar_meio_em_tokens
+
+# -------------------------------
+# Contagem prévia de tokens e orçamentos por tarefa / por execução
+# -------------------------------
+# Cada prompt já renderizado pela crewai é contado (tiktoken) ANTES do envio.
+# - Orçamento por tarefa (tokens de prompt por chamada): LLM_ORCAMENTOS_TAREFA,
+#   ex.: {"*": 12000, "linkagem": 9000, "revisor": 9000}. Nunca passa da janela do modelo.
+#   Estourou: LLM_ORCAMENTO_MODO=cortar (padrão) omite o meio da maior mensagem
+#   (preserva instruções do início e o fim); =falhar aborta. Mensagem que carrega o
+#   contexto das tarefas anteriores (o artigo em construção: desenvolvimento em diante)
+#   nunca é cortada – perderia parte do texto sem aviso –, a chamada aborta.
+# - Respostas do cache local (comum.llm_cache) não passam por aqui: não custam nada.
+# - Orçamento por execução (prompt + saída somados na requisição): LLM_ORCAMENTO_EXECUCAO
+#   (0 = sem limite). Estourou: aborta antes da chamada seguinte – não há o que cortar.
+LLM_ORCAMENTO_MODO = os.getenv("LLM_ORCAMENTO_MODO", "cortar").strip().lower()
+ORCAMENTOS_TAREFA = env_json("LLM_ORCAMENTOS_TAREFA", {})
+LLM_ORCAMENTO_EXECUCAO = env_int("LLM_ORCAMENTO_EXECUCAO", 0)
+
+
+class OrcamentoTokensExcedido(RuntimeError):
+    def __init__(self, mensagem: str, tarefa: str, tokens: int, limite: int):
+        super().__init__(mensagem)
+        self.tarefa = tarefa
+        self.tokens = tokens
+        self.limite = limite
+
+
+def limite_tarefa(tarefa: str, janela: int) -> int:
+    limite = ORCAMENTOS_TAREFA.get(tarefa) or ORCAMENTOS_TAREFA.get("*") or janela
+    return min(int(limite), janela)
+
+
+# Como a crewai anexa as saídas das tarefas de `context=` ao prompt (slice task_with_context)
+MARCADOR_CONTEXTO = "This is the context you're working with:"
+
+
+def _cortar(mensagens: list[dict], excesso: int, modelo: str) -> list[dict] | None:
+    """Corta o excesso da maior mensagem; None se ela traz o contexto das tarefas anteriores."""
+    mensagens = [dict(m) for m in mensagens]
+    maior = max(range(len(mensagens)), key=lambda i: len(mensagens[i].get("content") or ""))
+    conteudo = mensagens[maior].get("content") or ""
+    if MARCADOR_CONTEXTO in conteudo:
+        return None
+    limite = max(contar_tokens(conteudo, modelo) - excesso, 0)
+    mensagens[maior]["content"] = cortar_meio_em_tokens(conteudo, limite, modelo)
+    return mensagens
+
+
+def preparar(mensagens: list[dict], tarefa: str, modelo: str, janela: int) -> tuple[list[dict], int, bool]:
+    """
+    Aplica os orçamentos ao prompt renderizado.
+    Devolve (mensagens possivelmente cortadas, tokens de prompt estimados, houve corte).
+    """
+    tokens = contar_tokens_mensagens(mensagens, modelo)
+    limite = limite_tarefa(tarefa, janela)
+    cortado = False
+    if tokens > limite:
+        cortadas = None if LLM_ORCAMENTO_MODO == "falhar" else _cortar(mensagens, tokens - limite, modelo)
+        if cortadas is None:
+            raise OrcamentoTokensExcedido(
+                f"Prompt da tarefa '{tarefa}' tem {tokens} tokens (limite {limite}).", tarefa, tokens, limite
+            )
+        mensagens = cortadas
+        tokens = contar_tokens_mensagens(mensagens, modelo)
+        cortado = True
+
+    if LLM_ORCAMENTO_EXECUCAO:
+        consumo = execucao_atual().tokens
+        usados = consumo["prompt"] + consumo["saida"]
+        if usados + tokens > LLM_ORCAMENTO_EXECUCAO:
+            raise OrcamentoTokensExcedido(
+                f"Execução atingiria {usados + tokens} tokens (limite {LLM_ORCAMENTO_EXECUCAO}) na tarefa '{tarefa}'.",
+                tarefa, usados + tokens, LLM_ORCAMENTO_EXECUCAO,
+            )
+    return mensagens, tokens, cortado
+
+
+def contabilizar(prompt_tokens: int, saida_tokens: int) -> None:
+    consumo = execucao_atual().tokens
+    consumo["prompt"] += prompt_tokens
+    consumo["saida"] += saida_tokens
@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+from comum.config import DIR_DADOS, env_float, env_int
+from comum.llm import LLMCompartilhado, LLMRespostaFixa
+from comum.palavras_chave import canonizar
+
+# -------------------------------
+# Cache semântico do outline (H2/H3) por cliente
+# -------------------------------
+# Palavras-chave quase sinônimas do mesmo cliente ("unhas fracas" x "unha fraca e
+# quebradiça") geram estruturas praticamente iguais. Todo outline concluído é
+# guardado com um embedding local de (tema, palavra-chave); numa nova requisição
+# vale o mais parecido do MESMO cliente:
+#   cosseno >= OUTLINE_CACHE_LIMIAR_REUSO -> o outline guardado É a saída de
+#       tarefa_outline (LLMRespostaFixa): nenhuma chamada ao LLM;
+#   OUTLINE_CACHE_LIMIAR <= cosseno < reuso -> entra no prompt antes da matriz de
+#       cobertura e o agente o adapta. Não economiza a chamada (o prompt até cresce);
+#       só deixa a estrutura consistente com a já aprovada.
+# Reuso direto troca adaptação por custo: os títulos não são reescritos para a nova
+# palavra-chave, por isso o limiar de reuso é bem mais alto.
+# Só grava com o cache ativo. Registros mais velhos que OUTLINE_CACHE_TTL_DIAS
+# (0 = sem validade) ou além dos OUTLINE_CACHE_MAX_POR_CLIENTE mais recentes são
+# ignorados e, quando acumulam, o arquivo é reescrito só com os vigentes.
+# Embedding: n-gramas (radicais + trigramas de caracteres, sem acento) num vetor
+# de hashing – sem modelo externo, determinístico entre processos.
+OUTLINE_CACHE_ATIVO = os.getenv("OUTLINE_CACHE_ATIVO", "0") not in ("0", "false", "False", "")
+OUTLINE_CACHE_LIMIAR = env_float("OUTLINE_CACHE_LIMIAR", 0.75)
+OUTLINE_CACHE_LIMIAR_REUSO = env_float("OUTLINE_CACHE_LIMIAR_REUSO", 0.92)
+OUTLINE_CACHE_MAX_POR_CLIENTE = env_int("OUTLINE_CACHE_MAX_POR_CLIENTE", 500)
+OUTLINE_CACHE_TTL_DIAS = env_int("OUTLINE_CACHE_TTL_DIAS", 180)
+ARQ_OUTLINES = DIR_DADOS / "outlines.jsonl"
+DIMENSAO = 2048
+# Peso da palavra-chave x tema no embedding
+PESO_PALAVRA_CHAVE = 0.75
+
+
+def _atributos(texto: str) -> list[tuple[str, float]]:
+    texto = canonizar(texto, dobrar_acentos=True, ordenar=False)
+    palavras = [p.rstrip("s") if len(p) > 3 else p for p in re.findall(r"\w+", texto) if len(p) > 2]
+    atributos = [(f"w:{p[:6]}", 3.0) for p in palavras]
+    for p in palavras:
+        p = f" {p} "
+        atributos += [(f"c:{p[i:i + 3]}", 1.0) for i in range(len(p) - 2)]
+    return atributos
+
+
+def _vetor(texto: str) -> np.ndarray:
+    v = np.zeros(DIMENSAO, dtype=np.float32)
+    for atributo, peso in _atributos(texto):
+        h = int.from_bytes(hashlib.blake2b(atributo.encode("utf-8"), digest_size=8).digest(), "little")
+        v[h % DIMENSAO] += peso
+    norma = np.linalg.norm(v)
+    return v / norma if norma else v
+
+
+def embedding(tema: str, palavra_chave: str) -> np.ndarray:
+    v = PESO_PALAVRA_CHAVE * _vetor(palavra_chave) + (1 - PESO_PALAVRA_CHAVE) * _vetor(tema)
+    norma = np.linalg.norm(v)
+    return v / norma if norma else v
+
+
+@dataclass(frozen=True)
+class OutlineSemelhante:
+    outline: str
+    tema: str
+    palavra_chave: str
+    similaridade: float
+    estrutura: str = ""  # JSON do comum.saidas.Outline validado (registros antigos não têm)
+
+    def instrucao(self) -> str:
+        return (
+            f"Estrutura já aprovada para a palavra-chave semelhante '{self.palavra_chave}' "
+            f"(similaridade {self.similaridade:.2f}). Reaproveite-a: mantenha a sequência e a "
+            "numeração, ajuste os títulos ao tema/palavra-chave atuais e troque apenas o que não se aplicar.\n"
+            f"{self.outline}"
+        )
+
+
+def _corte_ttl() -> float:
+    return time.time() - OUTLINE_CACHE_TTL_DIAS * 86400 if OUTLINE_CACHE_TTL_DIAS > 0 else 0.0
+
+
+class _IndiceOutlines:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._carregado = False
+        self._por_cliente: dict[str, tuple[np.ndarray, list[dict]]] = {}
+        self._linhas_arquivo = 0  # linhas em ARQ_OUTLINES, vigentes ou não
+        self.consultas = 0
+        self.hits = 0
+        self.reusos = 0
+        self._similaridades: deque[float] = deque(maxlen=1000)
+
+    def _carregar(self) -> None:
+        if self._carregado:
+            return
+        registros: dict[str, list[dict]] = {}
+        corte = _corte_ttl()
+        try:
+            with open(ARQ_OUTLINES, encoding="utf-8") as f:
+                for linha in f:
+                    self._linhas_arquivo += 1
+                    try:
+                        r = json.loads(linha)
+                    except ValueError:
+                        continue
+                    if r.get("ts", 0) >= corte:
+                        registros.setdefault(r["cliente"], []).append(r)
+        except OSError:
+            pass
+        for cliente, lista in registros.items():
+            lista = lista[-OUTLINE_CACHE_MAX_POR_CLIENTE:]
+            matriz = np.stack([embedding(r["tema"], r["palavra_chave"]) for r in lista])
+            self._por_cliente[cliente] = (matriz, lista)
+        self._carregado = True
+        self._compactar()
+
+    def _compactar(self) -> None:
+        """Reescreve o arquivo só com os registros vigentes quando os descartados passam de 1/4 dele."""
+        corte = _corte_ttl()
+        for cliente, (matriz, lista) in list(self._por_cliente.items()):
+            vigentes = [i for i, r in enumerate(lista) if r.get("ts", 0) >= corte]
+            if len(vigentes) < len(lista):
+                self._por_cliente[cliente] = (matriz[vigentes], [lista[i] for i in vigentes])
+        mantidos = sorted((r for _, lista in self._por_cliente.values() for r in lista), key=lambda r: r.get("ts", 0))
+        if self._linhas_arquivo - len(mantidos) <= self._linhas_arquivo // 4:
+            return
+        temporario = ARQ_OUTLINES.with_suffix(".tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            for r in mantidos:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        os.replace(temporario, ARQ_OUTLINES)
+        self._linhas_arquivo = len(mantidos)
+
+    def buscar(self, cliente: str, tema: str, palavra_chave: str) -> OutlineSemelhante | None:
+        consulta = embedding(tema, palavra_chave)
+        with self._lock:
+            self._carregar()
+            self.consultas += 1
+            matriz, lista = self._por_cliente.get(cliente, (None, []))
+            if matriz is None:
+                return None
+            sims = matriz @ consulta
+            corte = _corte_ttl()
+            vigentes = np.fromiter((r.get("ts", 0) >= corte for r in lista), dtype=bool, count=len(lista))
+            if not vigentes.any():
+                return None
+            sims = np.where(vigentes, sims, -1.0)
+            i = int(np.argmax(sims))
+            melhor = float(sims[i])
+            self._similaridades.append(melhor)
+            if melhor < OUTLINE_CACHE_LIMIAR:
+                return None
+            self.hits += 1
+            r = lista[i]
+        return OutlineSemelhante(r["outline"], r["tema"], r["palavra_chave"], round(melhor, 3),
+                                 r.get("estrutura", ""))
+
+    def reusado(self) -> None:
+        with self._lock:
+            self.reusos += 1
+
+    def guardar(self, cliente: str, tema: str, palavra_chave: str, outline: str, estrutura: str = "") -> None:
+        registro = {"ts": time.time(), "cliente": cliente, "tema": tema,
+                    "palavra_chave": palavra_chave, "outline": outline, "estrutura": estrutura}
+        vetor = embedding(tema, palavra_chave)
+        with self._lock:
+            self._carregar()
+            ARQ_OUTLINES.parent.mkdir(parents=True, exist_ok=True)
+            with open(ARQ_OUTLINES, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self._linhas_arquivo += 1
+            matriz, lista = self._por_cliente.get(cliente, (np.empty((0, DIMENSAO), dtype=np.float32), []))
+            matriz = np.vstack([matriz, vetor])[-OUTLINE_CACHE_MAX_POR_CLIENTE:]
+            lista = (lista + [registro])[-OUTLINE_CACHE_MAX_POR_CLIENTE:]
+            self._por_cliente[cliente] = (matriz, lista)
+            self._compactar()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            sims = np.array(self._similaridades, dtype=np.float32)
+            por_cliente = {c: len(lista) for c, (_, lista) in self._por_cliente.items()}
+            consultas, hits, reusos = self.consultas, self.hits, self.reusos
+        distribuicao = {}
+        if sims.size:
+            contagem, bordas = np.histogram(sims, bins=10, range=(0.0, 1.0))
+            distribuicao = {f"{bordas[i]:.1f}-{bordas[i + 1]:.1f}": int(n) for i, n in enumerate(contagem)}
+        return {
+            "ativo": OUTLINE_CACHE_ATIVO,
+            "limiar": OUTLINE_CACHE_LIMIAR,
+            "limiar_reuso": OUTLINE_CACHE_LIMIAR_REUSO,
+            "ttl_dias": OUTLINE_CACHE_TTL_DIAS,
+            "consultas": consultas,
+            "hits": hits,
+            "reusos": reusos,
+            "taxa_hit": round(hits / consultas, 3) if consultas else None,
+            "similaridade": {
+                "media": round(float(sims.mean()), 3) if sims.size else None,
+                "p50": round(float(np.percentile(sims, 50)), 3) if sims.size else None,
+                "p90": round(float(np.percentile(sims, 90)), 3) if sims.size else None,
+                "distribuicao": distribuicao,
+            },
+            "outlines_por_cliente": por_cliente,
+        }
+
+
+indice_outlines = _IndiceOutlines()
+
+
+def preparar_outline(cliente: str, tema: str, palavra_chave: str, digest_outline: str,
+                     llm: LLMCompartilhado) -> tuple[str, LLMCompartilhado]:
+    """
+    (referência para o prompt de tarefa_outline, LLM do agente de outline).
+    - Semelhança >= OUTLINE_CACHE_LIMIAR_REUSO (com estrutura validada guardada): o
+      LLM vira uma LLMRespostaFixa com o outline guardado – a tarefa não chama a API,
+      mas os títulos saem como foram aprovados para a outra palavra-chave.
+    - Faixa intermediária: o outline semelhante vai no prompt, antes da matriz de
+      cobertura (que continua: ela diz o que a SERP atual cobre). A chamada acontece
+      do mesmo jeito e o prompt fica maior; o ganho é só de consistência.
+    - Sem cache ou sem hit: só a matriz de cobertura.
+    """
+    if not OUTLINE_CACHE_ATIVO:
+        return digest_outline, llm
+    semelhante = indice_outlines.buscar(cliente, tema, palavra_chave)
+    if not semelhante:
+        return digest_outline, llm
+    if semelhante.similaridade >= OUTLINE_CACHE_LIMIAR_REUSO and semelhante.estrutura:
+        indice_outlines.reusado()
+        return digest_outline, LLMRespostaFixa(semelhante.estrutura, model=llm.model, tarefa=llm.tarefa)
+    return f"{semelhante.instrucao()}\n\n{digest_outline}", llm
+
+
+def guardar_outline(cliente: str, tema: str, palavra_chave: str):
+    """Callback de Task: guarda o outline concluído no índice (só com o cache ativo)."""
+    def _callback(saida) -> None:
+        if not OUTLINE_CACHE_ATIVO:
+            return
+        estruturado = getattr(saida, "pydantic", None)  # comum.saidas.Outline, se validou
+        if hasattr(estruturado, "html"):
+            texto, estrutura = estruturado.html(), estruturado.model_dump_json()
+        else:  # sem estrutura validada o registro só serve de referência no prompt, nunca de reuso
+            texto, estrutura = (getattr(saida, "raw", None) or str(saida or "")).strip(), ""
+        if texto:
+            indice_outlines.guardar(cliente, tema, palavra_chave, texto, estrutura)
+    return _callback
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+from bs4 import BeautifulSoup
+
+from comum import llm_simulado
+from comum.config import DIR_DADOS, env_int, env_float
+from comum.serp import buscar_organicos
+
+# -------------------------------
+# Pesquisa profunda: páginas dos concorrentes (texto principal + headings)
+# -------------------------------
+# As páginas do topo da SERP são baixadas em paralelo (pool limitado, limite por
+# host, timeout) e o conteúdo extraído fica em cache em disco por URL; quando o
+# cache expira, a revalidação usa ETag/Last-Modified (304 não baixa de novo).
+PESQUISA_PROFUNDA = os.getenv("PESQUISA_PROFUNDA", "1") not in ("0", "false", "False", "")
+DIR_CACHE_PAGINAS = DIR_DADOS / "paginas_cache"
+TTL_CACHE_PAGINAS = env_int("PAGINAS_CACHE_TTL_HORAS", 24 * 7) * 3600
+MAX_CONEXOES = env_int("PAGINAS_MAX_CONEXOES", 10)
+MAX_POR_HOST = env_int("PAGINAS_MAX_POR_HOST", 2)
+TIMEOUT_PAGINA = env_float("PAGINAS_TIMEOUT_S", 8.0)
+MAX_BYTES_PAGINA = env_int("PAGINAS_MAX_BYTES", 2_000_000)
+MAX_CHARS_TEXTO = env_int("PAGINAS_MAX_CHARS", 8000)
+
+USER_AGENT = "Mozilla/5.0 (compatible; InvictusResearchBot/1.0)"
+_TAGS_RUIDO = ("script", "style", "noscript", "svg", "iframe", "form", "nav", "header", "footer", "aside")
+
+
+def _arquivo_cache(url: str):
+    return DIR_CACHE_PAGINAS / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+
+def _ler_cache(url: str) -> dict | None:
+    try:
+        with open(_arquivo_cache(url), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_cache(url: str, registro: dict) -> None:
+    DIR_CACHE_PAGINAS.mkdir(parents=True, exist_ok=True)
+    destino = _arquivo_cache(url)
+    tmp = destino.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(registro, f, ensure_ascii=False)
+    os.replace(tmp, destino)
+
+
+def extrair_documento(html: str, url: str = "") -> dict:
+    """Título, headings (h1–h3) e texto principal de uma página HTML."""
+    soup = BeautifulSoup(html, "html.parser")
+    titulo = soup.title.get_text(" ", strip=True) if soup.title else ""
+    for tag in soup(_TAGS_RUIDO):
+        tag.decompose()
+    principal = soup.find("article") or soup.find("main") or soup.find(attrs={"role": "main"}) or soup.body or soup
+
+    headings = [
+        {"nivel": int(h.name[1]), "texto": h.get_text(" ", strip=True)}
+        for h in principal.find_all(["h1", "h2", "h3"])
+        if h.get_text(strip=True)
+    ]
+    blocos = [
+        el.get_text(" ", strip=True)
+        for el in principal.find_all(["p", "li"])
+        if len(el.get_text(strip=True)) > 40
+    ]
+    texto = "\n".join(blocos)[:MAX_CHARS_TEXTO]
+    return {"url": url, "titulo": titulo, "headings": headings, "texto": texto}
+
+
+async def _baixar(cliente_http: httpx.AsyncClient, sem_host: asyncio.Semaphore, url: str) -> dict | None:
+    cache = _ler_cache(url)
+    if cache and time.time() - cache.get("ts", 0) <= TTL_CACHE_PAGINAS:
+        return cache["documento"]
+    if llm_simulado.simulado():  # benchmark offline: só o que já está em cache (mesmo expirado)
+        return cache["documento"] if cache else None
+
+    headers = {}
+    if cache and cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+    if cache and cache.get("last_modified"):
+        headers["If-Modified-Since"] = cache["last_modified"]
+
+    async with sem_host:
+        try:
+            async with cliente_http.stream("GET", url, headers=headers) as resp:
+                if resp.status_code == 304 and cache:
+                    cache["ts"] = time.time()
+                    _gravar_cache(url, cache)
+                    return cache["documento"]
+                tipo = resp.headers.get("content-type", "")
+                if resp.status_code != 200 or "html" not in tipo:
+                    return cache["documento"] if cache else None
+                corpo = bytearray()
+                async for parte in resp.aiter_bytes():
+                    corpo.extend(parte)
+                    if len(corpo) >= MAX_BYTES_PAGINA:
+                        break
+                html = corpo.decode(resp.encoding or "utf-8", errors="replace")
+                etag, last_modified = resp.headers.get("etag"), resp.headers.get("last-modified")
+        except (httpx.HTTPError, httpx.InvalidURL, UnicodeError):  # InvalidURL não herda de HTTPError
+            return cache["documento"] if cache else None
+
+    try:
+        documento = extrair_documento(html, url)
+        _gravar_cache(url, {"ts": time.time(), "etag": etag, "last_modified": last_modified, "documento": documento})
+    except Exception:  # HTML que o parser não digere (ou disco cheio) perde só esta página
+        return cache["documento"] if cache else None
+    return documento
+
+
+def _host(url: str) -> str:
+    try:
+        return urlsplit(url).hostname or ""
+    except ValueError:  # ex.: "https://[::1/" – o httpx recusa a URL depois, só nesta página
+        return ""
+
+
+async def _baixar_todas(urls: list[str]) -> list[dict]:
+    limites = httpx.Limits(max_connections=MAX_CONEXOES, max_keepalive_connections=MAX_CONEXOES)
+    sem_por_host: dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(MAX_POR_HOST))
+    async with httpx.AsyncClient(
+        limits=limites, timeout=httpx.Timeout(TIMEOUT_PAGINA), follow_redirects=True,
+        headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+    ) as cliente_http:
+        tarefas = [_baixar(cliente_http, sem_por_host[_host(u)], u) for u in urls]
+        # uma página que falhe de um jeito imprevisto cai sozinha, sem derrubar a pesquisa
+        documentos = await asyncio.gather(*tarefas, return_exceptions=True)
+    return [d for d in documentos if isinstance(d, dict)]
+
+
+def buscar_paginas(urls: list[str]) -> list[dict]:
+    """Baixa/extrai as páginas em paralelo (≈ 1 ida e volta no total); ordem preservada."""
+    urls = list(dict.fromkeys(u for u in urls if u and u.startswith(("http://", "https://"))))
+    if not urls:
+        return []
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_baixar_todas(urls))
+    # Chamado de dentro de um event loop: roda em thread própria para não bloqueá-lo
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, _baixar_todas(urls)).result()
+
+
+def pesquisar_paginas_concorrentes(palavra_chave: str, cliente: str, max_paginas: int = 5,
+                                   organicos: list[dict] | None = None) -> list[dict]:
+    """
+    Documentos extraídos das primeiras páginas orgânicas. Quem já tem a SERP (ex.:
+    PesquisaSerp.organicos) passa `organicos` – reler o cache contaria um hit a mais.
+    """
+    if not PESQUISA_PROFUNDA:
+        return []
+    resultados = organicos if organicos is not None else buscar_organicos(palavra_chave, cliente=cliente)
+    urls = [r.get("link") or r.get("url") or "" for r in resultados][:max_paginas]
+    return buscar_paginas(urls)
+
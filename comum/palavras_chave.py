@@ -0,0 +1,46 @@
+import os
+import re
+import unicodedata
+
+# -------------------------------
+# Canonicalização de palavras-chave (PT-BR) para chaves de cache/dedupe
+# -------------------------------
+# "Unha encravada", "unha  encravada " e "UNHA ENCRAVADA" viram a mesma chave.
+# Só as chaves usam a forma canônica; o texto enviado ao LLM continua o original.
+# Opcionais (desligados por padrão):
+#   CHAVE_DOBRAR_ACENTOS=1  -> "câncer" ~ "cancer"
+#   CHAVE_ORDENAR_TERMOS=1  -> "tratamento unha encravada" ~ "unha encravada tratamento"
+#                              (ignora stopwords e ordena os termos)
+CHAVE_DOBRAR_ACENTOS = os.getenv("CHAVE_DOBRAR_ACENTOS", "0") in ("1", "true", "True")
+CHAVE_ORDENAR_TERMOS = os.getenv("CHAVE_ORDENAR_TERMOS", "0") in ("1", "true", "True")
+
+STOPWORDS_PT = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas
+para pra com sem e ou que se ao aos à às é
+""".split())
+
+# "+" e "#" ficam: fazem parte do termo em "c++", "c#", "f#" (soltos, o termo cai abaixo)
+_RE_PONTUACAO = re.compile(r"[^\w\s+#-]", re.UNICODE)
+_RE_PALAVRA = re.compile(r"\w", re.UNICODE)
+
+
+def remover_acentos(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return unicodedata.normalize("NFC", "".join(c for c in decomposto if not unicodedata.combining(c)))
+
+
+def canonizar(palavra_chave: str, dobrar_acentos: bool | None = None, ordenar: bool | None = None) -> str:
+    """Forma canônica: Unicode NFKC, casefold, sem pontuação solta e espaços colapsados."""
+    dobrar_acentos = CHAVE_DOBRAR_ACENTOS if dobrar_acentos is None else dobrar_acentos
+    ordenar = CHAVE_ORDENAR_TERMOS if ordenar is None else ordenar
+
+    texto = unicodedata.normalize("NFKC", palavra_chave or "").casefold()
+    texto = _RE_PONTUACAO.sub(" ", texto)
+    if dobrar_acentos:
+        texto = remover_acentos(texto)
+    termos = [t.strip("-") for t in texto.split()]
+    termos = [t for t in termos if _RE_PALAVRA.search(t)]
+    if ordenar:
+        conteudo = sorted(t for t in termos if t not in STOPWORDS_PT)
+        termos = conteudo or termos
+    return " ".join(termos)
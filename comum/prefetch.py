@@ -0,0 +1,98 @@
+import os
+import threading
+from datetime import datetime
+
+from comum import backlog, serp_uso
+from comum.config import env_int, env_float
+from comum.contexto import definir_execucao
+from comum.paginas import pesquisar_paginas_concorrentes
+from comum.serp import buscar_organicos, serp_em_cache
+
+# -------------------------------
+# Pré-aquecimento em segundo plano da pesquisa do backlog
+# -------------------------------
+# Fora do horário de pico, aquece SERP + páginas dos concorrentes das pautas
+# na fila de cada cliente; quando o editor disparar a crew, a pesquisa já é hit.
+# As chamadas entram na contabilidade como rota '<cliente>_prefetch' (pode ter
+# orçamento próprio em SERPAPI_ORCAMENTOS) e respeitam o orçamento do cliente.
+# Só pautas vigentes (comum.backlog.pendentes): geradas ou vencidas não são mais pagas.
+# Desligado por padrão – cada aquecimento é uma busca paga (PREFETCH_ATIVO=1 liga).
+PREFETCH_ATIVO = os.getenv("PREFETCH_ATIVO", "0") not in ("0", "false", "False", "")
+# Janela fora de pico, em horas locais "início-fim" (fim exclusivo; pode virar a meia-noite)
+PREFETCH_JANELA = os.getenv("PREFETCH_JANELA", "0-6")
+PREFETCH_CICLO_S = env_int("PREFETCH_CICLO_MIN", 15) * 60
+PREFETCH_MAX_POR_CICLO = env_int("PREFETCH_MAX_POR_CICLO", 20)
+# Pausa entre chamadas pagas à SerpAPI (limite de taxa)
+PREFETCH_PAUSA_S = env_float("PREFETCH_PAUSA_S", 3.0)
+
+SUFIXO_PREFETCH = "_prefetch"
+
+
+def _em_janela(hora: int, janela: str = PREFETCH_JANELA) -> bool:
+    try:
+        inicio, fim = (int(x) for x in janela.split("-", 1))
+    except ValueError:
+        return True
+    if inicio <= fim:
+        return inicio <= hora < fim
+    return hora >= inicio or hora < fim
+
+
+class PrefetcherSerp:
+    def __init__(self):
+        self._parar = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stats = {"ciclos": 0, "aquecidas": 0, "ja_em_cache": 0,
+                      "puladas_orcamento": 0, "erros": 0, "ultimo_ciclo": None}
+
+    def iniciar(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name="prefetch-serp", daemon=True)
+        self._thread.start()
+
+    def parar(self) -> None:
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _loop(self) -> None:
+        while not self._parar.is_set():
+            if _em_janela(datetime.now().hour):
+                self.executar_ciclo()
+            self._parar.wait(PREFETCH_CICLO_S)
+
+    def executar_ciclo(self) -> dict:
+        """Aquece até PREFETCH_MAX_POR_CICLO pautas vigentes (mais próximas da data prevista primeiro)."""
+        pendentes = [
+            (item.get("data_prevista") or "9999", item["adicionado_em"], cliente, item["palavra_chave"])
+            for cliente, item in backlog.pendentes()
+        ]
+        chamadas_pagas = 0
+        for _, _, cliente, palavra_chave in sorted(pendentes):
+            if self._parar.is_set() or chamadas_pagas >= PREFETCH_MAX_POR_CICLO:
+                break
+            if serp_em_cache(palavra_chave):
+                self.stats["ja_em_cache"] += 1
+                continue
+            definir_execucao(cliente + SUFIXO_PREFETCH, cliente=cliente)
+            if not serp_uso.dentro_do_orcamento(cliente):
+                self.stats["puladas_orcamento"] += 1
+                continue
+            try:
+                organicos = buscar_organicos(palavra_chave, cliente=cliente)
+                pesquisar_paginas_concorrentes(palavra_chave, cliente=cliente, organicos=organicos)
+            except Exception:
+                self.stats["erros"] += 1
+                continue
+            backlog.marcar_aquecido(cliente, palavra_chave)
+            self.stats["aquecidas"] += 1
+            chamadas_pagas += 1
+            self._parar.wait(PREFETCH_PAUSA_S)
+        self.stats["ciclos"] += 1
+        self.stats["ultimo_ciclo"] = datetime.now().isoformat(timespec="seconds")
+        return dict(self.stats)
+
+
+prefetcher = PrefetcherSerp()
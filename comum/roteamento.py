@@ -0,0 +1,50 @@
+import os
+
+from comum.config import env_json
+from comum.contexto import execucao_atual
+from comum.llm import LLMCompartilhado, obter_llm
+
+# -------------------------------
+# Roteamento de modelo/parâmetros por tarefa, cliente e rota
+# -------------------------------
+# Tarefas mecânicas (anexar assinatura, unir HTML) não precisam do mesmo modelo
+# das tarefas de redação. A configuração é mesclada, da menos para a mais
+# específica:
+#   padrão embutido -> "*" -> cliente -> rota (ex.: dra_karen_backlink)
+# e, em cada nível, "*" (todas as tarefas) antes do nome da tarefa. Ex.:
+# LLM_ROTAS='{"*": {"revisor": {"modelo": "gpt-4o-mini"}},
+#             "dra_karen": {"desenvolvimento": {"modelo": "gpt-4o", "temperatura": 0.5}},
+#             "dra_karen_backlink": {"*": {"modelo": "gpt-4o-mini"}}}'
+# Nomes de tarefa = sufixo do agente: intro, outline, desenvolvimento, conclusao,
+# unificador, linkagem, contato, revisor, executor.
+# O padrão embutido só barateia o contato (anexa a assinatura). O unificador
+# reescreve o artigo inteiro, então trocar o modelo dele (ou de qualquer outra
+# tarefa) é opt-in via LLM_ROTAS, ex.: '{"*": {"unificador": {"modelo": "gpt-4o-mini"}}}'.
+LLM_MODELO_ECONOMICO = os.getenv("LLM_MODELO_ECONOMICO") or "gpt-4o-mini"
+ROTAS_PADRAO = {
+    "contato": {"modelo": LLM_MODELO_ECONOMICO, "temperatura": 0.0},
+}
+ROTAS_LLM = env_json("LLM_ROTAS", {})
+
+
+def config_tarefa(tarefa: str, cliente: str, rota: str | None = None) -> dict:
+    """Modelo/temperatura efetivos da tarefa para o cliente/rota."""
+    config = dict(ROTAS_PADRAO.get(tarefa, {}))
+    niveis = ["*", cliente] + ([rota] if rota and rota != cliente else [])
+    for nivel in niveis:
+        bloco = ROTAS_LLM.get(nivel) or {}
+        config.update(bloco.get("*") or {})
+        config.update(bloco.get(tarefa) or {})
+    return config
+
+
+def llm_para(tarefa: str, cliente: str, temperatura: float = 0.4) -> LLMCompartilhado:
+    """LLM da tarefa na execução atual (rota vem do contexto da requisição)."""
+    execucao = execucao_atual(cliente)
+    rota = execucao.rota if execucao.cliente == cliente else cliente
+    config = config_tarefa(tarefa, cliente, rota)
+    return obter_llm(
+        modelo=config.get("modelo"),
+        temperatura=config.get("temperatura", temperatura),
+        tarefa=tarefa,
+    )
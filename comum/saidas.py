@@ -0,0 +1,113 @@
+import re
+from typing import Callable
+
+from crewai.utilities.converter import Converter, ConverterError
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from comum import llm_simulado
+from comum.lote import em_lote
+
+# -------------------------------
+# Saídas estruturadas (output_pydantic) das tarefas de outline e de revisão
+# -------------------------------
+# O agente recebe o schema no prompt (a crewai acrescenta as instruções) e a saída é
+# validada; `task.output.pydantic` fica disponível para o código (cache de outlines,
+# métricas). O outline segue para tarefa_desenvolvimento como headings HTML
+# (`outline_em_html`); a revisão segue como JSON para tarefa_corrigir.
+# Pequenos desvios (numeração ou tags dentro dos títulos) são normalizados na
+# validação em vez de custar uma nova chamada. Saída que não converte nem depois
+# das tentativas de reparo não derruba a crew: segue o texto bruto, sem `pydantic`.
+_TAGS = re.compile(r"<[^>]+>")
+_NUMERACAO = re.compile(r"^\s*\d+\s*[.)\-–:]\s*")
+
+
+def _limpar_heading(texto: str) -> str:
+    texto = _TAGS.sub("", texto or "")
+    return " ".join(_NUMERACAO.sub("", texto).split())
+
+
+class SecaoOutline(BaseModel):
+    titulo: str = Field(description="Texto do <h2>, sem numeração e sem tags")
+    subtitulos: list[str] = Field(default_factory=list, description="Textos dos <h3> desta seção, sem tags")
+
+    @field_validator("titulo")
+    @classmethod
+    def _titulo(cls, valor: str) -> str:
+        valor = _limpar_heading(valor)
+        if not valor:
+            raise ValueError("título de seção vazio")
+        return valor
+
+    @field_validator("subtitulos")
+    @classmethod
+    def _subtitulos(cls, valores: list[str]) -> list[str]:
+        return [s for s in (_limpar_heading(v) for v in valores) if s]
+
+
+class Outline(BaseModel):
+    secoes: list[SecaoOutline] = Field(min_length=1, description="Seções (<h2>) na ordem do artigo")
+
+    def html(self) -> str:
+        """Headings no formato do MODELO: <h2> numerados na ordem, <h3> sem numeração."""
+        linhas = []
+        for numero, secao in enumerate(self.secoes, 1):
+            linhas.append(f"<h2>{numero}. {secao.titulo}</h2>")
+            linhas.extend(f"<h3>{sub}</h3>" for sub in secao.subtitulos)
+        return "\n".join(linhas)
+
+
+class Achado(BaseModel):
+    campo: str = Field(description="Trecho do HTML (ou resumo dele) a que o achado se refere")
+    problema: str = Field(description="O que está errado ou pode melhorar")
+    acao: str = Field(description="Correção concreta a aplicar")
+
+
+class Revisao(BaseModel):
+    achados: list[Achado] = Field(default_factory=list, description="Melhorias acionáveis, da mais importante à menos")
+
+
+def outline_em_html(seguinte: Callable | None = None) -> Callable:
+    """
+    Callback de tarefa_outline: troca o JSON validado pelos headings numerados
+    (Outline.html()) no texto que vira contexto de tarefa_desenvolvimento; `seguinte`
+    (ex.: comum.outline_cache.guardar_outline) roda depois, com a saída já em HTML.
+    """
+    def _callback(saida) -> None:
+        if isinstance(getattr(saida, "pydantic", None), Outline):
+            saida.raw = saida.pydantic.html()
+        if seguinte is not None:
+            seguinte(saida)
+    return _callback
+
+
+def _extrair_json(texto: str) -> str:
+    inicio, fim = texto.find("{"), texto.rfind("}")
+    return texto[inicio:fim + 1] if 0 <= inicio < fim else texto
+
+
+class ConversorSaida(Converter):
+    """
+    Reparo de saída fora do schema pelo próprio LLM da tarefa (comum.llm: cache,
+    orçamento e registro de uso valem), em vez do caminho instructor/litellm que a
+    crewai usa quando o LLM declara suporte a function calling.
+    """
+
+    def to_pydantic(self, current_attempt=1) -> BaseModel | ConverterError:
+        with llm_simulado.saida_pedida(self.model):  # o dublê responde com uma instância do modelo
+            resposta = self.llm.call([
+                {"role": "system", "content": self.instructions},
+                {"role": "user", "content": self.text},
+            ])
+        try:
+            return self.model.model_validate_json(_extrair_json(resposta))
+        except (ValidationError, ValueError) as exc:
+            # no modo lote cada tentativa é uma ida e volta inteira à Batch API: só uma
+            tentativas = 1 if em_lote() else self.max_attempts
+            if current_attempt < tentativas:
+                return self.to_pydantic(current_attempt + 1)
+            # devolvido (não levantado): a crewai registra o aviso e mantém a saída bruta
+            return ConverterError(f"Saída não convertida para {self.model.__name__}: {exc}")
+
+    def to_json(self, current_attempt=1):
+        resultado = self.to_pydantic(current_attempt)
+        return resultado if isinstance(resultado, ConverterError) else resultado.model_dump_json()
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from serpapi.google_search import GoogleSearch
+
+from comum import llm_simulado, serp_uso
+from comum.config import DIR_DADOS, env_int
+from comum.palavras_chave import canonizar
+
+# -------------------------------
+# SERP compartilhada: cache em disco + contabilidade/orçamento por cliente
+# -------------------------------
+DIR_CACHE_SERP = DIR_DADOS / "serp_cache"
+TTL_CACHE_SERP = env_int("SERP_CACHE_TTL_HORAS", 72) * 3600
+# Teto de páginas buscadas quando a 1ª página não traz candidatos suficientes
+SERP_MAX_PAGINAS = env_int("SERP_MAX_PAGINAS", 3)
+
+
+# Single-flight: buscas simultâneas da mesma consulta esperam a 1ª (uma só chamada paga)
+_em_voo: dict[str, threading.Event] = {}
+_lock_voo = threading.Lock()
+ESPERA_SINGLE_FLIGHT_S = env_int("SERP_ESPERA_SINGLE_FLIGHT_S", 30)
+
+
+def _chave_cache(params: dict) -> str:
+    params = {**params, "q": canonizar(params["q"])}
+    bruto = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def _ler_cache(chave: str, aceitar_expirado: bool = False) -> dict | None:
+    try:
+        with open(DIR_CACHE_SERP / f"{chave}.json", encoding="utf-8") as f:
+            registro = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not aceitar_expirado and time.time() - registro.get("ts", 0) > TTL_CACHE_SERP:
+        return None
+    return registro.get("resposta")
+
+
+def _gravar_cache(chave: str, params: dict, resposta: dict) -> None:
+    DIR_CACHE_SERP.mkdir(parents=True, exist_ok=True)
+    destino = DIR_CACHE_SERP / f"{chave}.json"
+    tmp = destino.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"ts": time.time(), "params": params, "resposta": resposta}, f, ensure_ascii=False)
+    os.replace(tmp, destino)
+
+
+def _params_serp(palavra_chave: str, num: int = 10, start: int = 0) -> dict:
+    params = {"q": " ".join(palavra_chave.split()), "hl": "pt-br", "gl": "br", "num": num}
+    if start:
+        params["start"] = start
+    return params
+
+
+def serp_em_cache(palavra_chave: str, num: int = 10, start: int = 0) -> bool:
+    """True se há resposta válida (dentro do TTL) em cache para a consulta."""
+    return _ler_cache(_chave_cache(_params_serp(palavra_chave, num, start))) is not None
+
+
+def buscar_serp(palavra_chave: str, cliente: str, num: int = 10, start: int = 0) -> dict:
+    """
+    Resposta completa da SerpAPI para a palavra-chave, passando pelo cache em disco.
+    Toda chamada é registrada (cliente, palavra-chave, hit/miss, latência). Se o cliente
+    estourou o orçamento, a pesquisa vira somente-cache (aceita cache expirado ou devolve {}).
+    Variações triviais da palavra-chave (caixa, espaços) compartilham a mesma entrada de cache.
+    """
+    params = _params_serp(palavra_chave, num, start)
+    chave = _chave_cache(params)
+    chave_registro = canonizar(palavra_chave)
+    inicio = time.perf_counter()
+
+    def _ms() -> float:
+        return (time.perf_counter() - inicio) * 1000
+
+    if llm_simulado.simulado():
+        # LLM dublê (benchmark offline): pesquisa congelada no cache, nunca vai à SerpAPI
+        resposta = _ler_cache(chave, aceitar_expirado=True)
+        if resposta is not None:
+            serp_uso.registrar(cliente, chave_registro, "hit", _ms(), start)
+        return resposta or {}
+
+    resposta = _ler_cache(chave)
+    if resposta is not None:
+        serp_uso.registrar(cliente, chave_registro, "hit", _ms(), start)
+        return resposta
+
+    with _lock_voo:
+        evento = _em_voo.get(chave)
+        lider = evento is None
+        if lider:
+            evento = _em_voo[chave] = threading.Event()
+    if not lider:
+        evento.wait(ESPERA_SINGLE_FLIGHT_S)
+        resposta = _ler_cache(chave)
+        if resposta is not None:
+            serp_uso.registrar(cliente, chave_registro, "hit", _ms(), start)
+            return resposta
+
+    try:
+        reserva = serp_uso.reservar(cliente)
+        if reserva is None:
+            resposta = _ler_cache(chave, aceitar_expirado=True) or {}
+            serp_uso.registrar(cliente, chave_registro, "bloqueado", _ms(), start)
+            return resposta
+
+        search = GoogleSearch({**params, "api_key": os.getenv("SERPAPI_API_KEY")})
+        try:
+            resposta = search.get_dict()
+        except Exception:
+            serp_uso.liberar(reserva)
+            serp_uso.registrar(cliente, chave_registro, "erro", _ms(), start)
+            raise
+        if resposta.get("error"):  # não cobrada e fora do cache
+            serp_uso.liberar(reserva)
+            serp_uso.registrar(cliente, chave_registro, "erro", _ms(), start)
+            return resposta
+        _gravar_cache(chave, params, resposta)
+        serp_uso.registrar(cliente, chave_registro, "miss", _ms(), start)
+        return resposta
+    finally:
+        if lider:
+            with _lock_voo:
+                _em_voo.pop(chave, None)
+            evento.set()
+
+
+@dataclass(frozen=True)
+class PesquisaSerp:
+    """
+    Tudo o que a 1ª página da SerpAPI já trouxe (e já foi pago): orgânicos, perguntas
+    relacionadas ("As pessoas também perguntam"), buscas relacionadas e knowledge graph.
+    Vem da mesma entrada de cache de `buscar_serp` – nenhuma chamada extra.
+    """
+    organicos: list[dict] = field(default_factory=list)
+    perguntas: list[dict] = field(default_factory=list)  # [{"pergunta", "resposta", "link"}]
+    buscas_relacionadas: list[str] = field(default_factory=list)
+    knowledge_graph: dict = field(default_factory=dict)  # {"titulo", "tipo", "descricao", "fonte"}
+
+    @property
+    def demandas(self) -> list[str]:
+        """Perguntas e buscas reais dos usuários (insumo da análise de lacunas / FAQ)."""
+        return [p["pergunta"] for p in self.perguntas] + self.buscas_relacionadas
+
+
+def _extrair_pesquisa(resposta: dict) -> PesquisaSerp:
+    perguntas = [
+        {
+            "pergunta": (q.get("question") or "").strip(),
+            "resposta": (q.get("snippet") or "").strip(),
+            "link": q.get("link") or "",
+        }
+        for q in resposta.get("related_questions") or []
+        if (q.get("question") or "").strip()
+    ]
+    relacionadas = [
+        r["query"].strip() for r in resposta.get("related_searches") or [] if (r.get("query") or "").strip()
+    ]
+    kg = resposta.get("knowledge_graph") or {}
+    knowledge_graph = {
+        "titulo": kg.get("title", ""),
+        "tipo": kg.get("type", ""),
+        "descricao": kg.get("description", ""),
+        "fonte": (kg.get("source") or {}).get("link", ""),
+    } if kg.get("title") else {}
+    return PesquisaSerp(
+        organicos=resposta.get("organic_results") or [],
+        perguntas=perguntas,
+        buscas_relacionadas=list(dict.fromkeys(relacionadas)),
+        knowledge_graph=knowledge_graph,
+    )
+
+
+def pesquisar_serp(palavra_chave: str, cliente: str, num: int = 10) -> PesquisaSerp:
+    return _extrair_pesquisa(buscar_serp(palavra_chave, cliente, num=num))
+
+
+def buscar_organicos(palavra_chave: str, cliente: str, num: int = 10) -> list[dict]:
+    return buscar_serp(palavra_chave, cliente, num=num).get("organic_results", []) or []
+
+
+def iterar_organicos(palavra_chave: str, cliente: str, num: int = 10,
+                     max_paginas: int = SERP_MAX_PAGINAS,
+                     primeira_pagina: list[dict] | None = None) -> Iterator[dict]:
+    """
+    Resultados orgânicos página a página, sob demanda: a página seguinte só é
+    buscada (e cobrada) se o consumidor continuar iterando. Cada página passa
+    pelo mesmo cache/orçamento de `buscar_serp`; a 1ª é a mesma de `buscar_organicos`
+    e, se já buscada (`primeira_pagina`), não é lida de novo.
+    """
+    for pagina in range(max(1, max_paginas)):
+        if pagina == 0 and primeira_pagina is not None:
+            resultados = primeira_pagina
+        else:
+            resultados = buscar_serp(palavra_chave, cliente, num=num, start=pagina * num).get("organic_results") or []
+        if not resultados:
+            return
+        yield from resultados
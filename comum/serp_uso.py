@@ -0,0 +1,206 @@
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from comum.config import DIR_DADOS, env_int, env_json
+from comum.contexto import SUFIXO_BACKLINK, execucao_atual
+from comum.custos import acumular_serp
+
+# -------------------------------
+# Contabilidade de chamadas SerpAPI + orçamentos por cliente/rota
+# -------------------------------
+ARQ_USO_SERP = DIR_DADOS / "serpapi_uso.jsonl"
+
+# Limites padrão por cliente (0 = sem limite). Limites específicos vêm de
+# SERPAPI_ORCAMENTOS, ex.: {"dra_karen": {"diario": 40, "mensal": 600},
+#                           "dra_karen_backlink": {"diario": 10}}
+# Uma chave de rota (ex.: *_backlink) limita só aquela rota; a chave do cliente
+# limita a soma de todas as rotas dele.
+# A busca paga reserva o orçamento sob o lock ANTES da chamada (`reservar`), então
+# misses simultâneos de consultas diferentes não passam todos pela checagem; uma
+# resposta de erro da SerpAPI devolve a reserva (`liberar`) e é registrada como "erro".
+ORCAMENTO_DIARIO_PADRAO = env_int("SERPAPI_ORCAMENTO_DIARIO", 0)
+ORCAMENTO_MENSAL_PADRAO = env_int("SERPAPI_ORCAMENTO_MENSAL", 0)
+ORCAMENTOS = env_json("SERPAPI_ORCAMENTOS", {})
+
+RESULTADOS = ("hit", "miss", "bloqueado", "erro")
+
+_lock = threading.Lock()
+_uso_dia: dict[tuple[str, str], int] = defaultdict(int)   # (chave, AAAA-MM-DD) -> chamadas pagas
+_uso_mes: dict[tuple[str, str], int] = defaultdict(int)   # (chave, AAAA-MM) -> chamadas pagas
+_carregado = False
+
+
+def _rota_para(cliente: str) -> str:
+    execucao = execucao_atual(cliente)
+    return execucao.rota if execucao.cliente == cliente else cliente
+
+
+def _chaves_orcamento(cliente: str, rota: str) -> list[str]:
+    return [cliente] if rota == cliente else [cliente, rota]
+
+
+def _limites(chave: str, cliente: str) -> tuple[int, int]:
+    cfg = ORCAMENTOS.get(chave)
+    if cfg is None:
+        if chave != cliente:
+            return 0, 0
+        return ORCAMENTO_DIARIO_PADRAO, ORCAMENTO_MENSAL_PADRAO
+    return int(cfg.get("diario", 0) or 0), int(cfg.get("mensal", 0) or 0)
+
+
+def _ler_registros():
+    try:
+        with open(ARQ_USO_SERP, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    yield json.loads(linha)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def _contabilizar(chaves: list[str], dia: str, mes: str, delta: int = 1) -> None:
+    for chave in chaves:
+        _uso_dia[(chave, dia)] += delta
+        _uso_mes[(chave, mes)] += delta
+
+
+def _carregar() -> None:
+    """Reconstrói os contadores do mês corrente a partir do registro em disco (1x por processo)."""
+    global _carregado
+    if _carregado:
+        return
+    mes = datetime.now().strftime("%Y-%m")
+    for reg in _ler_registros():
+        ts = str(reg.get("ts", ""))
+        if reg.get("cache") == "miss" and ts.startswith(mes):
+            _contabilizar(_chaves_orcamento(reg["cliente"], reg["rota"]), ts[:10], ts[:7])
+    _carregado = True
+
+
+def _cabe(chaves: list[str], cliente: str, dia: str, mes: str) -> bool:
+    for chave in chaves:
+        diario, mensal = _limites(chave, cliente)
+        if diario and _uso_dia[(chave, dia)] >= diario:
+            return False
+        if mensal and _uso_mes[(chave, mes)] >= mensal:
+            return False
+    return True
+
+
+def dentro_do_orcamento(cliente: str) -> bool:
+    """False quando o cliente (ou a rota atual) estourou o limite diário ou mensal (só consulta)."""
+    chaves = _chaves_orcamento(cliente, _rota_para(cliente))
+    agora = datetime.now()
+    with _lock:
+        _carregar()
+        return _cabe(chaves, cliente, agora.strftime("%Y-%m-%d"), agora.strftime("%Y-%m"))
+
+
+def reservar(cliente: str) -> tuple[list[str], str, str] | None:
+    """
+    Checa e já desconta uma busca paga do orçamento, atomicamente. None = estourado.
+    A reserva devolvida vai para `liberar` se a busca não for cobrada.
+    """
+    chaves = _chaves_orcamento(cliente, _rota_para(cliente))
+    agora = datetime.now()
+    dia, mes = agora.strftime("%Y-%m-%d"), agora.strftime("%Y-%m")
+    with _lock:
+        _carregar()
+        if not _cabe(chaves, cliente, dia, mes):
+            return None
+        _contabilizar(chaves, dia, mes)
+    return chaves, dia, mes
+
+
+def liberar(reserva: tuple[list[str], str, str]) -> None:
+    """Devolve ao orçamento uma reserva cuja busca falhou."""
+    with _lock:
+        _contabilizar(*reserva, delta=-1)
+
+
+def registrar(cliente: str, palavra_chave: str, cache: str, latencia_ms: float, pagina: int = 0) -> None:
+    """
+    Anexa uma chamada ao registro (cache: 'hit', 'miss', 'bloqueado' ou 'erro'). O
+    orçamento de um 'miss' já foi descontado por `reservar`.
+    """
+    reg = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "cliente": cliente,
+        "rota": _rota_para(cliente),
+        "palavra_chave": palavra_chave,
+        "pagina": pagina,
+        "cache": cache,
+        "latencia_ms": round(latencia_ms, 1),
+    }
+    with _lock:
+        _carregar()
+        ARQ_USO_SERP.parent.mkdir(parents=True, exist_ok=True)
+        with open(ARQ_USO_SERP, "a", encoding="utf-8") as f:
+            f.write(json.dumps(reg, ensure_ascii=False) + "\n")
+    if execucao_atual(cliente).cliente == cliente:
+        acumular_serp(cache)
+
+
+def _novo_resumo() -> dict:
+    return {"chamadas": 0, **{r: 0 for r in RESULTADOS}, "latencia_total_ms": 0.0,
+            "latencia_miss_ms": 0.0, "palavras_chave": defaultdict(int)}
+
+
+def _fechar_resumo(r: dict) -> dict:
+    chamadas = r["chamadas"] or 1
+    top = sorted(r["palavras_chave"].items(), key=lambda kv: kv[1], reverse=True)[:10]
+    return {
+        "chamadas": r["chamadas"],
+        "hits": r["hit"],
+        "misses": r["miss"],
+        "bloqueadas": r["bloqueado"],
+        "erros": r["erro"],
+        "taxa_hit": round(r["hit"] / chamadas, 3),
+        "latencia_media_ms": round(r["latencia_total_ms"] / chamadas, 1),
+        "latencia_media_miss_ms": round(r["latencia_miss_ms"] / (r["miss"] or 1), 1),
+        "top_palavras_chave_pagas": [{"palavra_chave": k, "misses": v} for k, v in top if v],
+    }
+
+
+def relatorio(dias: int = 30) -> dict:
+    """Resumo de uso por cliente e por rota nos últimos `dias`, com a situação dos orçamentos."""
+    agora = datetime.now()
+    desde = (agora - timedelta(days=dias)).isoformat(timespec="seconds")
+    dia, mes = agora.strftime("%Y-%m-%d"), agora.strftime("%Y-%m")
+    por_cliente: dict[str, dict] = defaultdict(_novo_resumo)
+    por_rota: dict[str, dict] = defaultdict(_novo_resumo)
+    total = _novo_resumo()
+
+    for reg in _ler_registros():
+        if str(reg.get("ts", "")) < desde or reg.get("cache") not in RESULTADOS:
+            continue
+        for r in (por_cliente[reg["cliente"]], por_rota[reg["rota"]], total):
+            r["chamadas"] += 1
+            r[reg["cache"]] += 1
+            r["latencia_total_ms"] += reg.get("latencia_ms", 0.0)
+            if reg["cache"] == "miss":
+                r["latencia_miss_ms"] += reg.get("latencia_ms", 0.0)
+                r["palavras_chave"][reg.get("palavra_chave", "")] += 1
+
+    with _lock:
+        _carregar()
+        orcamentos = {}
+        for chave in sorted(set(por_cliente) | set(por_rota) | set(ORCAMENTOS)):
+            cliente = chave[: -len(SUFIXO_BACKLINK)] if chave.endswith(SUFIXO_BACKLINK) else chave
+            diario, mensal = _limites(chave, cliente)
+            orcamentos[chave] = {
+                "uso_hoje": _uso_dia[(chave, dia)], "limite_diario": diario or None,
+                "uso_mes": _uso_mes[(chave, mes)], "limite_mensal": mensal or None,
+            }
+
+    return {
+        "periodo_dias": dias,
+        "total": _fechar_resumo(total),
+        "por_cliente": {k: _fechar_resumo(v) for k, v in sorted(por_cliente.items())},
+        "por_rota": {k: _fechar_resumo(v) for k, v in sorted(por_rota.items())},
+        "orcamentos": orcamentos,
+    }
@@ -0,0 +1,110 @@
+import os
+import json
+import queue
+import threading
+import contextvars
+from typing import Callable, Iterator
+
+from comum.custos import medir
+
+# -------------------------------
+# Streaming da etapa final (tarefa_corrigir) para o cliente HTTP
+# -------------------------------
+# A crew roda numa thread; o LLM compartilhado publica eventos num canal ligado
+# à execução (contextvar). Etapas anteriores só informam progresso (início/fim de
+# cada chamada); a tarefa final (agente_executor) tem a saída repassada token a
+# token – a partir de "Final Answer:", sem o "Thought:" do formato ReAct da crewai.
+# Formato: Server-Sent Events (event: progresso | token | reinicio | fim | erro).
+STREAM_TAREFA_FINAL = os.getenv("STREAM_TAREFA_FINAL", "executor")
+MARCADOR_RESPOSTA = "Final Answer:"
+
+_canal: contextvars.ContextVar["CanalStream | None"] = contextvars.ContextVar("canal_stream", default=None)
+
+
+class CanalStream:
+    def __init__(self):
+        self._fila: queue.Queue = queue.Queue()
+        self._respostas_finais = 0
+
+    def publicar(self, evento: str, dados: dict) -> None:
+        self._fila.put((evento, dados))
+
+    def progresso(self, tarefa: str, estado: str, **extras) -> None:
+        self.publicar("progresso", {"tarefa": tarefa, "estado": estado, **extras})
+
+    def iniciar_resposta_final(self) -> None:
+        """Nova chamada da etapa final (ex.: crewai repetindo após erro de formato): descarta a anterior."""
+        if self._respostas_finais:
+            self.publicar("reinicio", {})
+        self._respostas_finais += 1
+
+    def eventos(self) -> Iterator[tuple[str, dict]]:
+        while True:
+            evento, dados = self._fila.get()
+            yield evento, dados
+            if evento in ("fim", "erro"):
+                return
+
+
+class FiltroRespostaFinal:
+    """Acumula deltas e só libera o texto depois de 'Final Answer:' (o que o cliente vê é o HTML)."""
+
+    def __init__(self, canal: CanalStream):
+        self.canal = canal
+        self._buffer = ""
+        self._liberado = False
+        canal.iniciar_resposta_final()
+
+    def receber(self, delta: str) -> None:
+        if self._liberado:
+            self.canal.publicar("token", {"texto": delta})
+            return
+        self._buffer += delta
+        pos = self._buffer.find(MARCADOR_RESPOSTA)
+        if pos >= 0:
+            self._liberado = True
+            resto = self._buffer[pos + len(MARCADOR_RESPOSTA):].lstrip()
+            if resto:
+                self.canal.publicar("token", {"texto": resto})
+
+
+def canal_atual() -> CanalStream | None:
+    return _canal.get()
+
+
+def transmite(tarefa: str) -> bool:
+    """True se a chamada desta tarefa deve ser transmitida token a token."""
+    return _canal.get() is not None and tarefa == STREAM_TAREFA_FINAL
+
+
+def _sse(evento: str, dados: dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+def executar_em_stream(build_crew: Callable, tema: str, palavra_chave: str) -> Iterator[str]:
+    """
+    Monta a crew (pesquisa SERP/páginas) e roda `kickoff()` numa thread, herdando o
+    contexto da requisição; devolve o gerador SSE para uma StreamingResponse.
+    """
+    canal = CanalStream()
+    contexto = contextvars.copy_context()
+
+    def _rodar():
+        _canal.set(canal)
+        try:
+            with medir(tema, palavra_chave) as medicao:
+                canal.progresso("pesquisa", "inicio")
+                medicao.montada(crew := build_crew(tema, palavra_chave))
+                canal.progresso("pesquisa", "fim")
+                resultado = medicao.resultado = crew.kickoff()
+        except Exception as exc:  # erro vai para o cliente como evento, não derruba o stream
+            canal.publicar("erro", {"erro": str(exc), "tipo": type(exc).__name__})
+            return
+        uso = getattr(resultado, "token_usage", None)
+        canal.publicar("fim", {
+            "html": getattr(resultado, "raw", str(resultado)),
+            "token_usage": uso.model_dump() if hasattr(uso, "model_dump") else None,
+        })
+
+    threading.Thread(target=contexto.run, args=(_rodar,), daemon=True).start()
+    return (_sse(evento, dados) for evento, dados in canal.eventos())
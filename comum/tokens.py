@@ -0,0 +1,64 @@
+from functools import lru_cache
+
+import tiktoken
+
+from comum.config import MODELO_PADRAO
+
+# -------------------------------
+# Contagem de tokens (tiktoken) com fallback aproximado
+# -------------------------------
+
+
+@lru_cache(maxsize=None)
+def _encoding(modelo: str):
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Sem acesso ao arquivo do encoding (ex.: máquina offline): usa estimativa
+        return None
+
+
+def contar_tokens(texto: str, modelo: str = MODELO_PADRAO) -> int:
+    if not texto:
+        return 0
+    enc = _encoding(modelo)
+    if enc is None:
+        return max(1, len(texto) // 4)
+    return len(enc.encode(texto, disallowed_special=()))
+
+
+def cortar_em_tokens(texto: str, limite: int, modelo: str = MODELO_PADRAO) -> str:
+    """Trunca o texto para caber em `limite` tokens (corte no token, sem reticências)."""
+    if limite <= 0:
+        return ""
+    enc = _encoding(modelo)
+    if enc is None:
+        return texto[: limite * 4]
+    ids = enc.encode(texto, disallowed_special=())
+    return texto if len(ids) <= limite else enc.decode(ids[:limite])
+
+
+def contar_tokens_mensagens(mensagens: list[dict], modelo: str = MODELO_PADRAO) -> int:
+    """Tokens de uma lista de mensagens de chat (conteúdo + ~4 tokens de estrutura por mensagem)."""
+    return sum(contar_tokens(m.get("content") or "", modelo) + 4 for m in mensagens) + 2
+
+
+def cortar_meio_em_tokens(texto: str, limite: int, modelo: str = MODELO_PADRAO,
+                          fracao_inicio: float = 1 / 3) -> str:
+    """Mantém início e fim do texto (o fim costuma ter o contexto mais recente) e omite o meio."""
+    marcador = "\n[... trecho omitido por limite de tokens ...]\n"
+    total = contar_tokens(texto, modelo)
+    if total <= limite:
+        return texto
+    util = max(limite - contar_tokens(marcador, modelo), 0)
+    n_inicio = int(util * fracao_inicio)
+    n_fim = util - n_inicio
+    enc = _encoding(modelo)
+    if enc is None:
+        inicio, fim = texto[: n_inicio * 4], (texto[-n_fim * 4:] if n_fim else "")
+    else:
+        ids = enc.encode(texto, disallowed_special=())
+        inicio, fim = enc.decode(ids[:n_inicio]), (enc.decode(ids[-n_fim:]) if n_fim else "")
+    return inicio + marcador + fim
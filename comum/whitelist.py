@@ -0,0 +1,70 @@
+from functools import lru_cache
+from typing import Iterable
+from urllib.parse import urlsplit
+
+# -------------------------------
+# Whitelist de domínios externos com fronteira exata de rótulo
+# -------------------------------
+# Cada entrada ("aad.org", ".gov", ".gov.br") vale para o próprio domínio e seus
+# subdomínios: "aad.org" aceita "www.aad.org", mas não "baad.org"; ".gov" aceita
+# "cdc.gov", mas não "govtech.com.br". A consulta olha só o hostname da URL e faz
+# uma busca em conjunto por sufixo de rótulos (O(nº de rótulos) por URL).
+
+
+def _normalizar_dominio(entrada: str) -> str:
+    return entrada.strip().lower().strip(".")
+
+
+def extrair_host(url: str) -> str:
+    """Hostname em minúsculas (sem porta, usuário ou ponto final); '' se não houver."""
+    url = (url or "").strip()
+    if not url:
+        return ""
+    if "//" not in url:
+        url = "//" + url
+    try:
+        host = urlsplit(url).hostname or ""
+    except ValueError:
+        return ""
+    return host.rstrip(".")
+
+
+class WhitelistDominios:
+    """Conjunto de sufixos de domínio compilado uma vez e consultado por hostname."""
+
+    def __init__(self, entradas: Iterable[str]):
+        self._sufixos = frozenset(d for d in map(_normalizar_dominio, entradas) if d)
+
+    def __len__(self) -> int:
+        return len(self._sufixos)
+
+    def permite_host(self, host: str) -> bool:
+        rotulos = host.split(".")
+        sufixos = self._sufixos
+        return any(".".join(rotulos[i:]) in sufixos for i in range(len(rotulos)))
+
+    def permite(self, url: str) -> bool:
+        host = extrair_host(url)
+        return bool(host) and self.permite_host(host)
+
+    def filtrar(self, urls: Iterable[str]) -> list[str]:
+        """Triagem em lote (ex.: milhares de URLs da SERP); memoriza por hostname."""
+        cache: dict[str, bool] = {}
+        aprovadas = []
+        for url in urls:
+            host = extrair_host(url)
+            if host not in cache:
+                cache[host] = bool(host) and self.permite_host(host)
+            if cache[host]:
+                aprovadas.append(url)
+        return aprovadas
+
+
+@lru_cache(maxsize=None)
+def _compilar(entradas: tuple[str, ...]) -> WhitelistDominios:
+    return WhitelistDominios(entradas)
+
+
+def compilar_whitelist(entradas: Iterable[str]) -> WhitelistDominios:
+    """Whitelist compilada; listas iguais em crews diferentes compartilham a mesma instância."""
+    return _compilar(tuple(sorted(set(map(_normalizar_dominio, entradas)))))
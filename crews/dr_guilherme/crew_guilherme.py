@@ -1,11 +1,19 @@
-import os
+from itertools import chain
+from typing import Iterable
 from dotenv import load_dotenv
-from serpapi.google_search import GoogleSearch
 from crewai import Crew, Agent, Task
-from langchain_openai import ChatOpenAI
+from comum.roteamento import llm_para
+from comum.autoridades import iterar_autoridades, verificar_whitelist
+from comum.digest import montar_digest
+from comum.outline_cache import guardar_outline, preparar_outline
+from comum.saidas import ConversorSaida, Outline, Revisao, outline_em_html
+from comum.paginas import pesquisar_paginas_concorrentes
+from comum.whitelist import compilar_whitelist
+from comum.serp import PesquisaSerp, iterar_organicos, pesquisar_serp
 
 load_dotenv()
-llm = ChatOpenAI(temperature=0.4)
+CLIENTE = "dr_guilherme"
+NICHO = "medico"  # índice offline de autoridades (comum/dados_autoridades)
 
 # -------------------------------
 # Catálogo fixo de links internos (Dr. Guilherme Gadens)
@@ -32,7 +40,7 @@ LINKS_INTERNOS_GADENS = [
 # -------------------------------
 WHITELIST_EXTERNOS = [
     ".gov", ".gov.br", ".edu", ".edu.br",
-    "who.int", "cdc.gov", "cancer.org", "aad.org", "sbd.org.br", "inca.gov.br",
+    "who.int", "nhs.uk", "cdc.gov", "cancer.org", "aad.org", "sbd.org.br", "inca.gov.br",
     "nih.gov", "ncbi.nlm.nih.gov", "jamanetwork.com", "nejm.org",
     "oecd.org", "unesco.org", "iso.org",
     "developers.google.com", "support.google.com", "search.google.com",
@@ -40,22 +48,16 @@ WHITELIST_EXTERNOS = [
     "moz.com", "ahrefs.com", "semrush.com", "data.gov"
 ]
 
+_WHITELIST_COMPILADA = compilar_whitelist(WHITELIST_EXTERNOS)
+verificar_whitelist(NICHO, _WHITELIST_COMPILADA)
+
 def _usa_whitelist(url: str) -> bool:
-    url_l = (url or "").lower()
-    return any(dom in url_l for dom in WHITELIST_EXTERNOS)
-
-def buscar_concorrentes_serpapi_struct(palavra_chave: str) -> list[dict]:
-    search = GoogleSearch({
-        "q": palavra_chave,
-        "hl": "pt-br",
-        "gl": "br",
-        "num": 10,
-        "api_key": os.getenv("SERPAPI_API_KEY")
-    })
-    d = search.get_dict()
-    return d.get("organic_results", []) or []
-
-def selecionar_links_externos_autoritativos(resultados_serp: list[dict], max_links: int = 2) -> list[dict]:
+    return _WHITELIST_COMPILADA.permite(url)
+
+def buscar_concorrentes_serpapi_struct(palavra_chave: str) -> PesquisaSerp:
+    return pesquisar_serp(palavra_chave, cliente=CLIENTE)
+
+def selecionar_links_externos_autoritativos(resultados_serp: Iterable[dict], max_links: int = 2) -> list[dict]:
     candidatos, vistos = [], set()
     for r in resultados_serp:
         url = r.get("link") or r.get("url") or ""
@@ -66,24 +68,13 @@ def selecionar_links_externos_autoritativos(resultados_serp: list[dict], max_lin
             candidatos.append({
                 "titulo": titulo[:90] or "Fonte externa",
                 "url": url,
-                "anchor_sugerida": (titulo[:70].lower() or "fonte oficial")
+                "anchor_sugerida": r.get("anchor_sugerida") or (titulo[:70].lower() or "fonte oficial")
             })
             vistos.add(url)
         if len(candidatos) >= max_links:
             break
     return candidatos
 
-def buscar_concorrentes_serpapi_texto(palavra_chave: str) -> str:
-    """Versão textual só para inspiração (NÃO copiar)."""
-    results = buscar_concorrentes_serpapi_struct(palavra_chave)
-    output = []
-    for res in results:
-        titulo = res.get("title", "")
-        snippet = res.get("snippet", "")
-        link = res.get("link", "") or res.get("url", "")
-        output.append(f"Título: {titulo}\nTrecho: {snippet}\nURL: {link}\n")
-    return "\n".join(output)
-
 # -------------------------------
 # Função principal (Dr. Guilherme Gadens)
 # -------------------------------
@@ -103,79 +94,100 @@ def build_crew_guilherme(tema: str, palavra_chave: str):
     - Conclusão sem CTA; CTA na assinatura ao final.
     - Tom: médico, claro e acessível; foco em prevenção, diagnóstico precoce, dermatoscopia digital e Cirurgia de Mohs quando pertinente.
     """
-    llm_local = llm
 
-    # Monta referências e links automaticamente
-    dados_concorrencia_txt = buscar_concorrentes_serpapi_texto(palavra_chave)
-    serp_struct = buscar_concorrentes_serpapi_struct(palavra_chave)
+    # Digest da concorrência (SERP + páginas do topo baixadas em paralelo), montado 1x
+    # e fatiado por tarefa dentro de um orçamento de tokens
+    pesquisa = buscar_concorrentes_serpapi_struct(palavra_chave)
+    digest = montar_digest(
+        pesquisa.organicos,
+        pesquisar_paginas_concorrentes(palavra_chave, cliente=CLIENTE, organicos=pesquisa.organicos),
+        demandas=pesquisa.demandas,
+        palavra_chave=palavra_chave,
+        perguntas=pesquisa.perguntas,
+        knowledge_graph=pesquisa.knowledge_graph,
+    )
+    # Outline já aprovado para palavra-chave semelhante do cliente (cache semântico): reusado
+    # sem chamar o LLM se quase idêntico, ou como referência no prompt
+    outline_referencia, llm_outline = preparar_outline(
+        CLIENTE, tema, palavra_chave, digest.outline, llm_para("outline", CLIENTE)
+    )
     links_internos = LINKS_INTERNOS_GADENS[:]  # catálogo fixo
-    links_externos = selecionar_links_externos_autoritativos(serp_struct, max_links=2)
+    # Índice curado do nicho primeiro; SERP (com páginas extras sob demanda) só se faltar candidato
+    links_externos = selecionar_links_externos_autoritativos(
+        chain(
+            iterar_autoridades(NICHO, palavra_chave),
+            iterar_organicos(palavra_chave, cliente=CLIENTE, primeira_pagina=pesquisa.organicos),
+        ),
+        max_links=2
+    )
 
     # ==== Agentes ====
     agente_intro = Agent(
         role="Redator de Introdução",
         goal="Escrever introdução clara e confiável (2–3 parágrafos) no tom médico do Dr. Gadens, citando a palavra-chave 1x.",
         backstory="Dermatologia oncológica; evita sensacionalismo; linguagem acessível e precisa.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("intro", CLIENTE),
     )
 
     agente_outline = Agent(
         role="Arquiteto de Estrutura (H2/H3) com numeração",
         goal="Definir 5–7 H2 numerados; cobrir intenção de busca; incluir a palavra-chave em pelo menos um heading.",
         backstory="Especialista em outline SEO para conteúdos médicos; títulos específicos e orientados a decisão clínica do paciente.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_outline,
     )
 
     agente_desenvolvimento = Agent(
         role="Redator de Desenvolvimento",
         goal="Preencher cada seção com <p> curtos e listas úteis, variar semântica da keyword sem stuffing e sem inserir imagens.",
         backstory="Explicações objetivas, prevenção, sinais de alarme, quando procurar o especialista, e diferenças entre abordagens diagnósticas (ex.: dermatoscopia digital, biópsia, Cirurgia de Mohs).",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("desenvolvimento", CLIENTE),
     )
 
     agente_conclusao = Agent(
         role="Redator de Conclusão (sem CTA)",
         goal="Encerrar resumindo aprendizados e próximos passos práticos para o leitor/paciente, sem convite comercial.",
         backstory="Fechamentos naturais, objetivos e empáticos.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("conclusao", CLIENTE),
     )
 
     agente_unificador = Agent(
         role="Unificador de Conteúdo HTML",
         goal="Unir tudo em HTML único (apenas body), coerente, sem redundância, com numeração dos H2 e sem imagens.",
         backstory="Editor técnico focado em semântica, acessibilidade e limpeza de HTML.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("unificador", CLIENTE),
     )
 
     agente_linkagem = Agent(
         role="Planejador e Implementador de Linkagem",
         goal="Inserir links internos/externos de forma natural e distribuída, respeitando todas as regras.",
         backstory="Especialista em internal linking e EEAT em saúde.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("linkagem", CLIENTE),
     )
 
     agente_contato = Agent(
         role="Responsável por Contato e Assinatura",
         goal="Anexar assinatura institucional do Dr. Guilherme Gadens ao final do HTML (CTA/WhatsApp), sem alterar o conteúdo anterior.",
         backstory="Padronização e identidade médica.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("contato", CLIENTE),
     )
 
     agente_revisor = Agent(
         role="Revisor Sênior",
         goal="Listar melhorias objetivas (bullets) em clareza, gramática, tom médico, distribuição de links e regras SEO.",
         backstory="Revisor PT-BR para conteúdos médicos; elimina ambiguidades e redundâncias.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("revisor", CLIENTE),
     )
 
     agente_executor = Agent(
         role="Executor de Revisões",
         goal="Aplicar todas as melhorias preservando estrutura semântica e linkagem.",
         backstory="Editor/Dev de HTML limpo.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("executor", CLIENTE),
     )
 
     # ==== Tarefas ====
+    # Contexto explícito por tarefa: sem `context=` a crewai repassa a saída de TODAS
+    # as tarefas anteriores, e as etapas finais carregariam várias cópias do artigo.
     tarefa_intro = Task(
         description=f"""
 Escreva a INTRODUÇÃO (2–3 <p>) para '{tema}' usando a palavra-chave '{palavra_chave}' apenas 1 vez.
@@ -187,9 +199,10 @@ Regras:
 - Não usar headings na introdução; só <p>.
 - Se houver âncora compatível, inclua 1 link interno natural no 2º parágrafo (anchor descritiva).
 Concorrência (inspiração – NÃO copiar):
-{dados_concorrencia_txt}
+{digest.intro}
 """.strip(),
         expected_output="HTML com 2–3 <p> (sem imagens) e possivelmente 1 link interno natural.",
+        context=[],
         agent=agente_intro
     )
 
@@ -203,10 +216,14 @@ Crie a ESTRUTURA (apenas headings) para '{tema}':
 - Títulos específicos, claros e orientados a tomada de decisão do paciente.
 - Nunca usar <h1>. Não incluir conteúdo; só <h2>/<h3>.
 Baseie a cobertura na intenção de busca e em lacunas/oportunidades dos concorrentes:
-{dados_concorrencia_txt}
+{outline_referencia}
 """.strip(),
-        expected_output="Lista hierárquica com <h2> numerados e <h3> opcionais (sem conteúdo).",
-        agent=agente_outline
+        expected_output="Outline estruturado: seções (<h2>) na ordem, cada uma com <h3> opcionais (sem conteúdo).",
+        output_pydantic=Outline,
+        converter_cls=ConversorSaida,
+        context=[],
+        agent=agente_outline,
+        callback=outline_em_html(guardar_outline(CLIENTE, tema, palavra_chave)),
     )
 
     tarefa_desenvolvimento = Task(
@@ -221,9 +238,12 @@ Desenvolva o CORPO a partir dos H2/H3 definidos, mantendo a numeração dos H2:
 - Não inventar novos headings; usar apenas os fornecidos.
 - Quando fizer sentido, inclua links internos naturais no corpo (anchors descritivas).
 Concorrência (inspiração – NÃO copiar):
-{dados_concorrencia_txt}
+{digest.desenvolvimento}
+Perguntas reais dos leitores na busca (responda as pertinentes dentro das seções correspondentes):
+{digest.perguntas}
 """.strip(),
         expected_output="HTML com <h2> numerados, <h3> opcionais, <p> e <ul><li> (sem imagens).",
+        context=[tarefa_outline],
         agent=agente_desenvolvimento
     )
 
@@ -236,6 +256,7 @@ Escreva a CONCLUSÃO:
 - Não inserir imagens.
 """.strip(),
         expected_output="Conclusão em <p>, possivelmente com 1 link interno.",
+        context=[tarefa_desenvolvimento],
         agent=agente_conclusao
     )
 
@@ -250,6 +271,7 @@ Regras:
 Saída: somente o conteúdo do body.
 """.strip(),
         expected_output="HTML WordPress-ready (apenas conteúdo do body, sem imagens).",
+        context=[tarefa_intro, tarefa_desenvolvimento, tarefa_conclusao],
         agent=agente_unificador
     )
 
@@ -270,9 +292,6 @@ Insira LINKAGEM no HTML unificado (intro/corpo/conclusão).
 Links internos disponíveis (use pelo menos 3, distribuídos):
 {links_internos_txt}
 
-Links externos candidatos (use >=1, se listado; com target="_blank" rel="noopener noreferrer"):
-{links_externos_txt}
-
 Regras:
 - Distribuição sugerida: 1 link interno na intro, 1–2 no corpo, 1 na conclusão (se aplicável).
 - Âncoras naturais e descritivas; nunca usar "clique aqui".
@@ -280,8 +299,12 @@ Regras:
 - Não quebrar HTML semântico; sem inline style.
 - Não adicionar imagens.
 Saída: HTML com linkagem aplicada.
+
+Links externos candidatos (use >=1, se listado; com target="_blank" rel="noopener noreferrer"):
+{links_externos_txt}
 """.strip(),
         expected_output="HTML com links internos/externos aplicados (sem imagens).",
+        context=[tarefa_unificar],
         agent=agente_linkagem
     )
 
@@ -294,6 +317,7 @@ Anexar ao FINAL do HTML a assinatura institucional (sem alterar o conteúdo ante
 <p><strong>Dr. Guilherme Gadens</strong><br>Dermatologista — Cirurgia de Mohs e Dermatoscopia Digital em Curitiba</p>
 """.strip(),
         expected_output="HTML final com assinatura adicionada.",
+        context=[tarefa_linkagem],
         agent=agente_contato
     )
 
@@ -304,10 +328,12 @@ Revise o HTML final quanto a:
 - Estilo: H2 numerados, parágrafos curtos, listas quando úteis, distribuição de links.
 - Coerência e distribuição de links; âncoras descritivas; ausência de overstuffing de '{palavra_chave}'.
 - Respeito às proibições de imagens e de <h1>.
-Saída: lista de melhorias acionáveis em bullets JSON-like:
-- {{"campo":"trecho/resumo","problema":"...","acao":"..."}}
+Saída: achados de revisão – para cada melhoria acionável, o trecho (campo), o problema e a ação.
 """.strip(),
-        expected_output="Bullets com melhorias acionáveis.",
+        expected_output="Achados de revisão com problema e ação corretiva.",
+        output_pydantic=Revisao,
+        converter_cls=ConversorSaida,
+        context=[tarefa_contato],
         agent=agente_revisor
     )
 
@@ -320,6 +346,7 @@ Aplique TODAS as melhorias propostas, preservando:
 Saída: HTML final (somente conteúdo do body).
 """.strip(),
         expected_output="HTML final revisado (body only, sem imagens).",
+        context=[tarefa_contato, tarefa_revisar],
         agent=agente_executor
     )
 
@@ -1,11 +1,19 @@
-import os
+from itertools import chain
+from typing import Iterable
 from dotenv import load_dotenv
-from serpapi.google_search import GoogleSearch
 from crewai import Crew, Agent, Task
-from langchain_openai import ChatOpenAI
+from comum.roteamento import llm_para
+from comum.autoridades import iterar_autoridades, verificar_whitelist
+from comum.digest import montar_digest
+from comum.outline_cache import guardar_outline, preparar_outline
+from comum.saidas import ConversorSaida, Outline, Revisao, outline_em_html
+from comum.paginas import pesquisar_paginas_concorrentes
+from comum.whitelist import compilar_whitelist
+from comum.serp import PesquisaSerp, iterar_organicos, pesquisar_serp
 
 load_dotenv()
-llm = ChatOpenAI(temperature=0.4)
+CLIENTE = "dra_angelica"
+NICHO = "medico"  # índice offline de autoridades (comum/dados_autoridades)
 
 # -------------------------------
 # Catálogo fixo de links internos (Dra. Angélica Bauer)
@@ -59,22 +67,16 @@ WHITELIST_EXTERNOS_ANGELICA = [
     "schema.org", "w3.org", "developers.google.com", "support.google.com"
 ]
 
+_WHITELIST_COMPILADA = compilar_whitelist(WHITELIST_EXTERNOS_ANGELICA)
+verificar_whitelist(NICHO, _WHITELIST_COMPILADA)
+
 def _usa_whitelist_angelica(url: str) -> bool:
-    url_l = (url or "").lower()
-    return any(dom in url_l for dom in WHITELIST_EXTERNOS_ANGELICA)
-
-def buscar_concorrentes_serpapi_struct(palavra_chave: str) -> list[dict]:
-    search = GoogleSearch({
-        "q": palavra_chave,
-        "hl": "pt-br",
-        "gl": "br",
-        "num": 10,
-        "api_key": os.getenv("SERPAPI_API_KEY")
-    })
-    d = search.get_dict()
-    return d.get("organic_results", []) or []
-
-def selecionar_links_externos_autoritativos(resultados_serp: list[dict], max_links: int = 2) -> list[dict]:
+    return _WHITELIST_COMPILADA.permite(url)
+
+def buscar_concorrentes_serpapi_struct(palavra_chave: str) -> PesquisaSerp:
+    return pesquisar_serp(palavra_chave, cliente=CLIENTE)
+
+def selecionar_links_externos_autoritativos(resultados_serp: Iterable[dict], max_links: int = 2) -> list[dict]:
     candidatos, vistos = [], set()
     for r in resultados_serp:
         url = r.get("link") or r.get("url") or ""
@@ -85,24 +87,13 @@ def selecionar_links_externos_autoritativos(resultados_serp: list[dict], max_lin
             candidatos.append({
                 "titulo": titulo[:90] or "Fonte externa",
                 "url": url,
-                "anchor_sugerida": (titulo[:70].lower() or "fonte oficial")
+                "anchor_sugerida": r.get("anchor_sugerida") or (titulo[:70].lower() or "fonte oficial")
             })
             vistos.add(url)
         if len(candidatos) >= max_links:
             break
     return candidatos
 
-def buscar_concorrentes_serpapi_texto(palavra_chave: str) -> str:
-    """Versão textual só para inspiração (NÃO copiar)."""
-    results = buscar_concorrentes_serpapi_struct(palavra_chave)
-    output = []
-    for res in results:
-        titulo = res.get("title", "")
-        snippet = res.get("snippet", "")
-        link = res.get("link", "") or res.get("url", "")
-        output.append(f"Título: {titulo}\nTrecho: {snippet}\nURL: {link}\n")
-    return "\n".join(output)
-
 # -------------------------------
 # Função principal (Dra. Angélica Bauer)
 # -------------------------------
@@ -122,79 +113,100 @@ def build_crew_angelica(tema: str, palavra_chave: str):
     - Conclusão sem CTA comercial; CTA na assinatura ao final.
     - Foco exclusivo em dermatologia e tricologia, especialmente alopecia.
     """
-    llm_local = llm
 
-    # Monta referências e links automaticamente
-    dados_concorrencia_txt = buscar_concorrentes_serpapi_texto(palavra_chave)
-    serp_struct = buscar_concorrentes_serpapi_struct(palavra_chave)
+    # Digest da concorrência (SERP + páginas do topo baixadas em paralelo), montado 1x
+    # e fatiado por tarefa dentro de um orçamento de tokens
+    pesquisa = buscar_concorrentes_serpapi_struct(palavra_chave)
+    digest = montar_digest(
+        pesquisa.organicos,
+        pesquisar_paginas_concorrentes(palavra_chave, cliente=CLIENTE, organicos=pesquisa.organicos),
+        demandas=pesquisa.demandas,
+        palavra_chave=palavra_chave,
+        perguntas=pesquisa.perguntas,
+        knowledge_graph=pesquisa.knowledge_graph,
+    )
+    # Outline já aprovado para palavra-chave semelhante do cliente (cache semântico): reusado
+    # sem chamar o LLM se quase idêntico, ou como referência no prompt
+    outline_referencia, llm_outline = preparar_outline(
+        CLIENTE, tema, palavra_chave, digest.outline, llm_para("outline", CLIENTE)
+    )
     links_internos = LINKS_INTERNOS_ANGELICA[:]  # catálogo fixo
-    links_externos = selecionar_links_externos_autoritativos(serp_struct, max_links=2)
+    # Índice curado do nicho primeiro; SERP (com páginas extras sob demanda) só se faltar candidato
+    links_externos = selecionar_links_externos_autoritativos(
+        chain(
+            iterar_autoridades(NICHO, palavra_chave),
+            iterar_organicos(palavra_chave, cliente=CLIENTE, primeira_pagina=pesquisa.organicos),
+        ),
+        max_links=2
+    )
 
     # ==== Agentes ====
     agente_intro = Agent(
         role="Redator de Introdução Médica",
         goal="Escrever introdução clara, acolhedora e empática (2–3 parágrafos) no estilo médico educativo, citando a palavra‑chave 1x e focando em dermatologia/tricologia.",
         backstory="Copywriter especializado em comunicação médica; evita promessas exageradas; tom acolhedor mas científico; parágrafos curtos; sem imagens.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("intro", CLIENTE),
     )
 
     agente_outline = Agent(
         role="Arquiteto de Estrutura Médica (H2/H3) com numeração",
         goal="Definir 5–7 H2 numerados (1., 2., 3., ...), com H3 opcionais; cobrir aspectos dermatológicos/tricológicos e incluir a palavra‑chave em pelo menos um heading.",
         backstory="Especialista em estrutura de conteúdo médico; nunca usa H1; títulos específicos focados em saúde da pele e cabelos.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_outline,
     )
 
     agente_desenvolvimento = Agent(
         role="Redator de Desenvolvimento Médico",
         goal="Preencher cada seção com <p> curtos, informações técnicas precisas, listas úteis, variar semântica da keyword sem stuffing e sem inserir imagens.",
         backstory="Conteúdo médico educativo, científico mas acessível, com foco em dermatologia e tricologia, sem promessas exageradas.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("desenvolvimento", CLIENTE),
     )
 
     agente_conclusao = Agent(
         role="Redator de Conclusão Médica (sem CTA)",
         goal="Encerrar resumindo aprendizados médicos e orientações práticas sem convite comercial direto.",
         backstory="Fechamentos educativos focados em saúde e bem-estar do paciente.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("conclusao", CLIENTE),
     )
 
     agente_unificador = Agent(
         role="Unificador de Conteúdo HTML Médico",
         goal="Unir tudo em HTML único (apenas body), coerente, sem redundância, com numeração dos H2 e sem imagens, mantendo rigor científico.",
         backstory="Editor técnico focado em conteúdo médico, semântica e limpeza de HTML.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("unificador", CLIENTE),
     )
 
     agente_linkagem = Agent(
         role="Planejador e Implementador de Linkagem Médica",
         goal="Inserir links internos/externos de forma natural e distribuída, priorizando fontes médicas autoritativas e serviços dermatológicos.",
         backstory="Especialista em EEAT médico e linkagem para autoridade em dermatologia.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("linkagem", CLIENTE),
     )
 
     agente_contato = Agent(
         role="Responsável por Contato e Assinatura Médica",
         goal="Anexar assinatura institucional da Dra. Angélica ao final do HTML (CTA/WhatsApp), sem alterar o conteúdo anterior.",
         backstory="Padronização e identidade institucional médica.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("contato", CLIENTE),
     )
 
     agente_revisor = Agent(
         role="Revisor Sênior Médico",
         goal="Listar melhorias objetivas (bullets) em clareza, precisão médica, gramática, distribuição de links e adequação ao público leigo.",
         backstory="Revisor PT‑BR especializado em textos médicos; corta redundâncias; mantém rigor científico acessível.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("revisor", CLIENTE),
     )
 
     agente_executor = Agent(
         role="Executor de Revisões Médicas",
         goal="Aplicar todas as melhorias preservando estrutura semântica, linkagem e precisão médica.",
         backstory="Editor/Dev de HTML limpo especializado em conteúdo médico.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("executor", CLIENTE),
     )
 
     # ==== Tarefas ====
+    # Contexto explícito por tarefa: sem `context=` a crewai repassa a saída de TODAS
+    # as tarefas anteriores, e as etapas finais carregariam várias cópias do artigo.
     tarefa_intro = Task(
         description=f"""
 Escreva a INTRODUÇÃO (2–3 <p>) para '{tema}' usando a palavra‑chave '{palavra_chave}' apenas 1 vez.
@@ -208,9 +220,10 @@ Regras:
 - Se houver âncora compatível, inclua 1 link interno natural no 2º parágrafo (anchor descritiva).
 - Tom empático mas profissional, adequado para pacientes buscando informação médica.
 Concorrência (inspiração – NÃO copiar):
-{dados_concorrencia_txt}
+{digest.intro}
 """.strip(),
         expected_output="HTML com 2–3 <p> (sem imagens) e possivelmente 1 link interno natural.",
+        context=[],
         agent=agente_intro
     )
 
@@ -225,10 +238,14 @@ Crie a ESTRUTURA (apenas headings) para '{tema}' no estilo médico educativo:
 - Nunca usar <h1>. Não incluir conteúdo; só <h2>/<h3>.
 - Abordar causas, sintomas, tratamentos e prevenção quando aplicável.
 Baseie a cobertura na intenção de busca médica e em lacunas/oportunidades dos concorrentes:
-{dados_concorrencia_txt}
+{outline_referencia}
 """.strip(),
-        expected_output="Lista hierárquica com <h2> numerados e <h3> opcionais (sem conteúdo).",
-        agent=agente_outline
+        expected_output="Outline estruturado: seções (<h2>) na ordem, cada uma com <h3> opcionais (sem conteúdo).",
+        output_pydantic=Outline,
+        converter_cls=ConversorSaida,
+        context=[],
+        agent=agente_outline,
+        callback=outline_em_html(guardar_outline(CLIENTE, tema, palavra_chave)),
     )
 
     tarefa_desenvolvimento = Task(
@@ -245,9 +262,12 @@ Desenvolva o CORPO a partir dos H2/H3 definidos, mantendo a numeração dos H2:
 - Não inventar novos headings; usar apenas os fornecidos.
 - Quando fizer sentido, inclua links internos naturais no corpo (anchors descritivas).
 Concorrência (inspiração – NÃO copiar):
-{dados_concorrencia_txt}
+{digest.desenvolvimento}
+Perguntas reais dos leitores na busca (responda as pertinentes dentro das seções correspondentes):
+{digest.perguntas}
 """.strip(),
         expected_output="HTML com <h2> numerados, <h3> opcionais, <p> e <ul><li> (sem imagens).",
+        context=[tarefa_outline],
         agent=agente_desenvolvimento
     )
 
@@ -261,6 +281,7 @@ Escreva a CONCLUSÃO:
 - Não inserir imagens.
 """.strip(),
         expected_output="Conclusão em <p>, possivelmente com 1 link interno.",
+        context=[tarefa_desenvolvimento],
         agent=agente_conclusao
     )
 
@@ -276,6 +297,7 @@ Regras:
 Saída: somente o conteúdo do body.
 """.strip(),
         expected_output="HTML WordPress-ready (apenas conteúdo do body, sem imagens).",
+        context=[tarefa_intro, tarefa_desenvolvimento, tarefa_conclusao],
         agent=agente_unificador
     )
 
@@ -296,9 +318,6 @@ Insira LINKAGEM no HTML unificado (intro/corpo/conclusão) seguindo padrões mé
 Links internos disponíveis (use pelo menos 3, distribuídos):
 {links_internos_txt}
 
-Links externos candidatos (use >=1, se listado; com target="_blank" rel="noopener noreferrer"):
-{links_externos_txt}
-
 Regras:
 - Distribuição sugerida: 1 link interno na intro, 1–2 no corpo, 1 na conclusão (se aplicável).
 - Priorizar links para serviços relacionados ao tema (tricologia, tratamentos dermatológicos, etc.).
@@ -308,8 +327,12 @@ Regras:
 - Não quebrar HTML semântico; sem inline style.
 - Não adicionar imagens.
 Saída: HTML com linkagem aplicada.
+
+Links externos candidatos (use >=1, se listado; com target="_blank" rel="noopener noreferrer"):
+{links_externos_txt}
 """.strip(),
         expected_output="HTML com links internos/externos aplicados (sem imagens).",
+        context=[tarefa_unificar],
         agent=agente_linkagem
     )
 
@@ -321,6 +344,7 @@ Anexar ao FINAL do HTML a assinatura institucional (sem alterar o conteúdo ante
 <p><strong>Dra Angélica Bauer</strong><br>Dermatologista em Porto Alegre</p>
 """.strip(),
         expected_output="HTML final com assinatura adicionada.",
+        context=[tarefa_linkagem],
         agent=agente_contato
     )
 
@@ -332,10 +356,12 @@ Revise o HTML final quanto a:
 - Coerência científica e distribuição de links; âncoras descritivas; ausência de overstuffing de '{palavra_chave}'.
 - Adequação ao público leigo interessado em saúde dermatológica/capilar.
 - Respeito às proibições de imagens e de <h1>.
-Saída: lista de melhorias acionáveis em bullets JSON‑like:
-- {{"campo":"trecho/resumo","problema":"...","acao":"..."}}
+Saída: achados de revisão – para cada melhoria acionável, o trecho (campo), o problema e a ação.
 """.strip(),
-        expected_output="Bullets com melhorias acionáveis.",
+        expected_output="Achados de revisão com problema e ação corretiva.",
+        output_pydantic=Revisao,
+        converter_cls=ConversorSaida,
+        context=[tarefa_contato],
         agent=agente_revisor
     )
 
@@ -349,6 +375,7 @@ Aplique TODAS as melhorias propostas, preservando:
 Saída: HTML final (somente conteúdo do body).
 """.strip(),
         expected_output="HTML final revisado (body only, sem imagens).",
+        context=[tarefa_contato, tarefa_revisar],
         agent=agente_executor
     )
 
@@ -1,24 +1,16 @@
-import os
 from dotenv import load_dotenv
-from serpapi.google_search import GoogleSearch
 from crewai import Crew, Agent, Task
-from langchain_openai import ChatOpenAI
+from comum.llm import obter_llm
+from comum.serp import buscar_organicos
 
 
 load_dotenv()
-llm = ChatOpenAI(temperature=0.4)
+llm = obter_llm(temperatura=0.4)
+CLIENTE = "dra_erika"
 
 def buscar_concorrentes_serpapi(palavra_chave):
-    search = GoogleSearch({
-        "q": palavra_chave,
-        "hl": "pt-br",
-        "gl": "br",
-        "num": 5,
-        "api_key": os.getenv("SERPAPI_API_KEY")
-    })
-    results = search.get_dict()
     output = []
-    for res in results.get("organic_results", []):
+    for res in buscar_organicos(palavra_chave, cliente=CLIENTE, num=5):
         titulo = res.get("title", "")
         snippet = res.get("snippet", "")
         link = res.get("link", "")
@@ -1,24 +1,15 @@
-import os
 from dotenv import load_dotenv
-from serpapi.google_search import GoogleSearch
 from crewai import Crew, Agent, Task
-from langchain_openai import ChatOpenAI
+from comum.roteamento import llm_para
+from comum.serp import buscar_organicos
 
 
 load_dotenv()
-llm = ChatOpenAI(temperature=0.4)
+CLIENTE = "teste"
 
 def buscar_concorrentes_serpapi(palavra_chave):
-    search = GoogleSearch({
-        "q": palavra_chave,
-        "hl": "pt-br",
-        "gl": "br",
-        "num": 5,
-        "api_key": os.getenv("SERPAPI_API_KEY")
-    })
-    results = search.get_dict()
     output = []
-    for res in results.get("organic_results", []):
+    for res in buscar_organicos(palavra_chave, cliente=CLIENTE, num=5):
         titulo = res.get("title", "")
         snippet = res.get("snippet", "")
         link = res.get("link", "")
@@ -37,70 +28,69 @@ def build_crew_invictus_conteudo(tema: str, palavra_chave: str, links_internos:
     links_externos: [{"titulo": "...", "url": "...", "anchor_sugerida": "..."}]
     """
     dados_concorrencia = buscar_concorrentes_serpapi(palavra_chave)
-    llm_local = llm
 
     # ==== Agentes ====
     agente_intro = Agent(
         role="Redator de Introdução",
         goal="Escrever introdução clara e persuasiva com 2–3 parágrafos, contextualizando o tema e citando a palavra‑chave 1x.",
         backstory="Copywriter sênior B2B; evita clichês, promete só o que entrega; parágrafos curtos.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("intro", CLIENTE),
     )
 
     agente_outline = Agent(
         role="Arquiteto de Estrutura (H2/H3)",
         goal="Definir 5–7 H2 e H3 opcionais, cobrindo integralmente a intenção de busca.",
         backstory="Especialista em outline orientado a SEO e escaneabilidade.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("outline", CLIENTE),
     )
 
     agente_desenvolvimento = Agent(
         role="Redator de Desenvolvimento",
         goal="Desenvolver cada H2/H3 com <p> curtos e <ul><li> práticos, variando semântica da keyword sem overstuffing.",
         backstory="Criador de conteúdo útil, direto e aplicável.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("desenvolvimento", CLIENTE),
     )
 
     agente_conclusao = Agent(
         role="Redator de Conclusão (sem CTA)",
         goal="Encerrar resumindo aprendizados e próximos passos práticos, sem convite comercial.",
         backstory="Especialista em fechamentos naturais.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("conclusao", CLIENTE),
     )
 
     agente_unificador = Agent(
         role="Unificador de Conteúdo HTML",
         goal="Unir as partes em um único HTML (apenas body), coerente e sem redundância.",
         backstory="Editor técnico com foco em semântica e limpeza de HTML.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("unificador", CLIENTE),
     )
 
     agente_linkagem = Agent(
         role="Planejador e Implementador de Linkagem",
         goal="Inserir links internos/externos de forma natural e distribuída.",
         backstory="Especialista em internal linking e EEAT.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("linkagem", CLIENTE),
     )
 
     agente_contato = Agent(
         role="Responsável por Contato e Assinatura",
         goal="Anexar assinatura institucional da Invictus ao final do HTML.",
         backstory="Garante padronização e identidade institucional.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("contato", CLIENTE),
     )
 
     agente_revisor = Agent(
         role="Revisor Sênior",
         goal="Apontar melhorias objetivas (itens acionáveis) em clareza, gramática e tom.",
         backstory="Revisor PT‑BR; corta gordura, mantém utilidade.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("revisor", CLIENTE),
     )
 
     agente_executor = Agent(
         role="Executor de Revisões",
         goal="Aplicar integralmente as melhorias mantendo a estrutura semântica e links.",
         backstory="Editor/Dev de HTML limpo.",
-        verbose=True, allow_delegation=False, llm=llm_local,
+        verbose=True, allow_delegation=False, llm=llm_para("executor", CLIENTE),
     )
 
     # ==== Tarefas ====
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, Query
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from crews.invictus.crew_invictus import build_crew_invictus
 from crews.dra_francine.crew_francine import build_crew_francine
 from crews.dra_tati.crew_tati import build_crew_tatiana
@@ -12,97 +13,168 @@ from crews.villa_puppy.crew_villa_puppy import build_crew_villapuppy
 from crews.dra_angelica.crew_angelica import build_crew_angelica
 from crews.dra_emmen.crew_emmen import build_crew_emmen
 from crews.dra_catarine.crew_catarine import build_crew_catarine
+from comum.contexto import definir_execucao
+from comum.serp_uso import relatorio as relatorio_uso_serp
+from comum import backlog
+from comum.llm import fechar_cliente as fechar_cliente_llm
+from comum.concorrencia import controle as controle_concorrencia
+from comum.custos import medir, relatorio as relatorio_custos
+from comum.hedge import hedger
+from comum.limites import limitador
+from comum.llm_cache import estatisticas as estatisticas_cache_llm
+from comum.llm_uso import execucoes as execucoes_llm, relatorio as relatorio_uso_llm
+from comum.lote import coletor as coletor_lote, fila_lote
+from comum.orcamento_tokens import OrcamentoTokensExcedido
+from comum.outline_cache import indice_outlines
+from comum.prefetch import PREFETCH_ATIVO, prefetcher
+from comum.streaming import executar_em_stream
 
+# Cliente -> construtor da crew (modo lote; os endpoints chamam cada um diretamente)
+CONSTRUTORES = {
+    "invictus": build_crew_invictus,
+    "dra_francine": build_crew_francine,
+    "dra_tati": build_crew_tatiana,
+    "dr_gustavo": build_crew_gustavo,
+    "dr_guilherme": build_crew_guilherme,
+    "dra_karen": build_crew_karen,
+    "nucleo_rural": build_crew_nucleorural,
+    "dr_gerson": build_crew_gerson,
+    "villa_puppy": build_crew_villapuppy,
+    "dra_angelica": build_crew_angelica,
+    "dra_emmen": build_crew_emmen,
+    "dra_catarine": build_crew_catarine,
+}
 
 
+async def registrar_execucao(request: Request):
+    # Rota/cliente da requisição ficam no contexto (contabilidade SerpAPI, orçamentos etc.)
+    definir_execucao(request.url.path)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PREFETCH_ATIVO:
+        prefetcher.iniciar()
+    fila_lote.registrar_construtores(CONSTRUTORES)
+    fila_lote.retomar()
+    yield
+    prefetcher.parar()
+    fila_lote.parar()
+    fechar_cliente_llm()
+
+
+app = FastAPI(dependencies=[Depends(registrar_execucao)], lifespan=lifespan)
+
+
+def responder_em_stream(build_crew, tema: str, palavra_chave: str) -> StreamingResponse:
+    # ?stream=true: progresso das etapas + HTML da etapa final token a token (SSE)
+    return StreamingResponse(
+        executar_em_stream(build_crew, tema, palavra_chave),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def executar_crew(build_crew, tema: str, palavra_chave: str) -> JSONResponse:
+    # Pesquisa + kickoff medidos no livro de custos (comum.custos), inclusive quando falham
+    with medir(tema, palavra_chave) as medicao:
+        medicao.montada(crew := build_crew(tema, palavra_chave))
+        medicao.resultado = crew.kickoff()
+    return JSONResponse(content=medicao.resultado.model_dump())
+
+
+@app.exception_handler(OrcamentoTokensExcedido)
+async def orcamento_tokens_excedido(request: Request, exc: OrcamentoTokensExcedido):
+    return JSONResponse(
+        status_code=413,
+        content={"erro": str(exc), "tarefa": exc.tarefa, "tokens": exc.tokens, "limite": exc.limite},
+    )
 
 @app.get("/invictus")
 @app.get("/invictus_backlink")
-def executar_crew_invictus(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_invictus(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_invictus(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_invictus, tema, palavra_chave)
+    return executar_crew(build_crew_invictus, tema, palavra_chave)
 
 @app.get("/dra_francine")
 @app.get("/dra_francine_backlink")
-def executar_crew_francine(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_francine(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_francine(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_francine, tema, palavra_chave)
+    return executar_crew(build_crew_francine, tema, palavra_chave)
 
 @app.get("/dra_tati")
 @app.get("/dra_tati_backlink")
-def executar_crew_tatiana(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_tatiana(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_tatiana(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_tatiana, tema, palavra_chave)
+    return executar_crew(build_crew_tatiana, tema, palavra_chave)
 
 @app.get("/dr_gustavo")
 @app.get("/dr_gustavo_backlink")
-def executar_crew_gustavo(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_gustavo(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_gustavo(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_gustavo, tema, palavra_chave)
+    return executar_crew(build_crew_gustavo, tema, palavra_chave)
 
 @app.get("/dr_guilherme")
 @app.get("/dr_guilherme_backlink")
-def executar_crew_guilherme(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_guilherme(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_guilherme(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_guilherme, tema, palavra_chave)
+    return executar_crew(build_crew_guilherme, tema, palavra_chave)
 
 @app.get("/dra_karen")
 @app.get("/dra_karen_backlink")
-def executar_crew_karen(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_karen(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_karen(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_karen, tema, palavra_chave)
+    return executar_crew(build_crew_karen, tema, palavra_chave)
 
 @app.get("/nucleo_rural")
 @app.get("/nucleo_rural_backlink")
-def executar_crew_nucleorural(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_nucleorural(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_nucleorural(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_nucleorural, tema, palavra_chave)
+    return executar_crew(build_crew_nucleorural, tema, palavra_chave)
 
 @app.get("/dr_gerson")
 @app.get("/dr_gerson_backlink")
-def executar_crew_gerson(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_gerson(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_gerson(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_gerson, tema, palavra_chave)
+    return executar_crew(build_crew_gerson, tema, palavra_chave)
 
 @app.get("/villa_puppy")
 @app.get("/villa_puppy_backlink")
-def executar_crew_villapuppy(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_villapuppy(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_villapuppy(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_villapuppy, tema, palavra_chave)
+    return executar_crew(build_crew_villapuppy, tema, palavra_chave)
 
 
 @app.get("/dra_angelica")
 @app.get("/dra_angelica_backlink")
-def executar_crew_angelica(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_angelica(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_angelica(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_angelica, tema, palavra_chave)
+    return executar_crew(build_crew_angelica, tema, palavra_chave)
 
 @app.get("/dra_emmen")
 @app.get("/dra_emmen_backlink")
-def executar_crew_emmen(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_emmen(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_emmen(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_emmen, tema, palavra_chave)
+    return executar_crew(build_crew_emmen, tema, palavra_chave)
 
 
 @app.get("/dra_catarine")
 @app.get("/dra_catarine_backlink")
-def executar_crew_catarine(tema: str = Query(...), palavra_chave: str = Query(...)):
-    crew = build_crew_catarine(tema, palavra_chave)
-    resultado = crew.kickoff()
-    return JSONResponse(content=resultado.model_dump())
+def executar_crew_catarine(tema: str = Query(...), palavra_chave: str = Query(...), stream: bool = Query(False)):
+    if stream:
+        return responder_em_stream(build_crew_catarine, tema, palavra_chave)
+    return executar_crew(build_crew_catarine, tema, palavra_chave)
 
 
 @app.get("/teste")
@@ -110,6 +182,93 @@ def teste():
     return {"mensagem": "Teste OK"}
 
 
+@app.get("/serpapi/uso")
+def serpapi_uso(dias: int = Query(30, ge=1, le=366)):
+    return JSONResponse(content=relatorio_uso_serp(dias))
+
+
+@app.get("/llm/uso")
+def llm_uso(dias: int = Query(30, ge=1, le=366), cliente: str | None = None):
+    return JSONResponse(content=relatorio_uso_llm(dias, cliente))
+
+
+@app.get("/llm/execucoes")
+def llm_execucoes(dias: int = Query(1, ge=1, le=366), cliente: str | None = None,
+                  limite: int = Query(50, ge=1, le=1000)):
+    return JSONResponse(content={"execucoes": execucoes_llm(dias, cliente, limite)})
+
+
+@app.get("/custos")
+def custos(dias: int = Query(30, ge=1, le=366), cliente: str | None = None, rota: str | None = None):
+    return JSONResponse(content=relatorio_custos(dias, cliente, rota))
+
+
+@app.get("/llm/hedge")
+def llm_hedge_stats():
+    return JSONResponse(content=hedger.estatisticas())
+
+
+@app.get("/llm/concorrencia")
+def llm_concorrencia_stats():
+    return JSONResponse(content=controle_concorrencia.estatisticas())
+
+
+@app.get("/llm/limites")
+def llm_limites_stats():
+    return JSONResponse(content=limitador.estatisticas())
+
+
+@app.get("/llm/cache")
+def llm_cache_stats():
+    return JSONResponse(content=estatisticas_cache_llm())
+
+
+@app.get("/outline/cache")
+def outline_cache_stats():
+    return JSONResponse(content=indice_outlines.estatisticas())
+
+
+@app.post("/lote/{cliente}")
+def enfileirar_lote(cliente: str, itens: list[dict] = Body(...), backlink: bool = Query(True)):
+    """
+    Geração em massa pela Batch API (sem resposta imediata; acompanhar em /lote).
+    itens: [{"tema": "...", "palavra_chave": "..."}]
+    """
+    if cliente not in CONSTRUTORES:
+        raise HTTPException(status_code=404, detail=f"Cliente desconhecido: {cliente}")
+    return JSONResponse(content={"trabalhos": fila_lote.enfileirar(cliente, itens, backlink)})
+
+
+@app.get("/lote")
+def listar_lote(cliente: str | None = None, estado: str | None = None):
+    return JSONResponse(content={"trabalhos": fila_lote.listar(cliente, estado), "coletor": coletor_lote.estatisticas()})
+
+
+@app.get("/lote/trabalho/{id_trabalho}")
+def obter_trabalho_lote(id_trabalho: str):
+    trabalho = fila_lote.obter(id_trabalho)
+    if trabalho is None:
+        raise HTTPException(status_code=404, detail="Trabalho não encontrado")
+    return JSONResponse(content=trabalho)
+
+
+@app.get("/backlog")
+@app.get("/backlog/{cliente}")
+def listar_backlog(cliente: str | None = None):
+    return JSONResponse(content={"backlog": backlog.listar(cliente), "prefetch": prefetcher.stats})
+
+
+@app.post("/backlog/{cliente}")
+def adicionar_backlog(cliente: str, itens: list[dict] = Body(...)):
+    """itens: [{"palavra_chave": "...", "tema": "...", "data_prevista": "AAAA-MM-DD"}]"""
+    return JSONResponse(content={"backlog": backlog.adicionar(cliente, itens)})
+
+
+@app.delete("/backlog/{cliente}")
+def remover_backlog(cliente: str, palavra_chave: str = Query(...)):
+    return {"removido": backlog.remover(cliente, palavra_chave)}
+
+
 @app.get("/health")
 def health():
     return {"ok": True}